@@ -0,0 +1,269 @@
+"""
+Benchmarks of import time, fitting, prediction, serialization and the HTTP endpoints on synthetic data.
+
+Run from the repository root:
+
+    python -m benchmarks.run run --output baseline.json
+    python -m benchmarks.run run --output current.json
+    python -m benchmarks.run compare baseline.json current.json --threshold 0.1
+
+`compare` exits with a non-zero code if any metric regressed by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from statistics import median
+from typing import Any, Callable
+
+import numpy as np
+import numpy.typing as npt
+
+from ensembles import GradientBoostingMSE, RandomForestMSE
+
+
+STARTUP_MODULES = (
+    "ensembles",
+    "ensembles.backend.app",
+    "ensembles.frontend.client",
+    "ensembles.random_forest",
+    "ensembles.boosting",
+)
+
+MODELS = {
+    "random_forest": lambda args: RandomForestMSE(
+        args.estimators, {"max_depth": args.depth, "max_features": "sqrt"}, n_jobs=args.jobs
+    ),
+    "boosting": lambda args: GradientBoostingMSE(args.estimators, {"max_depth": min(args.depth, 6)}),
+    "boosting_histogram": lambda args: GradientBoostingMSE(
+        args.estimators, {"max_depth": min(args.depth, 6)}, histogram=True
+    ),
+    "boosting_stochastic": lambda args: GradientBoostingMSE(
+        args.estimators, {"max_depth": min(args.depth, 6)}, subsample=0.5, colsample_bytree=0.5
+    ),
+}
+
+
+def make_data(
+    n_rows: int, n_features: int, seed: int = 0
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Generate a nonlinear regression problem with noise.
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features))
+    y = 2 * X[:, 0] + np.sin(3 * X[:, 1 % n_features]) + X[:, 2 % n_features] * X[:, 3 % n_features]
+    return X, y + 0.3 * rng.normal(size=n_rows)
+
+
+def measure(function: Callable[[], Any], repeat: int) -> float:
+    """
+    Median wall time of `repeat` calls of `function` in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return median(times)
+
+
+class Results:
+    def __init__(self) -> None:
+        self.metrics: dict[str, dict[str, Any]] = {}
+
+    def add(self, name: str, value: float, unit: str, higher_is_better: bool = False) -> None:
+        self.metrics[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"{name:<60} {value:>14.6g} {unit}", flush=True)
+
+
+def bench_models(args: argparse.Namespace, results: Results) -> None:
+    X, y = make_data(args.rows, args.features)
+    X_test, _ = make_data(max(args.batch_sizes), args.features, seed=1)
+
+    for name, make_model in MODELS.items():
+        model = make_model(args)
+        start = time.perf_counter()
+        model.fit(X, y)
+        results.add(f"fit/{name}/per_estimator", (time.perf_counter() - start) / args.estimators, "s")
+
+        compiled = model.compile()
+        for n_trees in args.tree_counts:
+            if n_trees > model.fitted_estimators:
+                continue
+            for batch_size in args.batch_sizes:
+                batch = X_test[:batch_size]
+                seconds = measure(lambda: model.predict(batch, n_trees=n_trees), args.repeat)
+                results.add(f"predict/{name}/trees={n_trees}/batch={batch_size}", batch_size / seconds, "rows/s", True)
+                seconds = measure(lambda: compiled.predict(batch, n_trees=n_trees), args.repeat)
+                results.add(
+                    f"predict_compiled/{name}/trees={n_trees}/batch={batch_size}", batch_size / seconds, "rows/s", True
+                )
+        for batch_size in args.batch_sizes:
+            batch = X_test[:batch_size]
+            seconds = measure(lambda: model.staged_predict(batch), args.repeat)
+            results.add(f"staged_predict/{name}/batch={batch_size}", batch_size / seconds, "rows/s", True)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "model.ens"
+            results.add(f"dump/{name}", measure(lambda: model.dump(path), args.repeat), "s")
+            for mmap in (False, True):
+                seconds = measure(lambda: type(model).load(path, mmap=mmap), args.repeat)
+                results.add(f"load/{name}/mmap={mmap}", seconds, "s")
+
+
+def bench_startup(args: argparse.Namespace, results: Results) -> None:
+    """
+    Import time of the package entry points, each in a fresh interpreter.
+
+    Model modules are imported lazily by the backend, so their time is paid by the first request that loads a model
+    (or by the gunicorn master with PRELOAD_MODELS).
+    """
+    for module in STARTUP_MODULES:
+        code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        times = [
+            float(subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout)
+            for _ in range(args.repeat)
+        ]
+        results.add(f"startup/import/{module}", median(times), "s")
+
+
+def bench_http(args: argparse.Namespace, results: Results) -> None:
+    import pandas as pd
+    from fastapi.testclient import TestClient
+
+    X, y = make_data(args.rows, args.features)
+    train = pd.DataFrame(X, columns=[f"f{i}" for i in range(args.features)]).assign(target=y)
+    train_csv = train.to_csv(index=False).encode()
+
+    cwd = Path.cwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            from ensembles.backend.app import app
+
+            with TestClient(app) as client:
+                for ml_model in ("Random Forest", "Gradient Boosting"):
+                    name = ml_model.lower().replace(" ", "_")
+                    config = {
+                        "name": name, "ml_model": ml_model, "n_estimators": args.estimators,
+                        "max_depth": args.depth, "max_features": "all", "target_column": "target",
+                    }
+                    start = time.perf_counter()
+                    client.post(
+                        "/register_experiment/",
+                        data={"experiment_config": json.dumps(config)},
+                        files={"train_file": ("train.csv", train_csv)},
+                    ).raise_for_status()
+                    results.add(f"http/register/{name}", time.perf_counter() - start, "s")
+
+                    start = time.perf_counter()
+                    job = client.put("/train_model/", params={"experiment_name": name}).json()
+                    while job["status"] in ("queued", "running"):
+                        time.sleep(0.05)
+                        job = client.get(f"/jobs/{job['job_id']}").json()
+                    if job["status"] != "completed":
+                        raise RuntimeError(f"Training {name} {job['status']}: {job['error']}")
+                    results.add(f"http/train/{name}", time.perf_counter() - start, "s")
+
+                    for batch_size in args.batch_sizes:
+                        test_csv = train.drop(columns="target")[:batch_size].to_csv(index=False).encode()
+                        for accept in ("application/json", "application/octet-stream"):
+                            def predict() -> None:
+                                client.request(
+                                    "GET", "/predict/",
+                                    params={"experiment_name": name},
+                                    files={"test_file": ("test.csv", test_csv)},
+                                    headers={"Accept": accept},
+                                ).raise_for_status()
+
+                            seconds = measure(predict, args.repeat)
+                            results.add(f"http/predict/{name}/batch={batch_size}/{accept}", seconds, "s")
+        finally:
+            os.chdir(cwd)
+
+
+def run(args: argparse.Namespace) -> None:
+    results = Results()
+    if not args.skip_startup:
+        bench_startup(args, results)
+    bench_models(args, results)
+    if not args.skip_http:
+        bench_http(args, results)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "rows": args.rows,
+            "features": args.features,
+            "estimators": args.estimators,
+            "depth": args.depth,
+            "repeat": args.repeat,
+        },
+        "metrics": results.metrics,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=4))
+
+
+def compare(args: argparse.Namespace) -> int:
+    baseline = json.loads(Path(args.baseline).read_text())["metrics"]
+    current = json.loads(Path(args.current).read_text())["metrics"]
+
+    regressions = 0
+    for name, metric in current.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["value"], metric["value"]
+        # Positive change is always an improvement, whatever the unit.
+        if metric["higher_is_better"]:
+            change = (after - before) / before
+        else:
+            change = (before - after) / before
+        regressed = change < -args.threshold
+        regressions += regressed
+        flag = "REGRESSION" if regressed else ""
+        print(f"{name:<60} {before:>12.6g} -> {after:>12.6g} {metric['unit']:<7} {change:+8.1%} {flag}")
+
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", default="benchmark.json", help="JSON file for the results")
+    run_parser.add_argument("--rows", type=int, default=20_000)
+    run_parser.add_argument("--features", type=int, default=20)
+    run_parser.add_argument("--estimators", type=int, default=50)
+    run_parser.add_argument("--depth", type=int, default=10)
+    run_parser.add_argument("--jobs", type=int, default=None, help="n_jobs of the random forest")
+    run_parser.add_argument("--tree-counts", type=int, nargs="+", default=[10, 50])
+    run_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 10_000])
+    run_parser.add_argument("--repeat", type=int, default=5, help="repetitions of every timing, median is kept")
+    run_parser.add_argument("--skip-http", action="store_true", help="skip the FastAPI endpoints")
+    run_parser.add_argument("--skip-startup", action="store_true", help="skip the import times")
+
+    compare_parser = subparsers.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="tolerated relative slowdown")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
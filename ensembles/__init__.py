@@ -1,2 +1,32 @@
-from .random_forest import RandomForestMSE
-from .boosting import GradientBoostingMSE
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .random_forest import RandomForestMSE
+    from .boosting import GradientBoostingMSE
+    from .compiled import CompiledEnsemble
+    from .histogram import BinMapper, HistogramTree
+
+# Models pull in scikit-learn and joblib, so they are imported on first use,
+# and importing the package (e.g. for the backend schemas) stays cheap.
+_LAZY = {
+    "RandomForestMSE": ".random_forest",
+    "GradientBoostingMSE": ".boosting",
+    "CompiledEnsemble": ".compiled",
+    "BinMapper": ".histogram",
+    "HistogramTree": ".histogram",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name: str):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY))
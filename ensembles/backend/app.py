@@ -1,42 +1,196 @@
+import gc
+import itertools
 import json
 import os
+import shutil
+import uuid
 
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
-from fastapi import FastAPI, UploadFile, File, Form, Query
+import numpy as np
+from fastapi import FastAPI, Header, HTTPException, Request, Response, UploadFile, File, Form, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 from .schemas import (
     ExperimentConfig,
     ExistingExperimentsResponse,
+    ExperimentListResponse,
+    ExperimentRecord,
     MessageResponse,
     BoolResponse,
     ConvergenceHistoryResponse,
-    PredictResponse
+    PredictResponse,
+    ModelCacheStatsResponse,
+    TrainingJobResponse,
+    BatchingStatsResponse,
+    CompactionResponse,
+    SweepConfig,
+    SweepResponse
 )
+from .batching import MicroBatcher
+from .caching import conditional_response, file_etag
+from .datasets import convert_csv, split_dataset
+from .formats import (
+    MEDIA_TYPES,
+    NPY,
+    OCTET_STREAM,
+    check_n_features,
+    encode_predictions,
+    count_csv_rows,
+    negotiate_media_type,
+    predict_csv_chunks,
+    read_csv
+)
+from .history import MIN_POINTS, downsample, history_file, read_curves, to_history
+from .index import ORDERS, STATUSES, ExperimentIndex
+from .instrumentation import InstrumentationMiddleware, render_metrics, span
+from .jobs import JobManager
+from .registry import ModelRegistry
+from .storage import publish, write_text_atomic
+from .sweeps import SweepManager, expand_trials
+from .training import MODELS, compact_experiment, get_model_type
+
+from ensembles.serialization import convert_legacy_model
+
+from tempfile import NamedTemporaryFile
+
+if TYPE_CHECKING:
+    from ensembles import RandomForestMSE, GradientBoostingMSE
+
+max_cache_bytes = os.environ.get("MODEL_CACHE_BYTES")
+model_registry = ModelRegistry(
+    max_models=int(os.environ.get("MODEL_CACHE_SIZE", 16)),
+    max_bytes=int(max_cache_bytes) if max_cache_bytes is not None else None
+)
+micro_batcher = MicroBatcher(
+    window=float(os.environ.get("MICRO_BATCH_WINDOW_MS", 5)) / 1000,
+    max_rows=int(os.environ.get("MICRO_BATCH_MAX_ROWS", 4096))
+)
+experiment_index = ExperimentIndex(Path.cwd() / "runs")
+job_manager = JobManager(
+    Path.cwd() / "jobs",
+    max_workers=int(os.environ.get("TRAINING_WORKERS", 1))
+)
+sweep_workers = os.environ.get("SWEEP_WORKERS")
+sweep_manager = SweepManager(
+    Path.cwd() / "sweeps",
+    max_workers=int(sweep_workers) if sweep_workers is not None else None
+)
+
 
-from ensembles import RandomForestMSE, GradientBoostingMSE
-from ensembles.utils import ConvergenceHistory
-import pandas as pd
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    job_manager.shutdown()
+    sweep_manager.shutdown()
 
-from sklearn.model_selection import train_test_split
 
-from io import StringIO
+app = FastAPI(lifespan=lifespan)
+# Requests sent with an `X-Profile` header are profiled when PROFILE_REQUESTS is set.
+app.add_middleware(
+    InstrumentationMiddleware,
+    profiles_dir=Path.cwd() / "profiles" if os.environ.get("PROFILE_REQUESTS") else None
+)
+
 
-app = FastAPI()
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+PREDICT_CHUNK_ROWS = 100_000
+MICRO_BATCH_MAX_BYTES = int(os.environ.get("MICRO_BATCH_MAX_BYTES", 64 * 1024))
 
 
 def get_runs_dir() -> Path:
     return Path.cwd() / "runs"
 
 
-@app.get("/existing_experiments/")
-async def existing_experiments() -> ExistingExperimentsResponse:
+def get_model_path(experiment_name: str) -> Path:
+    """
+    Get the path of the experiment's model file.
+
+    Models saved by earlier versions as a `model/` directory are converted to the single-file format on first use.
+    """
+    model_path = get_runs_dir() / experiment_name / "model.ens"
+    legacy_path = model_path.with_name("model")
+    if not model_path.exists() and legacy_path.is_dir():
+        with publish(model_path) as tmp_path:
+            convert_legacy_model(legacy_path, tmp_path)
+    return model_path
+
+
+def load_model(experiment_name: str) -> "RandomForestMSE | GradientBoostingMSE":
+    """
+    Get the experiment's trained model from the in-process cache, loading it from disk on a miss.
+
+    Node arrays are memory-mapped read-only from `runs/`, so backend workers share one copy of every model in the
+    page cache. Model files are only ever replaced by rename, and the cache reloads a model whose file changed.
+
+    Raises:
+        HTTPException: 404 if there is no such experiment, 409 if its model is not trained yet.
+    """
+    record = get_experiment(experiment_name)
+    if record["status"] != "trained":
+        raise HTTPException(status_code=409, detail=f"{experiment_name} has no trained model")
+
+    def load(model_path: Path) -> "RandomForestMSE | GradientBoostingMSE":
+        return get_model_type(record["ml_model"]).load(model_path, mmap=True)
+
+    return model_registry.get(experiment_name, get_model_path(experiment_name), load)
+
+
+def preload_models() -> None:
+    """
+    Import the models and load every trained one into the cache ahead of the first request.
+
+    Called on import when PRELOAD_MODELS is set, which `scripts/launch_backend.sh` combines with gunicorn's
+    `--preload`, so this runs once in the master and the forked workers share the modules and models copy-on-write.
+    Everything loaded is then frozen out of the garbage collector, whose passes would otherwise write to the
+    shared pages and copy them into every worker.
+    """
+    for ml_model in MODELS:
+        get_model_type(ml_model)
+    _, records = experiment_index.list(status="trained")
+    for record in records:
+        load_model(record["name"])
+    gc.freeze()
+
+
+def get_experiment(experiment_name: str) -> dict[str, Any]:
+    """
+    Get the experiment's record from the index.
+
+    An experiment missing from the index is looked up in `runs/` once, in case it was copied there directly.
+
+    Raises:
+        HTTPException: 404 if there is no such experiment.
+    """
+    record = experiment_index.get(experiment_name)
+    if record is None and experiment_name == Path(experiment_name).name and not experiment_name.startswith("."):
+        record = experiment_index.refresh(experiment_name)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown experiment {experiment_name}")
+    return record
+
+
+async def save_upload(upload: UploadFile, path: Path) -> None:
+    """
+    Write an uploaded file to disk in chunks of `UPLOAD_CHUNK_SIZE` bytes.
+    """
+    with path.open("wb") as file:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            file.write(chunk)
+
+
+@app.get("/existing_experiments/", response_model=ExistingExperimentsResponse)
+async def existing_experiments(request: Request) -> Response:
     """
     Get information about existing experiments.
 
-    This endpoint scans the directory where experiments are stored and returns a list of
-    existing experiments along with their absolute paths. Each experiment is stored as
-    a directory in the host filesystem.
+    This endpoint lists the experiments of the index and returns their names along with
+    the absolute paths of their directories. Each experiment is stored as a directory in
+    the host filesystem, see `/experiments/` for paginated and filtered listing. Like all
+    read endpoints, it answers `If-None-Match` with 304 Not Modified if nothing changed.
 
     Returns:
         ExistingExperimentsResponse: A response containing the location of the experiments
@@ -44,30 +198,95 @@ async def existing_experiments() -> ExistingExperimentsResponse:
     """
     path = get_runs_dir()
     response = ExistingExperimentsResponse(location=path)
-    if not path.exists():
-        return response
-    response.abs_paths = [obj for obj in path.iterdir() if obj.is_dir()]
-    response.experiment_names = [
-        filepath.stem for filepath in response.abs_paths]
-    return response
+    _, records = experiment_index.list()
+    response.experiment_names = [record["name"] for record in records]
+    response.abs_paths = [path / name for name in response.experiment_names]
+    return conditional_response(request, response.model_dump_json().encode())
+
+
+@app.get("/experiments/", response_model=ExperimentListResponse)
+async def list_experiments(request: Request,
+                           offset: int = Query(0, ge=0),
+                           limit: int | None = Query(None, gt=0),
+                           ml_model: str | None = Query(None),
+                           status: str | None = Query(None),
+                           prefix: str | None = Query(None),
+                           order_by: str = Query("name")) -> Response:
+    """
+    List a page of the indexed experiments with their configs, status and best validation scores.
+
+    Experiments can be filtered by model, status ("registered" or "trained") and name prefix, and ordered by
+    "name", "created_at" (newest first) or "best_score" (lowest first).
+    """
+    if status is not None and status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"Status must be one of {', '.join(STATUSES)}")
+    if order_by not in ORDERS:
+        raise HTTPException(status_code=400, detail=f"order_by must be one of {', '.join(ORDERS)}")
+    total, records = experiment_index.list(offset, limit, ml_model, status, prefix, order_by)
+    response = ExperimentListResponse(
+        total=total,
+        offset=offset,
+        limit=limit,
+        experiments=[ExperimentRecord(**record) for record in records]
+    )
+    return conditional_response(request, response.model_dump_json().encode())
+
+
+@app.get("/experiments/{experiment_name}", response_model=ExperimentRecord)
+async def get_experiment_record(request: Request, experiment_name: str) -> Response:
+    """
+    Get the indexed config, status and best validation score of an experiment.
+
+    `Last-Modified` is the time the experiment's record last changed, e.g. by training, so clients can use it as
+    the version of the experiment's trained data.
+    """
+    record = get_experiment(experiment_name)
+    return conditional_response(
+        request, ExperimentRecord(**record).model_dump_json().encode(), last_modified=record["updated_at"])
 
 
 @app.post("/register_experiment/")
 async def register_experiment(experiment_config: str = Form(...),
                               train_file: UploadFile = File(...)) -> MessageResponse:
 
+    """
+    Create an experiment from its config and training CSV.
+
+    The experiment is assembled in a hidden staging directory and renamed into `runs/` once complete, so other
+    workers never see it half-written, and of two concurrent registrations of a name only one succeeds.
+    """
     experiment_config = ExperimentConfig(**json.loads(experiment_config))
-    path = Path(os.sep.join(["runs", f"{experiment_config.name}"]))
+    name = experiment_config.name
+    if name != Path(name).name or name.startswith("."):
+        raise HTTPException(status_code=400, detail=f"Invalid experiment name {name!r}")
+    path = get_runs_dir() / name
     if path.exists():
-        raise ValueError('WrOng NaMe BrOtHer')
-    path.mkdir(mode=0o777, parents=True)
-
-    config_path = path.joinpath('config.json')
-    config_path.write_text(experiment_config.model_dump_json())
-    config_path.chmod(0o777)
-    train_file_path = path.joinpath('train_file.csv')
-    train_file_path.write_bytes(train_file.file.read())
-    train_file_path.chmod(0o777)
+        raise HTTPException(status_code=409, detail=f"Experiment {name} already exists")
+    staging_path = get_runs_dir() / f".{name}.{uuid.uuid4().hex}"
+    staging_path.mkdir(mode=0o777, parents=True)
+
+    try:
+        config_path = staging_path.joinpath('config.json')
+        config_path.write_text(experiment_config.model_dump_json())
+        config_path.chmod(0o777)
+        train_file_path = staging_path.joinpath('train_file.csv')
+        with span("save_upload"):
+            await save_upload(train_file, train_file_path)
+        train_file_path.chmod(0o777)
+        with span("convert_csv"):
+            try:
+                await run_in_threadpool(convert_csv, train_file_path, experiment_config.target_column)
+            except ValueError as error:
+                raise HTTPException(status_code=400, detail=str(error))
+
+        # Renaming onto an existing experiment fails, as it is never empty.
+        try:
+            staging_path.rename(path)
+        except OSError:
+            raise HTTPException(status_code=409, detail=f"Experiment {name} already exists")
+    finally:
+        shutil.rmtree(staging_path, ignore_errors=True)
+    experiment_index.refresh(name)
 
     response = MessageResponse(
         message='OK'
@@ -75,90 +294,303 @@ async def register_experiment(experiment_config: str = Form(...),
     return response
 
 
-@app.get("/load_experiment_config/")
-async def existing_experiments(experiment_name: str = Query(...)) -> ExperimentConfig:
-    path = Path(os.sep.join(["runs", experiment_name, 'config.json']))
-    experiment_config = json.loads(path.read_text())
-    response = ExperimentConfig(**experiment_config)
-    return response
+@app.get("/load_experiment_config/", response_model=ExperimentConfig)
+async def existing_experiments(request: Request, experiment_name: str = Query(...)) -> Response:
+    record = get_experiment(experiment_name)
+    response = ExperimentConfig(**record["config"])
+    return conditional_response(request, response.model_dump_json().encode(), last_modified=record["updated_at"])
 
 
-@app.get("/needs_training/")
-async def existing_experiments(experiment_name: str = Query(...)) -> BoolResponse:
-    path = Path(os.sep.join(
-        ["runs", experiment_name, 'convergence_history.json']))
-    return BoolResponse(response=not path.exists())
+@app.get("/needs_training/", response_model=BoolResponse)
+async def existing_experiments(request: Request, experiment_name: str = Query(...)) -> Response:
+    record = get_experiment(experiment_name)
+    response = BoolResponse(response=record["status"] != "trained")
+    return conditional_response(request, response.model_dump_json().encode(), last_modified=record["updated_at"])
 
 
 @app.put("/train_model/")
-async def register_experiment(experiment_name: str = Query(...)) -> MessageResponse:
-    train_file_path = get_runs_dir() / experiment_name / "train_file.csv"
-    df = pd.read_csv(train_file_path)
+async def train_model(experiment_name: str = Query(...),
+                      warm_start: bool = Query(False),
+                      n_estimators: int | None = Query(None, gt=0)) -> TrainingJobResponse:
+    """
+    Submit training of the experiment's model to the background job pool.
 
-    config_path = train_file_path.with_name("config.json")
-    config = ExperimentConfig(**json.loads(config_path.read_text()))
+    Returns right away; poll `/jobs/{job_id}` for progress. Stage durations of the training itself are saved
+    to the experiment's `fit_times.json`. With `warm_start`, trees are added to the saved model instead of
+    training it from scratch. `n_estimators` updates the number of trees in the experiment's config first.
+    """
+    with span("load_config"):
+        config = ExperimentConfig(**get_experiment(experiment_name)["config"])
+        experiment_dir = get_runs_dir() / experiment_name
+        config_path = experiment_dir / "config.json"
+        if n_estimators is not None and n_estimators != config.n_estimators:
+            config.n_estimators = n_estimators
+            write_text_atomic(config_path, config.model_dump_json())
+            experiment_index.refresh(experiment_name)
+    with span("submit"):
+        status = job_manager.submit(experiment_name, experiment_dir, config.n_estimators, warm_start)
+    return TrainingJobResponse(**status)
+
+
+@app.get("/jobs/{job_id}", response_model=TrainingJobResponse)
+async def get_job(request: Request, job_id: str) -> Response:
+    """
+    Get the status, the number of fitted trees and the partial convergence history of a training job.
+    """
+    try:
+        status = job_manager.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return conditional_response(request, TrainingJobResponse(**status).model_dump_json().encode())
 
-    models = {
-        "Random Forest": RandomForestMSE,
-        "Gradient Boosting": GradientBoostingMSE
-    }
-    model_type = models[config.ml_model]
-    if config.max_features == 'all':
-        config.max_features = None
-    tree_params = {
-        "max_depth": config.max_depth,
-        "max_features": config.max_features
-    }
 
-    model = model_type(
-        config.n_estimators,
-        tree_params=tree_params
-    )
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str) -> TrainingJobResponse:
+    """
+    Cancel a queued or running training job.
+    """
+    try:
+        status = job_manager.cancel(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return TrainingJobResponse(**status)
 
-    target = df[config.target_column]
-    X_train, X_val, y_train, y_val = train_test_split(
-        df.drop(config.target_column, axis=1).to_numpy(),
-        target.to_numpy(),
-        test_size=0.3,
-        random_state=52
-    )
-    history = model.fit(X_train, y_train, X_val, y_val, trace=True)[0]
-    model.dump(os.sep.join(["runs", experiment_name, "model"]))
 
-    history_path = config_path.with_name("convergence_history.json")
-    history_path.write_text(json.dumps(history, indent=4))
+@app.post("/compact_model/")
+async def compact_model(experiment_name: str = Query(...),
+                        quantize: bool = Query(True)) -> CompactionResponse:
+    """
+    Cut the experiment's model at the best validation iteration and compact it for serving.
 
-    response = MessageResponse(
-        message='OK'
+    Unfitted trees and trees past the lowest validation (or out-of-bag) error are dropped, identical subtrees are
+    merged and, with `quantize`, thresholds and leaf values are stored as float32. The convergence history is cut
+    at the same iteration.
+
+    Raises:
+        HTTPException: 404 if there is no such experiment, 409 if its model is not trained yet or has no saved
+            convergence history.
+    """
+    record = get_experiment(experiment_name)
+    if record["status"] != "trained":
+        raise HTTPException(status_code=409, detail=f"{experiment_name} has no trained model")
+    model_path = await run_in_threadpool(get_model_path, record["name"])
+    with span("compact"):
+        try:
+            result = await run_in_threadpool(compact_experiment, model_path.parent, quantize)
+        except ValueError as error:
+            raise HTTPException(status_code=409, detail=str(error))
+    model_registry.invalidate(experiment_name)
+    return CompactionResponse(**result)
+
+
+@app.post("/sweeps/")
+async def submit_sweep(sweep_config: str = Form(...),
+                       train_file: UploadFile = File(...)) -> SweepResponse:
+    """
+    Start a hyperparameter sweep over the uploaded training CSV.
+
+    The file is uploaded, parsed and split once, and the fits then memory-map the same arrays in a process pool
+    of `SWEEP_WORKERS` processes. Trials differing only in `n_estimators` are cut from one fit of the largest of
+    them. Poll `/sweeps/{sweep_id}` for the leaderboard.
+    """
+    config = SweepConfig(**json.loads(sweep_config))
+    try:
+        expand_trials(config)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    sweep_id = uuid.uuid4().hex
+    sweep_dir = sweep_manager.sweep_dir(sweep_id)
+    sweep_dir.mkdir(parents=True)
+    train_file_path = sweep_dir / "train_file.csv"
+    try:
+        with span("save_upload"):
+            await save_upload(train_file, train_file_path)
+        with span("convert_csv"):
+            await run_in_threadpool(convert_csv, train_file_path, config.target_column)
+        if not (config.validation == "oob" and config.ml_model == "Random Forest"):
+            with span("split"):
+                await run_in_threadpool(split_dataset, sweep_dir, config.target_column)
+    except ValueError as error:
+        shutil.rmtree(sweep_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=str(error))
+    with span("submit"):
+        status = sweep_manager.submit(sweep_id, config)
+    return SweepResponse(**status)
+
+
+@app.get("/sweeps/{sweep_id}", response_model=SweepResponse)
+async def get_sweep(request: Request, sweep_id: str) -> Response:
+    """
+    Get the status of a sweep and its leaderboard: trials ordered by their lowest held-out error, with their
+    convergence histories.
+    """
+    try:
+        status = sweep_manager.get(sweep_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown sweep {sweep_id}")
+    return conditional_response(request, SweepResponse(**status).model_dump_json().encode())
+
+
+@app.delete("/sweeps/{sweep_id}")
+async def cancel_sweep(sweep_id: str) -> SweepResponse:
+    """
+    Cancel a sweep, keeping the trials fitted so far.
+    """
+    try:
+        status = sweep_manager.cancel(sweep_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown sweep {sweep_id}")
+    return SweepResponse(**status)
+
+
+@app.get("/get_convergence_history/", response_model=ConvergenceHistoryResponse)
+async def existing_experiments(request: Request,
+                               experiment_name: str = Query(...),
+                               start: int = Query(0, ge=0),
+                               stop: int | None = Query(None, ge=0),
+                               max_points: int | None = Query(None, ge=MIN_POINTS)) -> Response:
+    """
+    Get the convergence history of the experiment's trained model.
+
+    Only the iterations from `start` up to `stop` are read from the stored history. With `max_points`, longer
+    ranges are downsampled keeping the extremes of every curve and the best held-out loss, see `downsample`.
+
+    The entity tag comes from the history file's metadata, so revalidating an unchanged history costs one `stat`
+    and neither reads nor sends the file.
+    """
+    path = history_file(get_runs_dir() / experiment_name)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"{experiment_name} has no trained model")
+    etag, last_modified = file_etag(path)
+
+    def body() -> bytes:
+        curves, n_iterations = read_curves(path, start, stop)
+        if max_points is not None:
+            points = downsample(curves, max_points)
+            curves = {name: values[points] for name, values in curves.items()}
+        else:
+            points = np.arange(max(map(len, curves.values()), default=0))
+        response = ConvergenceHistoryResponse(
+            **to_history(curves),
+            iterations=(points + min(start, n_iterations) + 1).tolist(),
+            n_iterations=n_iterations
+        )
+        return response.model_dump_json().encode()
+
+    return conditional_response(request, body, etag=etag, last_modified=last_modified)
+
+
+@app.get(
+    "/predict/",
+    response_model=PredictResponse,
+    responses={200: {"content": {OCTET_STREAM: {}, NPY: {}}}}
+)
+async def predict(experiment_name: str = Query(...),
+                  test_file: UploadFile = File(...),
+                  n_trees: int | None = Query(None, gt=0),
+                  accept: str | None = Header(None)) -> StreamingResponse:
+    """
+    Predict values for the uploaded CSV file.
+
+    The file is parsed and predicted in chunks of `PREDICT_CHUNK_ROWS` rows. The response format follows the
+    `Accept` header: a `PredictResponse` JSON (default), raw little-endian float64 values
+    (`application/octet-stream`) or a `.npy` array (`application/x-npy`). JSON and raw bodies are streamed
+    chunk by chunk, so memory use does not grow with the file size. Files of at most `MICRO_BATCH_MAX_BYTES`
+    bytes are predicted together with concurrent small requests for the same experiment. The `X-Row-Count` header
+    holds the number of predicted values, so clients can detect a body cut short mid-stream. A file whose columns
+    do not match the model's features is rejected with 400 before anything is predicted. `n_trees` limits
+    prediction to the leading trees of the ensemble, e.g. up to the best iteration of the convergence history,
+    which is proportionally cheaper.
+    """
+    media_type = negotiate_media_type(accept)
+    if media_type is None:
+        raise HTTPException(
+            status_code=406, detail=f"Supported formats: {', '.join(MEDIA_TYPES)}")
+
+    with span("load_model"):
+        model = load_model(experiment_name)
+    if n_trees is not None and n_trees > model.fitted_estimators:
+        raise HTTPException(
+            status_code=400, detail=f"The model has only {model.fitted_estimators} trees")
+    # The upload is closed once the handler returns, before the response
+    # body is streamed, so it is spooled to a file the stream owns.
+    with span("save_upload"):
+        with NamedTemporaryFile(suffix=".csv", delete=False) as file:
+            csv_path = Path(file.name)
+        await save_upload(test_file, csv_path)
+
+    if csv_path.stat().st_size <= MICRO_BATCH_MAX_BYTES:
+        try:
+            with span("parse_csv"):
+                X = read_csv(csv_path)
+            # A bad request must fail alone, not the batch it would join.
+            check_n_features(X, model.compile().n_features)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+        finally:
+            csv_path.unlink()
+        with span("predict"):
+            chunks = [await micro_batcher.predict(experiment_name, model, X, n_trees)]
+        n_rows = len(chunks[0])
+    else:
+        try:
+            n_rows = await run_in_threadpool(count_csv_rows, csv_path, PREDICT_CHUNK_ROWS)
+        except ValueError as error:
+            csv_path.unlink()
+            raise HTTPException(status_code=400, detail=str(error))
+        chunks = predict_csv_chunks(model, csv_path, PREDICT_CHUNK_ROWS, n_trees)
+        # Errors in the body cannot change the status once the headers are
+        # sent, so the first chunk is predicted before them.
+        try:
+            first = await run_in_threadpool(next, chunks, None)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+        chunks = itertools.chain([] if first is None else [first], chunks)
+    return StreamingResponse(
+        encode_predictions(chunks, media_type),
+        media_type=media_type,
+        headers={"X-Row-Count": str(n_rows)}
     )
-    return response
 
 
-@app.get("/get_convergence_history/")
-async def existing_experiments(experiment_name: str = Query(...)) -> ConvergenceHistoryResponse:
-    path = Path(os.sep.join(
-        ["runs", experiment_name, 'convergence_history.json']))
-    response = ConvergenceHistoryResponse(**json.loads(path.read_text()))
-    return response
+@app.get("/model_cache/")
+async def model_cache_stats() -> ModelCacheStatsResponse:
+    """
+    Get hit, miss and eviction counters of the in-process model cache.
+    """
+    return ModelCacheStatsResponse(**model_registry.stats())
+
 
+@app.get("/batching/")
+async def batching_stats() -> BatchingStatsResponse:
+    """
+    Get batch size and queueing delay statistics of the prediction micro-batcher.
+    """
+    return BatchingStatsResponse(**micro_batcher.stats())
 
-@app.get("/predict/")
-async def existing_experiments(experiment_name: str = Query(...),
-                               test_file: UploadFile = File(...)) -> PredictResponse:
-    file_content = await test_file.read()
-    df = pd.read_csv(StringIO(file_content.decode('utf-8')))
-    model_path = get_runs_dir() / experiment_name / 'model'
-    config_path = get_runs_dir() / experiment_name / 'config.json'
 
-    config = ExperimentConfig(**json.loads(config_path.read_text()))
-    models = {
-        "Random Forest": RandomForestMSE,
-        "Gradient Boosting": GradientBoostingMSE
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """
+    Get request and stage latency histograms, model cache and batching counters in the Prometheus text format.
+    """
+    cache = model_registry.stats()
+    batching = micro_batcher.stats()
+    counters = {
+        "ensembles_model_cache_hits_total": cache["hits"],
+        "ensembles_model_cache_misses_total": cache["misses"],
+        "ensembles_model_cache_evictions_total": cache["evictions"],
+        "ensembles_batches_total": batching["batches"],
+        "ensembles_batched_requests_total": batching["requests"],
+        "ensembles_batched_rows_total": batching["rows"],
+    }
+    gauges = {
+        "ensembles_model_cache_models": cache["models"],
+        "ensembles_model_cache_bytes": cache["nbytes"],
     }
-    model_type = models[config.ml_model]
-    model = model_type.load(model_path)
+    return PlainTextResponse(render_metrics(counters, gauges), media_type="text/plain; version=0.0.4")
 
-    response = PredictResponse(
-        predicted_values=model.predict(df.to_numpy())
-    )
-    return response
+
+if os.environ.get("PRELOAD_MODELS"):
+    preload_models()
@@ -0,0 +1,142 @@
+import asyncio
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+from fastapi.concurrency import run_in_threadpool
+
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+@dataclass
+class _Batch:
+    model: Any
+    n_trees: int | None = None
+    requests: list[tuple[npt.NDArray[np.float64], asyncio.Future, float]] = field(default_factory=list)
+    rows: int = 0
+    timer: asyncio.TimerHandle | None = None
+
+
+class MicroBatcher:
+    def __init__(self, window: float = 0.005, max_rows: int = 4096) -> None:
+        """
+        Gathers concurrent small prediction requests for the same model into one `predict` call.
+
+        The first request for a model opens a batch, which is flushed `window` seconds later or as soon as it holds
+        `max_rows` rows, whichever comes first. Rows of all requests are stacked, predicted at once in a worker
+        thread and split back. Predictions are row-wise, so every caller gets exactly what it would get alone.
+
+        Args:
+            window (float, optional): Maximum time in seconds a request waits for others to join it. Defaults to 0.005.
+            max_rows (int, optional): Number of rows after which a batch is flushed immediately. Defaults to 4096.
+        """
+        self.window = window
+        self.max_rows = max_rows
+        self._batches: dict[tuple[str, int, int, int | None], _Batch] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.max_batch_size = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    async def predict(
+        self, experiment_name: str, model: Any, X: npt.NDArray[np.float64], n_trees: int | None = None
+    ) -> npt.NDArray[np.float64]:
+        """
+        Predict with the model, batched with concurrent requests for the same experiment.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            model (Any): The experiment's loaded model.
+            X (npt.NDArray[np.float64]): Objects' features matrix, array of shape (n_objects, n_features).
+            n_trees (int | None, optional): Number of leading trees to predict with, requests with different values
+                are batched separately. Defaults to None (all of them).
+
+        Returns:
+            npt.NDArray[np.float64]: Predicted values, array of shape (n_objects,).
+        """
+        # A retrained model is a different object, and must not share a batch
+        # with requests that loaded the previous one.
+        key = (experiment_name, id(model), X.shape[1], n_trees)
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch(model, n_trees)
+            batch.timer = loop.call_later(self.window, self._flush, key)
+
+        future = loop.create_future()
+        batch.requests.append((X, future, perf_counter()))
+        batch.rows += X.shape[0]
+        if batch.rows >= self.max_rows:
+            batch.timer.cancel()
+            self._flush(key)
+        return await future
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Get batch size and queueing delay statistics.
+
+        Returns:
+            dict[str, Any]: Counters, means and maxima, and the number of batches per batch size bucket, where
+                bucket `n` counts batches of at most `n` requests and the last bucket counts larger ones.
+        """
+        return {
+            "window": self.window,
+            "max_rows": self.max_rows,
+            "batches": self.batches,
+            "requests": self.requests,
+            "rows": self.rows,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "mean_queue_delay": self.queue_delay_total / self.requests if self.requests else 0.0,
+            "max_queue_delay": self.queue_delay_max,
+            "batch_size_buckets": {
+                str(bound): count for bound, count in zip((*BATCH_SIZE_BUCKETS, "inf"), self.batch_size_counts)
+            },
+        }
+
+    def _flush(self, key: tuple[str, int, int, int | None]) -> None:
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+
+        now = perf_counter()
+        delays = [now - enqueued for _, _, enqueued in batch.requests]
+        self.batches += 1
+        self.requests += len(batch.requests)
+        self.rows += batch.rows
+        self.max_batch_size = max(self.max_batch_size, len(batch.requests))
+        self.queue_delay_total += sum(delays)
+        self.queue_delay_max = max(self.queue_delay_max, *delays)
+        bucket = next(
+            (i for i, bound in enumerate(BATCH_SIZE_BUCKETS) if len(batch.requests) <= bound),
+            len(BATCH_SIZE_BUCKETS),
+        )
+        self.batch_size_counts[bucket] += 1
+
+        # The loop only keeps weak references to tasks.
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _Batch) -> None:
+        futures = [future for _, future, _ in batch.requests]
+        try:
+            X = np.concatenate([X for X, _, _ in batch.requests])
+            predictions = await run_in_threadpool(batch.model.predict, X, batch.n_trees)
+        except Exception as error:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        offsets = np.cumsum([X.shape[0] for X, _, _ in batch.requests])[:-1]
+        for future, values in zip(futures, np.split(predictions, offsets)):
+            if not future.done():
+                future.set_result(values)
@@ -0,0 +1,92 @@
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Callable
+
+from fastapi import Request, Response
+
+
+JSON = "application/json"
+
+
+def content_etag(body: bytes) -> str:
+    """
+    Strong entity tag of a response body.
+    """
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def file_etag(path: Path) -> tuple[str, float]:
+    """
+    Entity tag and modification time of a file, from its metadata only.
+
+    Files in `runs/` are replaced by rename, so a new version always has a new modification time.
+
+    Returns:
+        tuple[str, float]: The entity tag and the modification time as a Unix timestamp.
+    """
+    stat = path.stat()
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', stat.st_mtime
+
+
+def is_not_modified(request: Request, etag: str, last_modified: float | None = None) -> bool:
+    """
+    Check the request's `If-None-Match` or, without it, `If-Modified-Since` against the current version.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        return etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have a resolution of one second.
+    return int(last_modified) <= since
+
+
+def conditional_response(
+    request: Request,
+    body: bytes | Callable[[], bytes],
+    etag: str | None = None,
+    last_modified: float | None = None,
+    media_type: str = JSON,
+) -> Response:
+    """
+    Respond with `body`, or with 304 Not Modified and no body if the client already has this version.
+
+    Responses carry `ETag`, `Last-Modified` if known, and `Cache-Control: no-cache`, so clients revalidate every
+    time but download only what changed.
+
+    Args:
+        request (Request): The request, for its conditional headers.
+        body (bytes | Callable[[], bytes]): The body, or a function making it, called only if it is sent or
+            `etag` is not given.
+        etag (str | None, optional): Entity tag of the body, e.g. from `file_etag`. Defaults to None (a hash
+            of the body).
+        last_modified (float | None, optional): Modification time of the resource as a Unix timestamp.
+            Defaults to None.
+        media_type (str, optional): Media type of the body. Defaults to JSON.
+
+    Returns:
+        Response: The full or the 304 response.
+    """
+    if etag is None:
+        if callable(body):
+            body = body()
+        etag = content_etag(body)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    if callable(body):
+        body = body()
+    return Response(body, media_type=media_type, headers=headers)
@@ -0,0 +1,120 @@
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+
+CSV_CHUNK_ROWS = 100_000
+FEATURES_FILE = "features.npy"
+TARGET_FILE = "target.npy"
+SPLIT_FILES = ("train_features.npy", "val_features.npy", "train_target.npy", "val_target.npy")
+
+
+def convert_csv(csv_path: Path, target_column: str, chunk_rows: int = CSV_CHUNK_ROWS) -> None:
+    """
+    Convert a training CSV into `.npy` feature and target arrays stored next to it.
+
+    Features are stored as a C-contiguous float32 matrix, the exact input scikit-learn trees convert features to,
+    so training memory-maps it without parsing or converting anything. The target is stored as float64. The CSV
+    is read twice in chunks, once to count the rows and once to fill the arrays, so memory use stays bounded.
+
+    Args:
+        csv_path (Path): Path to the CSV file.
+        target_column (str): Name of the target column.
+        chunk_rows (int, optional): Number of rows parsed at once. Defaults to `CSV_CHUNK_ROWS`.
+
+    Raises:
+        ValueError: If the file is not a valid CSV, has no `target_column` or has non-numeric values.
+    """
+    import pandas as pd
+
+    features_path = csv_path.with_name(FEATURES_FILE)
+    target_path = csv_path.with_name(TARGET_FILE)
+    try:
+        n_rows = 0
+        for chunk in pd.read_csv(csv_path, usecols=[target_column], chunksize=chunk_rows):
+            n_rows += len(chunk)
+        n_columns = len(pd.read_csv(csv_path, nrows=0).columns)
+
+        features = np.lib.format.open_memmap(
+            features_path.with_suffix(".tmp"), mode="w+", dtype=np.float32, shape=(n_rows, n_columns - 1)
+        )
+        target = np.lib.format.open_memmap(
+            target_path.with_suffix(".tmp"), mode="w+", dtype=np.float64, shape=(n_rows,)
+        )
+
+        start = 0
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+            stop = start + len(chunk)
+            target[start:stop] = chunk.pop(target_column).to_numpy()
+            features[start:stop] = chunk.to_numpy()
+            start = stop
+    except ValueError as error:
+        # Parser errors of pandas are ValueErrors too.
+        features_path.with_suffix(".tmp").unlink(missing_ok=True)
+        target_path.with_suffix(".tmp").unlink(missing_ok=True)
+        raise ValueError(f"Cannot read {csv_path.name}: {error}") from error
+
+    features.flush()
+    target.flush()
+    del features, target
+    features_path.with_suffix(".tmp").replace(features_path)
+    target_path.with_suffix(".tmp").replace(target_path)
+
+
+def load_dataset(
+    experiment_dir: Path, target_column: str
+) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.float64]]:
+    """
+    Memory-map the experiment's training data, converting its CSV first if needed.
+
+    Args:
+        experiment_dir (Path): Directory of the experiment with `train_file.csv`.
+        target_column (str): Name of the target column.
+
+    Returns:
+        tuple[npt.NDArray[np.float32], npt.NDArray[np.float64]]: Read-only features matrix of shape
+            (n_objects, n_features) and target of shape (n_objects,).
+    """
+    features_path = experiment_dir / FEATURES_FILE
+    target_path = experiment_dir / TARGET_FILE
+    if not (features_path.exists() and target_path.exists()):
+        convert_csv(experiment_dir / "train_file.csv", target_column)
+
+    return (
+        np.load(features_path, mmap_mode="r"),
+        np.load(target_path, mmap_mode="r"),
+    )
+
+
+def split_dataset(directory: Path, target_column: str, test_size: float = 0.3, random_state: int = 52) -> None:
+    """
+    Split the training data in `directory` into train and validation arrays stored next to it.
+
+    The split is the one `train_experiment` makes, and it is written once so that every process training on it
+    memory-maps the same pages instead of splitting, and copying, the data itself.
+
+    Args:
+        directory (Path): Directory with `train_file.csv` or its converted arrays.
+        target_column (str): Name of the target column.
+        test_size (float, optional): Fraction of the objects in the validation part. Defaults to 0.3.
+        random_state (int, optional): Seed of the split. Defaults to 52.
+    """
+    from sklearn.model_selection import train_test_split
+
+    X, y = load_dataset(directory, target_column)
+    parts = train_test_split(X, y, test_size=test_size, random_state=random_state)
+    for name, part in zip(SPLIT_FILES, parts):
+        np.save(directory / name, part)
+
+
+def load_split(
+    directory: Path
+) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.float32], npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Memory-map the arrays written by `split_dataset`.
+
+    Returns:
+        tuple: Read-only train features, validation features, train target and validation target.
+    """
+    return tuple(np.load(directory / name, mmap_mode="r") for name in SPLIT_FILES)
@@ -0,0 +1,164 @@
+import io
+import json
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+import numpy.typing as npt
+
+from .instrumentation import span
+
+
+JSON = "application/json"
+OCTET_STREAM = "application/octet-stream"
+NPY = "application/x-npy"
+MEDIA_TYPES = (JSON, OCTET_STREAM, NPY)
+
+
+def negotiate_media_type(accept: str | None) -> str | None:
+    """
+    Pick the response format of `/predict/` from the `Accept` header.
+
+    Media ranges are tried by decreasing quality, wildcards resolve to JSON.
+
+    Args:
+        accept (str | None): Value of the `Accept` header.
+
+    Returns:
+        str | None: One of `MEDIA_TYPES`, or None if none of them is acceptable.
+    """
+    if not accept:
+        return JSON
+
+    ranges = []
+    for position, item in enumerate(accept.split(",")):
+        media_range, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges.append((-quality, position, media_range))
+
+    for negative_quality, _, media_range in sorted(ranges):
+        if negative_quality == 0:
+            break
+        if media_range in MEDIA_TYPES:
+            return media_range
+        if media_range in ("*/*", "application/*"):
+            return JSON
+    return None
+
+
+def read_csv(csv_path: Path) -> npt.NDArray[np.float64]:
+    """
+    Parse a whole CSV file of features into a matrix.
+
+    Raises:
+        ValueError: If the file is not a valid CSV or has non-numeric values.
+    """
+    import pandas as pd
+
+    return pd.read_csv(csv_path).to_numpy(dtype=np.float64)
+
+
+def count_csv_rows(csv_path: Path, chunk_rows: int = 100_000) -> int:
+    """
+    Count the data rows of a CSV file with the parser of `read_csv`, so quoted line breaks and blank lines are
+    counted the same way, converting only the first column.
+
+    Raises:
+        ValueError: If the file is not a valid CSV.
+    """
+    import pandas as pd
+
+    with pd.read_csv(csv_path, usecols=[0], chunksize=chunk_rows) as reader:
+        return sum(len(chunk) for chunk in reader)
+
+
+def check_n_features(X: npt.NDArray[np.float64], n_features: int) -> None:
+    """
+    Check that a parsed CSV file has as many columns as the model has features.
+
+    Raises:
+        ValueError: If the number of columns differs.
+    """
+    if X.ndim != 2 or X.shape[1] != n_features:
+        raise ValueError(f"The file has {X.shape[-1]} columns, but the model expects {n_features} features")
+
+
+def predict_csv_chunks(
+    model: Any, csv_path: Path, chunk_rows: int, n_trees: int | None = None
+) -> Iterator[npt.NDArray[np.float64]]:
+    """
+    Predict values for a CSV file `chunk_rows` rows at a time with the first `n_trees` trees, deleting the file
+    afterwards.
+
+    Raises:
+        ValueError: If a chunk cannot be parsed or has another number of columns than the model has features.
+    """
+    import pandas as pd
+
+    n_features = model.compile().n_features
+
+    try:
+        with pd.read_csv(csv_path, chunksize=chunk_rows) as reader:
+            while True:
+                with span("parse_csv"):
+                    chunk = next(reader, None)
+                if chunk is None:
+                    break
+                X = chunk.to_numpy(dtype=np.float64)
+                check_n_features(X, n_features)
+                with span("predict"):
+                    values = model.predict(X, n_trees)
+                yield values
+    finally:
+        csv_path.unlink()
+
+
+def encode_predictions(
+    chunks: Iterable[npt.NDArray[np.float64]], media_type: str
+) -> Iterator[bytes]:
+    """
+    Encode chunks of predictions into a response body of the given media type.
+
+    JSON (a `PredictResponse`) and raw little-endian float64 bytes are streamed chunk by chunk. The `.npy` header
+    holds the array length, so that format is assembled once all chunks are predicted. JSON has no NaN or
+    infinity, so non-finite predictions are encoded as `null` there, the binary formats keep them as they are.
+
+    Args:
+        chunks (Iterable[npt.NDArray[np.float64]]): Predicted values, chunk by chunk.
+        media_type (str): One of `MEDIA_TYPES`.
+
+    Yields:
+        bytes: Parts of the response body.
+    """
+    if media_type == JSON:
+        yield b'{"predicted_values":['
+        separator = b""
+        for chunk in chunks:
+            if not len(chunk):
+                continue
+            with span("encode"):
+                finite = np.isfinite(chunk)
+                if not finite.all():
+                    chunk = np.where(finite, chunk.astype(object), None)
+                values = json.dumps(chunk.tolist(), separators=(",", ":"), allow_nan=False)[1:-1].encode()
+            yield separator + values
+            separator = b","
+        yield b"]}"
+    elif media_type == OCTET_STREAM:
+        for chunk in chunks:
+            with span("encode"):
+                values = chunk.astype("<f8", copy=False).tobytes()
+            yield values
+    else:
+        chunks = list(chunks)
+        with span("encode"):
+            buffer = io.BytesIO()
+            np.save(buffer, np.concatenate([np.empty(0), *chunks]).astype("<f8", copy=False))
+        yield buffer.getvalue()
@@ -0,0 +1,207 @@
+import json
+import struct
+from pathlib import Path
+from typing import BinaryIO
+
+import numpy as np
+import numpy.typing as npt
+
+from ensembles.utils import ConvergenceHistory
+
+from .storage import publish
+
+
+HISTORY_FILE = "convergence_history.bin"
+LEGACY_HISTORY_FILE = "convergence_history.json"
+MAGIC = b"ENSHIST\0"
+FORMAT_VERSION = 1
+CURVES = ("train", "val", "oob")
+# Bucket extremes of up to three curves plus the first, last and best points.
+MIN_POINTS = 2 * len(CURVES) + 3
+
+# Magic, format version, bitmask of the stored `CURVES` and number of iterations.
+_PREAMBLE = struct.Struct("<8sIIQ")
+_DATA_OFFSET = 64
+
+
+def history_file(experiment_dir: Path) -> Path | None:
+    """
+    Path of the experiment's convergence history, the binary one if both exist, or None if it was never trained.
+    """
+    for name in (HISTORY_FILE, LEGACY_HISTORY_FILE):
+        path = experiment_dir / name
+        if path.exists():
+            return path
+    return None
+
+
+def _stored_curves(mask: int) -> list[str]:
+    return [name for bit, name in enumerate(CURVES) if mask & (1 << bit)]
+
+
+def _pack(history: ConvergenceHistory) -> tuple[int, npt.NDArray[np.float64]]:
+    curves = [name for name in CURVES if history.get(name)]
+    mask = sum(1 << CURVES.index(name) for name in curves)
+    if not curves:
+        return mask, np.empty((0, 0), dtype="<f8")
+    rows = np.column_stack([np.asarray(history[name], dtype="<f8") for name in curves])
+    return mask, np.ascontiguousarray(rows, dtype="<f8")
+
+
+def write_history(path: Path, history: ConvergenceHistory) -> None:
+    """
+    Write the convergence history into a binary file, replacing it atomically.
+
+    The file starts with `MAGIC`, the format version, a bitmask of the non-empty `CURVES` and the number of
+    iterations. From `_DATA_OFFSET` on, every iteration is a row of float64 losses of the stored curves, so any range
+    of iterations is read without reading the rest.
+
+    Raises:
+        ValueError: If the curves have different lengths.
+    """
+    lengths = {len(values) for values in history.values() if values}
+    if len(lengths) > 1:
+        raise ValueError("Curves of the history have different lengths")
+    mask, rows = _pack(history)
+
+    with publish(path) as tmp_path:
+        with tmp_path.open("wb") as file:
+            file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, mask, len(rows)).ljust(_DATA_OFFSET, b"\0"))
+            file.write(rows.tobytes())
+
+
+def append_history(path: Path, history: ConvergenceHistory) -> None:
+    """
+    Append the curves of a warm-started fit to a binary history in place.
+
+    The rows are written first and the number of iterations in the preamble updated after them, so readers never
+    see a partially appended iteration.
+
+    Raises:
+        ValueError: If the history records other curves than the file.
+    """
+    mask, rows = _pack(history)
+    with path.open("r+b") as file:
+        _, _, stored_mask, length = _read_preamble(file, path)
+        if not len(rows):
+            return
+        if stored_mask and mask != stored_mask:
+            raise ValueError(f"{path} records the curves {_stored_curves(stored_mask)}")
+        file.seek(_DATA_OFFSET + length * rows.shape[1] * 8)
+        file.write(rows.tobytes())
+        file.truncate()
+        file.flush()
+        file.seek(0)
+        file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, mask, length + len(rows)))
+
+
+def _read_preamble(file: BinaryIO, path: Path) -> tuple[bytes, int, int, int]:
+    preamble = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+    if preamble[0] != MAGIC:
+        raise ValueError(f"{path} is not a convergence history file")
+    if preamble[1] > FORMAT_VERSION:
+        raise ValueError(f"{path} has unsupported format version {preamble[1]}")
+    return preamble
+
+
+def read_curves(
+    path: Path, start: int = 0, stop: int | None = None
+) -> tuple[dict[str, npt.NDArray[np.float64]], int]:
+    """
+    Read a range of iterations of the stored curves.
+
+    Only the requested rows of a binary history are read. A legacy JSON history is parsed whole.
+
+    Args:
+        path (Path): Path of the history, see `history_file`.
+        start (int, optional): First iteration to read, counting from 0. Defaults to 0.
+        stop (int | None, optional): Iteration to stop before. Defaults to None (the last one).
+
+    Returns:
+        tuple[dict[str, npt.NDArray[np.float64]], int]: The non-empty curves and the number of iterations of the
+            whole history.
+    """
+    if path.suffix == ".json":
+        history = json.loads(path.read_text())
+        length = len(history["train"])
+        curves = {
+            name: np.asarray(history[name], dtype=np.float64)[start:stop]
+            for name in CURVES if history.get(name)
+        }
+        return curves, length
+
+    with path.open("rb") as file:
+        _, _, mask, length = _read_preamble(file, path)
+        names = _stored_curves(mask)
+        start, stop, _ = slice(start, stop).indices(length)
+        n_rows = max(stop - start, 0)
+        file.seek(_DATA_OFFSET + start * len(names) * 8)
+        rows = np.fromfile(file, dtype="<f8", count=n_rows * len(names)).reshape(n_rows, len(names))
+    return {name: rows[:, i] for i, name in enumerate(names)}, length
+
+
+def read_history(path: Path, start: int = 0, stop: int | None = None) -> ConvergenceHistory:
+    """
+    Read a range of iterations of a convergence history, see `read_curves`.
+    """
+    curves, _ = read_curves(path, start, stop)
+    return to_history(curves)
+
+
+def to_history(curves: dict[str, npt.NDArray[np.float64]]) -> ConvergenceHistory:
+    """
+    Convert curves read by `read_curves` back to the history returned by `fit`.
+    """
+    return ConvergenceHistory(
+        train=curves["train"].tolist() if "train" in curves else [],
+        val=curves["val"].tolist() if "val" in curves else [],
+        oob=curves["oob"].tolist() if "oob" in curves else None,
+    )
+
+
+def _bucket_extremes(curves: dict[str, npt.NDArray[np.float64]], length: int, n_buckets: int) -> npt.NDArray[np.intp]:
+    starts = -(-np.arange(n_buckets) * length // n_buckets)
+    sizes = np.diff(np.append(starts, length))
+    kept = [np.array([0, length - 1])]
+    for values in curves.values():
+        for extremes in (np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)):
+            # The first iteration of every bucket that reaches its extreme.
+            hits = np.flatnonzero(values == np.repeat(extremes, sizes))
+            kept.append(hits[np.searchsorted(hits, starts)])
+    held_out = curves.get("val", curves.get("oob"))
+    if held_out is not None:
+        kept.append(np.array([np.argmin(held_out)]))
+    return np.unique(np.concatenate(kept))
+
+
+def downsample(curves: dict[str, npt.NDArray[np.float64]], max_points: int) -> npt.NDArray[np.intp]:
+    """
+    Pick at most `max_points` iterations that keep the shape of every curve.
+
+    The iterations are split into equal buckets and the minimum and the maximum of every curve in every bucket are
+    kept, along with the first and the last iteration and the best one of the held-out curve, so spikes and the
+    best loss survive where a plain stride would drop them. Extremes of smooth curves often fall on the same
+    iterations, so the number of buckets is the largest one whose points still fit into `max_points`.
+
+    Args:
+        curves (dict[str, npt.NDArray[np.float64]]): Curves of the same length, as read by `read_curves`.
+        max_points (int): Maximum number of iterations to keep, at least `MIN_POINTS`.
+
+    Returns:
+        npt.NDArray[np.intp]: Sorted indices of the kept iterations.
+    """
+    length = max((len(values) for values in curves.values()), default=0)
+    if length <= max_points:
+        return np.arange(length)
+
+    # A single bucket gives at most `MIN_POINTS` points.
+    low, high = 1, max_points
+    points = _bucket_extremes(curves, length, low)
+    while low < high:
+        n_buckets = (low + high + 1) // 2
+        candidate = _bucket_extremes(curves, length, n_buckets)
+        if len(candidate) <= max_points:
+            low, points = n_buckets, candidate
+        else:
+            high = n_buckets - 1
+    return points
@@ -0,0 +1,241 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from ensembles.utils import best_iteration
+
+from .history import history_file, read_history
+
+
+INDEX_FILE = ".index.sqlite"
+STATUSES = ("registered", "trained")
+COLUMNS = (
+    "name", "ml_model", "status", "config", "model_path", "fitted_estimators", "best_iteration", "best_score",
+    "train_score", "created_at", "updated_at",
+)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    name TEXT PRIMARY KEY,
+    ml_model TEXT NOT NULL,
+    status TEXT NOT NULL,
+    config TEXT NOT NULL,
+    model_path TEXT,
+    fitted_estimators INTEGER,
+    best_iteration INTEGER,
+    best_score REAL,
+    train_score REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS experiments_ml_model ON experiments (ml_model, name);
+CREATE INDEX IF NOT EXISTS experiments_status ON experiments (status, name);
+CREATE INDEX IF NOT EXISTS experiments_created_at ON experiments (created_at);
+"""
+ORDERS = {
+    "name": "name",
+    "created_at": "created_at DESC, name",
+    "best_score": "best_score IS NULL, best_score, name",
+}
+
+
+def read_experiment(experiment_dir: Path) -> dict[str, Any] | None:
+    """
+    Read the index record of an experiment from its files in `runs/`.
+
+    Returns:
+        dict[str, Any] | None: Record with the `COLUMNS` but `updated_at`, or None if the directory is not a
+            registered experiment.
+    """
+    config_path = experiment_dir / "config.json"
+    try:
+        config = json.loads(config_path.read_text())
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    # The config is rewritten when the number of trees changes, the training
+    # file never is.
+    train_file_path = experiment_dir / "train_file.csv"
+    created_at = (train_file_path if train_file_path.exists() else config_path).stat().st_mtime
+
+    record = {
+        "name": experiment_dir.name,
+        "ml_model": config["ml_model"],
+        "status": "registered",
+        "config": config,
+        "model_path": None,
+        "fitted_estimators": None,
+        "best_iteration": None,
+        "best_score": None,
+        "train_score": None,
+        "created_at": created_at,
+    }
+    history_path = history_file(experiment_dir)
+    model_path = experiment_dir / "model.ens"
+    if not model_path.exists() and (experiment_dir / "model").is_dir():
+        model_path = experiment_dir / "model"
+    if history_path is not None and model_path.exists():
+        history = read_history(history_path)
+        best = best_iteration(history)
+        record.update(
+            status="trained",
+            model_path=str(model_path),
+            fitted_estimators=len(history["train"]),
+            best_iteration=best,
+            best_score=(history.get("val") or history.get("oob"))[best - 1] if best is not None else None,
+            train_score=history["train"][-1] if history["train"] else None,
+        )
+    return record
+
+
+class ExperimentIndex:
+    def __init__(self, runs_dir: Path) -> None:
+        """
+        SQLite index of the experiments in `runs_dir`, so listing and looking them up does not touch their files.
+
+        `runs_dir` stays the store of the experiments' files, the index only holds their configs, status, model
+        paths, metrics of the convergence history and timestamps. Whatever writes an experiment's files calls
+        `refresh` once they are published; `rebuild` recreates the index from the files. The database lives in
+        `runs_dir/.index.sqlite` in WAL mode, so all backend workers and training processes share it.
+
+        Args:
+            runs_dir (Path): Directory of the experiments.
+        """
+        self.runs_dir = runs_dir
+        self.path = runs_dir / INDEX_FILE
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are per thread, and not inherited by forked workers.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            is_new = not self.path.exists()
+            self.runs_dir.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            # Experiments registered before the index existed are picked up
+            # once, when it is created.
+            if is_new:
+                self.rebuild()
+        return connection
+
+    def refresh(self, name: str) -> dict[str, Any] | None:
+        """
+        Update the experiment's record from its files, removing it if the experiment is gone.
+
+        Returns:
+            dict[str, Any] | None: The new record, or None if there is no such experiment.
+        """
+        record = read_experiment(self.runs_dir / name)
+        connection = self._connect()
+        if record is None:
+            connection.execute("DELETE FROM experiments WHERE name = ?", (name,))
+            return None
+        self._upsert(connection, record)
+        return self.get(name)
+
+    def rebuild(self) -> int:
+        """
+        Recreate the index from the experiments' files in one transaction.
+
+        Returns:
+            int: Number of indexed experiments.
+        """
+        records = [
+            record
+            for path in sorted(self.runs_dir.iterdir())
+            if not path.name.startswith(".") and path.is_dir()
+            and (record := read_experiment(path)) is not None
+        ] if self.runs_dir.exists() else []
+
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM experiments")
+            for record in records:
+                self._upsert(connection, record)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return len(records)
+
+    def get(self, name: str) -> dict[str, Any] | None:
+        """
+        Get the experiment's record, or None if it is not indexed.
+        """
+        row = self._connect().execute("SELECT * FROM experiments WHERE name = ?", (name,)).fetchone()
+        return None if row is None else self._to_record(row)
+
+    def list(
+        self,
+        offset: int = 0,
+        limit: int | None = None,
+        ml_model: str | None = None,
+        status: str | None = None,
+        prefix: str | None = None,
+        order_by: str = "name",
+    ) -> tuple[int, list[dict[str, Any]]]:
+        """
+        List a page of the experiments matching the filters.
+
+        Args:
+            offset (int, optional): Number of matching experiments to skip. Defaults to 0.
+            limit (int | None, optional): Maximum number of experiments to return. Defaults to None (all).
+            ml_model (str | None, optional): Only experiments of this model. Defaults to None.
+            status (str | None, optional): Only experiments with this status, one of `STATUSES`. Defaults to None.
+            prefix (str | None, optional): Only experiments whose name starts with it. Defaults to None.
+            order_by (str, optional): One of `ORDERS`. Defaults to "name".
+
+        Returns:
+            tuple[int, list[dict[str, Any]]]: Number of matching experiments and the records of the page.
+        """
+        conditions, parameters = [], []
+        if ml_model is not None:
+            conditions.append("ml_model = ?")
+            parameters.append(ml_model)
+        if status is not None:
+            conditions.append("status = ?")
+            parameters.append(status)
+        if prefix:
+            conditions.append("substr(name, 1, ?) = ?")
+            parameters.extend((len(prefix), prefix))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        connection = self._connect()
+        total = connection.execute(f"SELECT count(*) FROM experiments {where}", parameters).fetchone()[0]
+        rows = connection.execute(
+            f"SELECT * FROM experiments {where} ORDER BY {ORDERS[order_by]} LIMIT ? OFFSET ?",
+            (*parameters, -1 if limit is None else limit, offset),
+        ).fetchall()
+        return total, [self._to_record(row) for row in rows]
+
+    @staticmethod
+    def _upsert(connection: sqlite3.Connection, record: dict[str, Any]) -> None:
+        values = {**record, "config": json.dumps(record["config"]), "updated_at": time.time()}
+        connection.execute(
+            f"INSERT OR REPLACE INTO experiments ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(COLUMNS))})",
+            [values[column] for column in COLUMNS],
+        )
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> dict[str, Any]:
+        record = dict(row)
+        record["config"] = json.loads(record["config"])
+        return record
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != "rebuild":
+        sys.exit("usage: python -m ensembles.backend.index rebuild [RUNS_DIR]")
+    runs_dir = Path(sys.argv[2] if len(sys.argv) == 3 else "runs")
+    print(f"Indexed {ExperimentIndex(runs_dir).rebuild()} experiments in {runs_dir / INDEX_FILE}")
@@ -0,0 +1,224 @@
+import cProfile
+import os
+import re
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from threading import Lock
+from time import perf_counter, strftime
+from typing import Any, Iterator
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    def __init__(
+        self, name: str, description: str, labelnames: tuple[str, ...], buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        """
+        Prometheus-style latency histogram with cumulative buckets.
+
+        Args:
+            name (str): Metric name.
+            description (str): Help text of the metric.
+            labelnames (tuple[str, ...]): Names of the labels every observation carries.
+            buckets (tuple[float, ...], optional): Upper bounds of the buckets in seconds. Defaults to
+                `DEFAULT_BUCKETS`.
+        """
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict[tuple[str, ...], list[float]] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            # Bucket counts, then the sum and the count of observations.
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = ",".join(f'{name}="{value}"' for name, value in zip(self.labelnames, key))
+                prefix = labels + "," if labels else ""
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count:g}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]:g}')
+                lines.append(f"{self.name}_sum{{{labels}}} {series[-2]:g}")
+                lines.append(f"{self.name}_count{{{labels}}} {series[-1]:g}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "ensembles_request_duration_seconds", "Latency of HTTP requests.", ("method", "route", "status")
+)
+STAGE_DURATION = Histogram(
+    "ensembles_stage_duration_seconds", "Latency of request and training stages.", ("stage",)
+)
+
+# Label of requests no route matched, so scans of unknown paths add no series.
+UNMATCHED_ROUTE = "<unmatched>"
+
+# cProfile hooks the whole interpreter and allows one active profiler at a time.
+_profile_lock = Lock()
+_spans: ContextVar[list[tuple[str, float]] | None] = ContextVar("spans", default=None)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Time a stage, recording it in `STAGE_DURATION` and in the spans collected for the current request, if any.
+
+    Args:
+        name (str): Name of the stage, reported as a `Server-Timing` metric name.
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        duration = perf_counter() - start
+        STAGE_DURATION.observe(duration, stage=name)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((name, duration))
+
+
+@contextmanager
+def collect_spans() -> Iterator[list[tuple[str, float]]]:
+    """
+    Collect the spans recorded inside the block.
+
+    Yields:
+        list[tuple[str, float]]: Names and durations in seconds of the spans, filled as they finish.
+    """
+    spans: list[tuple[str, float]] = []
+    token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+
+
+def render_metrics(counters: dict[str, float], gauges: dict[str, float]) -> str:
+    """
+    Render the latency histograms and the given values in the Prometheus text exposition format.
+
+    Args:
+        counters (dict[str, float]): Monotonic counters by metric name.
+        gauges (dict[str, float]): Current values by metric name.
+
+    Returns:
+        str: The `/metrics` response body.
+    """
+    lines = [*REQUEST_DURATION.render(), *STAGE_DURATION.render()]
+    for kind, values in (("counter", counters), ("gauge", gauges)):
+        for name, value in values.items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def route_label(scope: dict[str, Any]) -> str:
+    """
+    Get the path template of the route that served the request, e.g. `/experiments/{experiment_name}`.
+    """
+    return getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+
+
+def format_server_timing(spans: list[tuple[str, float]]) -> str:
+    return ", ".join(f"{name};dur={duration * 1000:.3f}" for name, duration in spans)
+
+
+class InstrumentationMiddleware:
+    def __init__(self, app: Any, profiles_dir: Path | None = None) -> None:
+        """
+        ASGI middleware timing every HTTP request.
+
+        Spans finished before the response starts are sent in a `Server-Timing` header together with the total
+        time, and every request is recorded in `REQUEST_DURATION`. Spans of a streamed body finish after the
+        headers are sent, so they only reach the histograms. If `profiles_dir` is set, a request with an
+        `X-Profile` header is run under cProfile and the stats are dumped into that directory, the file name being
+        returned in an `X-Profile-File` header. Requests are labelled with the template of their route, not with
+        their path, so neither metrics nor profile names grow with the paths clients ask for. The profiler is process-wide, so one request is profiled at a time
+        and others asking for a profile meanwhile get 409; the profile also covers any other requests the worker
+        serves while it runs.
+
+        Args:
+            app (Any): The wrapped ASGI application.
+            profiles_dir (Path | None, optional): Directory for profiles, None disables profiling. Defaults to None.
+        """
+        self.app = app
+        self.profiles_dir = profiles_dir
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        status = 500
+        profile_path = None
+        profiler = None
+        profiler_busy = False
+        if self.profiles_dir is not None and "x-profile" in Headers(scope=scope):
+            if _profile_lock.acquire(blocking=False):
+                profiler = cProfile.Profile()
+            else:
+                profiler_busy = True
+
+        def get_profile_path() -> Path:
+            # The route is only known once the request is routed.
+            nonlocal profile_path
+            if profile_path is None:
+                endpoint = re.sub(r"[^\w-]+", "_", route_label(scope)).strip("_") or "root"
+                profile_path = self.profiles_dir / (
+                    f"{strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}-{uuid.uuid4().hex[:8]}.prof")
+            return profile_path
+
+        with collect_spans() as spans:
+            async def send_with_timing(message: dict[str, Any]) -> None:
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    headers = MutableHeaders(scope=message)
+                    total = [("total", perf_counter() - start)]
+                    headers.append("Server-Timing", format_server_timing(spans + total))
+                    if profiler is not None:
+                        headers.append("X-Profile-File", get_profile_path().name)
+                await send(message)
+
+            try:
+                if profiler_busy:
+                    response = JSONResponse({"detail": "Another request is being profiled"}, status_code=409)
+                    await response(scope, receive, send_with_timing)
+                else:
+                    if profiler is not None:
+                        profiler.enable()
+                    await self.app(scope, receive, send_with_timing)
+            finally:
+                if profiler is not None:
+                    try:
+                        profiler.disable()
+                        self.profiles_dir.mkdir(parents=True, exist_ok=True)
+                        profiler.dump_stats(get_profile_path())
+                    finally:
+                        _profile_lock.release()
+                REQUEST_DURATION.observe(
+                    perf_counter() - start,
+                    method=scope["method"],
+                    route=route_label(scope),
+                    status=str(status),
+                )
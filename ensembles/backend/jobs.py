@@ -0,0 +1,167 @@
+import json
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+
+from ensembles.utils import ConvergenceHistory
+
+from .history import history_file, read_history
+from .storage import write_text_atomic
+from .training import merge_histories, train_experiment
+
+
+PROGRESS_INTERVAL = 0.5
+
+
+def _read_status(job_path: Path) -> dict[str, Any]:
+    return json.loads(job_path.read_text())
+
+
+def _write_status(job_path: Path, status: dict[str, Any]) -> None:
+    # Readers poll the file from other processes, so it is replaced atomically
+    # instead of being rewritten in place.
+    write_text_atomic(job_path, json.dumps(status))
+
+
+def _run_job(job_path: Path, experiment_dir: Path, warm_start: bool = False) -> None:
+    """
+    Train the experiment in a pool process, reporting progress into the job's status file.
+
+    The job is interrupted as soon as a `.cancel` file appears next to the status file. Progress of a warm start
+    includes the trees fitted before.
+    """
+    cancel_path = job_path.with_suffix(".cancel")
+    status = _read_status(job_path)
+    if cancel_path.exists():
+        status["status"] = "cancelled"
+        _write_status(job_path, status)
+        return
+
+    status["status"] = "running"
+    _write_status(job_path, status)
+    last_report = perf_counter()
+
+    previous = None
+    history_path = history_file(experiment_dir)
+    if warm_start and (experiment_dir / "model.ens").exists() and history_path is not None:
+        previous = read_history(history_path)
+
+    def report(history: ConvergenceHistory, times: list[float]) -> bool:
+        nonlocal last_report
+        if cancel_path.exists():
+            return True
+        if perf_counter() - last_report >= PROGRESS_INTERVAL:
+            if previous is not None:
+                history = merge_histories(previous, history)
+            status["fitted_estimators"] = len(history["train"])
+            status["history"] = history
+            _write_status(job_path, status)
+            last_report = perf_counter()
+        return False
+
+    try:
+        completed = train_experiment(experiment_dir, callback=report, warm_start=warm_start)
+    except Exception as error:
+        status["status"] = "failed"
+        status["error"] = repr(error)
+    else:
+        status["status"] = "completed" if completed else "cancelled"
+        if completed:
+            history = read_history(history_file(experiment_dir))
+            status["fitted_estimators"] = len(history["train"])
+            status["history"] = history
+    _write_status(job_path, status)
+
+
+class JobManager:
+    def __init__(self, jobs_dir: Path, max_workers: int = 1) -> None:
+        """
+        Runs training jobs in a process pool, so training does not block the event loop.
+
+        Job state lives in `<jobs_dir>/<job_id>.json` and is written by the pool process, so any backend worker can
+        report on or cancel any job.
+
+        Args:
+            jobs_dir (Path): Directory for job status files.
+            max_workers (int, optional): Number of training processes. Defaults to 1.
+        """
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._futures: dict[str, Future] = {}
+
+    def submit(
+        self, experiment_name: str, experiment_dir: Path, n_estimators: int, warm_start: bool = False
+    ) -> dict[str, Any]:
+        """
+        Queue training of the experiment.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            experiment_dir (Path): Directory of the experiment.
+            n_estimators (int): Number of trees to train, reported as the job's total.
+            warm_start (bool, optional): Whether to add trees to the saved model, see `train_experiment`.
+                Defaults to False.
+
+        Returns:
+            dict[str, Any]: Initial status of the job.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=get_context("spawn")
+            )
+
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        status = {
+            "job_id": job_id,
+            "experiment_name": experiment_name,
+            "status": "queued",
+            "n_estimators": n_estimators,
+            "fitted_estimators": 0,
+            "history": None,
+            "error": None,
+        }
+        job_path = self._job_path(job_id)
+        _write_status(job_path, status)
+        self._futures[job_id] = self._executor.submit(_run_job, job_path, experiment_dir, warm_start)
+        return status
+
+    def get(self, job_id: str) -> dict[str, Any]:
+        """
+        Get the current status of the job.
+
+        Raises:
+            KeyError: If there is no such job.
+        """
+        job_path = self._job_path(job_id)
+        if not job_path.exists():
+            raise KeyError(job_id)
+        return _read_status(job_path)
+
+    def cancel(self, job_id: str) -> dict[str, Any]:
+        """
+        Ask the job to stop. A running job stops after the tree being fitted.
+
+        Raises:
+            KeyError: If there is no such job.
+        """
+        status = self.get(job_id)
+        if status["status"] in ("queued", "running"):
+            self._job_path(job_id).with_suffix(".cancel").touch()
+
+            future = self._futures.get(job_id)
+            if future is not None and future.cancel():
+                status["status"] = "cancelled"
+                _write_status(self._job_path(job_id), status)
+        return status
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _job_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{Path(job_id).name}.json"
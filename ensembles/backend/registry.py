@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable
+
+
+class ModelRegistry:
+    def __init__(self, max_models: int = 16, max_bytes: int | None = None) -> None:
+        """
+        In-memory LRU cache of loaded models.
+
+        Entries are keyed by experiment name and the modification time of the model file, so a retrained model
+        is never served from a stale entry. The least recently used models are evicted once either budget is
+        exceeded; the most recently loaded model is always kept.
+
+        Args:
+            max_models (int, optional): Maximum number of cached models. Defaults to 16.
+            max_bytes (int | None, optional): Maximum total size of the cached node arrays in bytes. Defaults to
+                None (no limit).
+        """
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[int, Any, int]] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, experiment_name: str, model_path: Path, load: Callable[[Path], Any]) -> Any:
+        """
+        Get the experiment's model, loading it on a miss.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            model_path (Path): Path to the model file.
+            load (Callable[[Path], Any]): Function loading the model from `model_path`.
+
+        Returns:
+            Any: The loaded model.
+        """
+        mtime = model_path.stat().st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(experiment_name)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(experiment_name)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        model = load(model_path)
+        nbytes = model.compile().nbytes
+        with self._lock:
+            self._entries[experiment_name] = (mtime, model, nbytes)
+            self._entries.move_to_end(experiment_name)
+            self._evict()
+        return model
+
+    def invalidate(self, experiment_name: str) -> None:
+        """
+        Drop the experiment's model from the cache, e.g. after it was retrained.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+        """
+        with self._lock:
+            self._entries.pop(experiment_name, None)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry[2] for entry in self._entries.values())
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Get the cache counters.
+
+        Returns:
+            dict[str, Any]: Hits, misses, evictions, the number and total size of the cached models and the budgets.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "models": len(self._entries),
+                "nbytes": self.nbytes,
+                "max_models": self.max_models,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _evict(self) -> None:
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_models
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
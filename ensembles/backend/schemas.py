@@ -27,11 +27,74 @@ class ExperimentConfig(BaseModel):
     max_depth: int
     max_features: str | int | float
     target_column: str
+    validation: str = "holdout"
+    patience: int | None = None
+
+
+class ExperimentRecord(BaseModel):
+    """
+    Indexed metadata of an experiment.
+
+    Attributes:
+        name (str): The name of the experiment.
+        ml_model (str): Model of the experiment.
+        status (str): "registered" or "trained".
+        config (ExperimentConfig): Config of the experiment.
+        model_path (Path | None): Path of the trained model.
+        fitted_estimators (int | None): Number of trained trees.
+        best_iteration (int | None): Number of trees with the lowest held-out error.
+        best_score (float | None): Lowest held-out RMSE.
+        train_score (float | None): Train RMSE of the whole model.
+        created_at (float): Registration time as a Unix timestamp.
+        updated_at (float): Time of the last change as a Unix timestamp.
+    """
+
+    name: str
+    ml_model: str
+    status: str
+    config: ExperimentConfig
+    model_path: Path | None = None
+    fitted_estimators: int | None = None
+    best_iteration: int | None = None
+    best_score: float | None = None
+    train_score: float | None = None
+    created_at: float
+    updated_at: float
+
+
+class ExperimentListResponse(BaseModel):
+    """
+    A page of the experiments matching a listing's filters.
+
+    Attributes:
+        total (int): Number of matching experiments.
+        offset (int): Number of matching experiments skipped.
+        limit (int | None): Maximum number of experiments in the page.
+        experiments (list[ExperimentRecord]): The experiments of the page.
+    """
+
+    total: int
+    offset: int
+    limit: int | None = None
+    experiments: list[ExperimentRecord]
 
 
 class ConvergenceHistoryResponse(BaseModel):
+    """
+    Losses of a range of iterations of a convergence history, possibly downsampled.
+
+    Attributes:
+        train (list[float]): Train RMSE.
+        val (list[float]): Validation RMSE, empty if the model was validated out-of-bag.
+        oob (list[float] | None): Out-of-bag RMSE.
+        iterations (list[int] | None): Number of trees of every point. Defaults to None (1, 2, ...).
+        n_iterations (int | None): Number of iterations of the whole history.
+    """
     train: list[float]
     val: list[float]
+    oob: list[float] | None = None
+    iterations: list[int] | None = None
+    n_iterations: int | None = None
 
 
 class MessageResponse(BaseModel):
@@ -43,4 +106,169 @@ class BoolResponse(BaseModel):
 
 
 class PredictResponse(BaseModel):
-    predicted_values: list[float]
+    """
+    Predictions for the rows of an uploaded CSV file.
+
+    Attributes:
+        predicted_values (list[float | None]): Predicted value of every row, None where it is NaN or infinite,
+            since JSON has no such numbers.
+    """
+
+    predicted_values: list[float | None]
+
+
+class ModelCacheStatsResponse(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    models: int
+    nbytes: int
+    max_models: int
+    max_bytes: int | None = None
+
+
+class TrainingJobResponse(BaseModel):
+    """
+    Status of a background training job.
+
+    Attributes:
+        job_id (str): Identifier of the job.
+        experiment_name (str): The experiment being trained.
+        status (str): One of "queued", "running", "completed", "cancelled" or "failed".
+        n_estimators (int): Number of trees to train.
+        fitted_estimators (int): Number of trees fitted so far.
+        history (ConvergenceHistoryResponse | None): Convergence history of the fitted trees, if any.
+        error (str | None): Error message of a failed job.
+    """
+
+    job_id: str
+    experiment_name: str
+    status: str
+    n_estimators: int
+    fitted_estimators: int = 0
+    history: ConvergenceHistoryResponse | None = None
+    error: str | None = None
+
+
+class CompactionResponse(BaseModel):
+    """
+    Result of compacting an experiment's model.
+
+    Attributes:
+        fitted_estimators_before (int): Number of trees before compaction.
+        fitted_estimators (int): Number of trees kept, up to the best validation iteration.
+        nbytes_before (int): Size of the node arrays before compaction.
+        nbytes (int): Size of the node arrays after compaction.
+    """
+
+    fitted_estimators_before: int
+    fitted_estimators: int
+    nbytes_before: int
+    nbytes: int
+
+
+class BatchingStatsResponse(BaseModel):
+    """
+    Statistics of the prediction micro-batcher.
+
+    Attributes:
+        window (float): Batching window in seconds.
+        max_rows (int): Number of rows after which a batch is flushed immediately.
+        batches (int): Number of predicted batches.
+        requests (int): Number of batched requests.
+        rows (int): Number of batched rows.
+        mean_batch_size (float): Mean number of requests per batch.
+        max_batch_size (int): Largest number of requests in a batch.
+        mean_queue_delay (float): Mean time in seconds a request waited for its batch.
+        max_queue_delay (float): Longest time in seconds a request waited for its batch.
+        batch_size_buckets (dict[str, int]): Number of batches of at most the key requests, "inf" for the rest.
+    """
+
+    window: float
+    max_rows: int
+    batches: int
+    requests: int
+    rows: int
+    mean_batch_size: float
+    max_batch_size: int
+    mean_queue_delay: float
+    max_queue_delay: float
+    batch_size_buckets: dict[str, int]
+
+
+class SweepConfig(BaseModel):
+    """
+    Hyperparameter sweep over one dataset.
+
+    Attributes:
+        ml_model (str): Model of every trial, a key of `MODELS`.
+        target_column (str): Name of the target column.
+        validation (str): "holdout" or, for forests, "oob". Defaults to "holdout".
+        patience (int | None): Early stopping patience of every fit. Defaults to None.
+        search (str): "grid" to run every combination of the values below, "random" to sample `n_trials` of them.
+            Defaults to "grid".
+        n_trials (int | None): Number of trials of a random search. Defaults to None.
+        random_state (int): Seed of a random search. Defaults to 0.
+        n_estimators (list[int]): Values of the number of trees.
+        max_depth (list[int]): Values of the maximum tree depth.
+        max_features (list[str | int | float]): Values of the number of features per split. Defaults to ["all"].
+    """
+
+    ml_model: str
+    target_column: str
+    validation: str = "holdout"
+    patience: int | None = None
+    search: str = "grid"
+    n_trials: int | None = None
+    random_state: int = 0
+    n_estimators: list[int]
+    max_depth: list[int]
+    max_features: list[str | int | float] = ["all"]
+
+
+class SweepTrialResponse(BaseModel):
+    """
+    A trial of a sweep.
+
+    Attributes:
+        trial (int): Index of the trial in the sweep.
+        n_estimators (int): Number of trees of the trial.
+        max_depth (int): Maximum tree depth of the trial.
+        max_features (str | int | float): Number of features per split of the trial.
+        status (str): One of "queued", "running", "completed", "cancelled" or "failed".
+        fitted_estimators (int): Number of trees fitted so far, fewer than `n_estimators` if stopped early.
+        best_iteration (int | None): Number of trees with the lowest held-out error.
+        best_score (float | None): Lowest held-out RMSE.
+        fit_time (float): Time spent fitting the trial's trees in seconds.
+        history (ConvergenceHistoryResponse | None): Convergence history of the fitted trees, if any.
+        error (str | None): Error message of a failed trial.
+    """
+
+    trial: int
+    n_estimators: int
+    max_depth: int
+    max_features: str | int | float
+    status: str
+    fitted_estimators: int = 0
+    best_iteration: int | None = None
+    best_score: float | None = None
+    fit_time: float = 0.0
+    history: ConvergenceHistoryResponse | None = None
+    error: str | None = None
+
+
+class SweepResponse(BaseModel):
+    """
+    Status and leaderboard of a sweep.
+
+    Attributes:
+        sweep_id (str): Identifier of the sweep.
+        status (str): One of "queued", "running", "completed", "cancelled" or "failed".
+        n_fits (int): Number of models fitted for the trials, trials differing only in `n_estimators` share one.
+        trials (list[SweepTrialResponse]): Trials ordered by `best_score`, trials without one last.
+    """
+
+    sweep_id: str
+    status: str
+    n_fits: int
+    trials: list[SweepTrialResponse]
@@ -0,0 +1,60 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+
+LOCK_FILE = ".lock"
+
+
+@contextmanager
+def experiment_lock(experiment_dir: Path, shared: bool = False) -> Iterator[None]:
+    """
+    Hold an advisory lock on the experiment, shared by all backend workers and training processes.
+
+    Training and compaction take it exclusively, so two of them never write the same experiment at once. Readers
+    do not need it, since every file they read is published atomically.
+
+    Args:
+        experiment_dir (Path): Directory of the experiment.
+        shared (bool, optional): Whether to take a shared lock instead of an exclusive one. Defaults to False.
+    """
+    with (experiment_dir / LOCK_FILE).open("a") as file:
+        fcntl.flock(file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _temporary_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+@contextmanager
+def publish(path: Path) -> Iterator[Path]:
+    """
+    Write a file under a temporary name and rename it over `path` once the block succeeds.
+
+    Other processes see either the old file or the complete new one. Processes that memory-mapped the old file
+    keep reading it until they unmap it.
+
+    Yields:
+        Path: Hidden temporary path next to `path` to write to.
+    """
+    tmp_path = _temporary_path(path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def write_text_atomic(path: Path, text: str) -> None:
+    """
+    Replace the file's contents atomically, see `publish`.
+    """
+    with publish(path) as tmp_path:
+        tmp_path.write_text(text)
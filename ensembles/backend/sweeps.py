@@ -0,0 +1,290 @@
+import itertools
+import json
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+
+import numpy as np
+
+from ensembles.utils import ConvergenceHistory, best_iteration
+
+from .datasets import load_dataset, load_split
+from .jobs import PROGRESS_INTERVAL
+from .schemas import SweepConfig
+from .storage import write_text_atomic
+from .training import MODELS, get_model_type
+
+
+SWEEP_FILE = "sweep.json"
+CANCEL_FILE = ".cancel"
+
+
+def expand_trials(config: SweepConfig) -> list[dict[str, Any]]:
+    """
+    List the hyperparameters of every trial of the sweep.
+
+    Raises:
+        ValueError: If the model, the validation or the search is unknown, or the search space is empty.
+    """
+    if config.ml_model not in MODELS:
+        raise ValueError(f"Unknown model {config.ml_model!r}")
+    if config.validation not in ("holdout", "oob"):
+        raise ValueError(f"Unknown validation {config.validation!r}")
+    if not (config.n_estimators and config.max_depth and config.max_features):
+        raise ValueError("Every hyperparameter needs at least one value")
+    if min(config.n_estimators) < 1:
+        raise ValueError("n_estimators must be positive")
+
+    grid = [
+        {"n_estimators": n_estimators, "max_depth": max_depth, "max_features": max_features}
+        for max_depth, max_features, n_estimators in itertools.product(
+            config.max_depth, config.max_features, config.n_estimators)
+    ]
+    if config.search == "grid":
+        return grid
+    if config.search == "random":
+        if config.n_trials is None or config.n_trials < 1:
+            raise ValueError("Random search needs a positive n_trials")
+        rng = np.random.default_rng(config.random_state)
+        picked = rng.choice(len(grid), size=min(config.n_trials, len(grid)), replace=False)
+        return [grid[i] for i in sorted(picked)]
+    raise ValueError(f"Unknown search {config.search!r}")
+
+
+def group_trials(trials: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Group trials that differ only in `n_estimators` into one fit of the largest of them.
+
+    Trees of both models are fitted one after another from a fixed seed, so the first `n` trees of a larger
+    ensemble are exactly the ensemble of `n` trees, and so is the prefix of its convergence history. With early
+    stopping the group stops once, and its trials larger than where it stopped end there too.
+
+    Returns:
+        list[dict[str, Any]]: Hyperparameters of every fit, the largest first.
+    """
+    fits = {}
+    for trial in trials:
+        key = (trial["max_depth"], trial["max_features"])
+        if key not in fits or fits[key]["n_estimators"] < trial["n_estimators"]:
+            fits[key] = dict(trial)
+    return sorted(fits.values(), key=lambda fit: -fit["n_estimators"])
+
+
+def _fit_key(params: dict[str, Any]) -> tuple[Any, Any]:
+    return params["max_depth"], params["max_features"]
+
+
+def _fit_path(sweep_dir: Path, index: int) -> Path:
+    return sweep_dir / "fits" / f"{index}.json"
+
+
+def _run_fit(sweep_dir: Path, index: int, config: dict[str, Any], params: dict[str, Any]) -> None:
+    """
+    Fit the model of a group of trials in a pool process, reporting its history into the fit's status file.
+
+    The data is memory-mapped from the arrays prepared for the sweep, so all the fits share one copy of it in the
+    page cache. The fit is interrupted as soon as the sweep's `.cancel` file appears.
+    """
+    fit_path = _fit_path(sweep_dir, index)
+    cancel_path = sweep_dir / CANCEL_FILE
+    status = {"status": "running", "history": None, "times": [], "error": None}
+    if cancel_path.exists():
+        status["status"] = "cancelled"
+        write_text_atomic(fit_path, json.dumps(status))
+        return
+    write_text_atomic(fit_path, json.dumps(status))
+
+    config = SweepConfig(**config)
+    model_type = get_model_type(config.ml_model)
+    max_features = params["max_features"]
+    model = model_type(
+        params["n_estimators"],
+        tree_params={
+            "max_depth": params["max_depth"],
+            "max_features": None if max_features == "all" else max_features
+        }
+    )
+
+    last_report = perf_counter()
+    interrupted = False
+
+    def report(history: ConvergenceHistory, times: list[float]) -> bool:
+        nonlocal last_report, interrupted
+        if cancel_path.exists():
+            interrupted = True
+            return True
+        if perf_counter() - last_report >= PROGRESS_INTERVAL:
+            status["history"] = history
+            status["times"] = times
+            write_text_atomic(fit_path, json.dumps(status))
+            last_report = perf_counter()
+        return False
+
+    try:
+        if config.validation == "oob" and config.ml_model == "Random Forest":
+            X, y = load_dataset(sweep_dir, config.target_column)
+            history, times = model.fit(
+                X, y, trace=True, patience=config.patience, callback=report, oob=True)
+        else:
+            X_train, X_val, y_train, y_val = load_split(sweep_dir)
+            history, times = model.fit(
+                X_train, y_train, X_val, y_val, trace=True, patience=config.patience, callback=report)
+    except Exception as error:
+        status["status"] = "failed"
+        status["error"] = repr(error)
+    else:
+        status["status"] = "cancelled" if interrupted else "completed"
+        status["history"] = history
+        status["times"] = times
+    write_text_atomic(fit_path, json.dumps(status))
+
+
+def _trial_result(index: int, trial: dict[str, Any], fit: dict[str, Any]) -> dict[str, Any]:
+    """
+    Cut the trial's results out of the status of its fit.
+
+    A trial is completed as soon as its fit has its trees, or when the fit stopped early before that.
+    """
+    result = {"trial": index, **trial, "status": fit["status"], "error": fit["error"]}
+    history = fit["history"]
+    if history is None:
+        return result
+
+    n_trees = trial["n_estimators"]
+    history = {key: values[:n_trees] if values is not None else None for key, values in history.items()}
+    fitted_estimators = len(history["train"])
+    result.update(
+        fitted_estimators=fitted_estimators,
+        fit_time=sum(fit["times"][:n_trees]),
+        history=history
+    )
+    if fitted_estimators >= n_trees:
+        result["status"] = "completed"
+
+    best = best_iteration(history)
+    if best is not None:
+        curve = history.get("val") or history.get("oob")
+        result.update(best_iteration=best, best_score=curve[best - 1])
+    return result
+
+
+class SweepManager:
+    def __init__(self, sweeps_dir: Path, max_workers: int | None = None) -> None:
+        """
+        Runs hyperparameter sweeps in a process pool.
+
+        A sweep lives in `<sweeps_dir>/<sweep_id>/`: its data, `sweep.json` with the trials and a status file per
+        fit written by the pool process, so any backend worker can report on or cancel any sweep.
+
+        Args:
+            sweeps_dir (Path): Directory for sweeps.
+            max_workers (int | None, optional): Number of processes fitting trials in parallel. Defaults to None
+                (one per core).
+        """
+        self.sweeps_dir = sweeps_dir
+        self.max_workers = max_workers or os.cpu_count()
+        self._executor: ProcessPoolExecutor | None = None
+        self._futures: dict[str, list[Future]] = {}
+
+    def sweep_dir(self, sweep_id: str) -> Path:
+        return self.sweeps_dir / Path(sweep_id).name
+
+    def submit(self, sweep_id: str, config: SweepConfig) -> dict[str, Any]:
+        """
+        Queue the fits of a sweep whose data is already prepared in its directory.
+
+        The data must be converted with `convert_csv` and, unless every fit is validated out-of-bag, split with
+        `split_dataset`.
+
+        Args:
+            sweep_id (str): Identifier of the sweep.
+            config (SweepConfig): The sweep.
+
+        Returns:
+            dict[str, Any]: Initial status of the sweep.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=get_context("spawn")
+            )
+
+        sweep_dir = self.sweep_dir(sweep_id)
+        trials = expand_trials(config)
+        fits = group_trials(trials)
+        fit_indices = {_fit_key(fit): i for i, fit in enumerate(fits)}
+        (sweep_dir / "fits").mkdir(parents=True, exist_ok=True)
+        for i in range(len(fits)):
+            write_text_atomic(
+                _fit_path(sweep_dir, i),
+                json.dumps({"status": "queued", "history": None, "times": [], "error": None})
+            )
+        write_text_atomic(sweep_dir / SWEEP_FILE, json.dumps({
+            "config": config.model_dump(),
+            "trials": trials,
+            "fits": [fit_indices[_fit_key(trial)] for trial in trials],
+            "n_fits": len(fits)
+        }))
+
+        self._futures[sweep_id] = [
+            self._executor.submit(_run_fit, sweep_dir, i, config.model_dump(), fit)
+            for i, fit in enumerate(fits)
+        ]
+        return self.get(sweep_id)
+
+    def get(self, sweep_id: str) -> dict[str, Any]:
+        """
+        Get the status of the sweep and its trials ordered by the best held-out error.
+
+        Raises:
+            KeyError: If there is no such sweep.
+        """
+        sweep_dir = self.sweep_dir(sweep_id)
+        sweep_path = sweep_dir / SWEEP_FILE
+        if not sweep_path.exists():
+            raise KeyError(sweep_id)
+        sweep = json.loads(sweep_path.read_text())
+        fits = [json.loads(_fit_path(sweep_dir, i).read_text()) for i in range(sweep["n_fits"])]
+
+        trials = [
+            _trial_result(i, trial, fits[fit])
+            for i, (trial, fit) in enumerate(zip(sweep["trials"], sweep["fits"]))
+        ]
+        trials.sort(key=lambda trial: (trial.get("best_score") is None, trial.get("best_score") or 0.0, trial["trial"]))
+
+        statuses = {fit["status"] for fit in fits}
+        if statuses == {"queued"}:
+            status = "queued"
+        elif statuses & {"queued", "running"}:
+            status = "running"
+        elif "failed" in statuses:
+            status = "failed"
+        elif "cancelled" in statuses:
+            status = "cancelled"
+        else:
+            status = "completed"
+        return {"sweep_id": sweep_id, "status": status, "n_fits": sweep["n_fits"], "trials": trials}
+
+    def cancel(self, sweep_id: str) -> dict[str, Any]:
+        """
+        Stop the sweep. Running fits stop after the tree being fitted, trials they already covered are kept.
+
+        Raises:
+            KeyError: If there is no such sweep.
+        """
+        self.get(sweep_id)
+        sweep_dir = self.sweep_dir(sweep_id)
+        (sweep_dir / CANCEL_FILE).touch()
+        for i, future in enumerate(self._futures.get(sweep_id, [])):
+            if future.cancel():
+                write_text_atomic(
+                    _fit_path(sweep_dir, i),
+                    json.dumps({"status": "cancelled", "history": None, "times": [], "error": None})
+                )
+        return self.get(sweep_id)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
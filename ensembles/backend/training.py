@@ -0,0 +1,196 @@
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+import ensembles
+from ensembles.utils import ConvergenceHistory
+
+from .datasets import load_dataset
+from .history import HISTORY_FILE, LEGACY_HISTORY_FILE, append_history, history_file, read_history, write_history
+from .index import ExperimentIndex
+from .instrumentation import collect_spans, span
+from .schemas import ExperimentConfig
+from .storage import experiment_lock, publish, write_text_atomic
+
+if TYPE_CHECKING:
+    from ensembles import RandomForestMSE, GradientBoostingMSE
+
+
+MODELS = {
+    "Random Forest": "RandomForestMSE",
+    "Gradient Boosting": "GradientBoostingMSE"
+}
+
+
+def get_model_type(ml_model: str) -> "type[RandomForestMSE | GradientBoostingMSE]":
+    """
+    Get the model class of a config's `ml_model`.
+
+    Classes are looked up by name, so the backend imports scikit-learn only once a model is trained or loaded.
+
+    Raises:
+        KeyError: If the model is unknown.
+    """
+    return getattr(ensembles, MODELS[ml_model])
+
+
+def merge_histories(previous: ConvergenceHistory, history: ConvergenceHistory) -> ConvergenceHistory:
+    """
+    Append the curves of a warm-started fit to the history of the trees fitted before.
+    """
+    return ConvergenceHistory(**{
+        key: previous[key] + values if previous.get(key) is not None else values
+        for key, values in history.items()
+    })
+
+
+def train_experiment(
+    experiment_dir: Path,
+    callback: Callable[[ConvergenceHistory, list[float]], bool | None] | None = None,
+    warm_start: bool = False,
+) -> bool:
+    """
+    Train the experiment's model and save it with its convergence history.
+
+    Per-tree fit times and the durations of the training stages are saved to `fit_times.json`. Training holds the
+    experiment's lock, so concurrent trainings of the same experiment run one after another, and every file is
+    published atomically, so backend workers serving the experiment never read a partial one. The experiment's
+    record in the index is refreshed once everything is saved.
+
+    Args:
+        experiment_dir (Path): Directory of the experiment with `config.json` and `train_file.csv`.
+        callback (Callable[[ConvergenceHistory, list[float]], bool | None] | None, optional): Passed to the model's
+            `fit`, returning True interrupts training. Defaults to None.
+        warm_start (bool, optional): Whether to load the saved model and add trees up to `n_estimators` of the
+            config. The model file is rewritten with all the trees, and the history and fit times of the new trees
+            are appended to the saved ones. Falls back to training from scratch if there is no saved model. Defaults to False.
+
+    Returns:
+        bool: False if training was interrupted by the callback, in which case nothing is saved.
+    """
+    with experiment_lock(experiment_dir), collect_spans() as spans:
+        with span("load_data"):
+            config = ExperimentConfig(**json.loads((experiment_dir / "config.json").read_text()))
+            X, y = load_dataset(experiment_dir, config.target_column)
+
+        model_type = get_model_type(config.ml_model)
+        if config.max_features == 'all':
+            config.max_features = None
+        tree_params = {
+            "max_depth": config.max_depth,
+            "max_features": config.max_features
+        }
+
+        model_path = experiment_dir / "model.ens"
+        warm_start = warm_start and model_path.exists()
+        if warm_start:
+            with span("load_model"):
+                model = model_type.load(model_path)
+            model.n_estimators = config.n_estimators
+        else:
+            model = model_type(
+                config.n_estimators,
+                tree_params=tree_params
+            )
+
+        interrupted = False
+
+        def on_tree(history: ConvergenceHistory, times: list[float]) -> bool:
+            nonlocal interrupted
+            interrupted = callback is not None and bool(callback(history, times))
+            return interrupted
+
+        if config.validation == "oob" and config.ml_model == "Random Forest":
+            # Out-of-bag estimates replace the held-out split, so the model
+            # is trained on all the data.
+            with span("fit"):
+                history, times = model.fit(
+                    X, y, trace=True, patience=config.patience, callback=on_tree, oob=True, warm_start=warm_start)
+        else:
+            from sklearn.model_selection import train_test_split
+
+            with span("split"):
+                X_train, X_val, y_train, y_val = train_test_split(
+                    X,
+                    y,
+                    test_size=0.3,
+                    random_state=52
+                )
+            with span("fit"):
+                history, times = model.fit(
+                    X_train, y_train, X_val, y_val, trace=True, patience=config.patience, callback=on_tree,
+                    warm_start=warm_start)
+
+        if interrupted:
+            return False
+
+        with span("dump"):
+            # A warm-started model is rewritten whole as well, so the file
+            # stays a single segment that loads without copying.
+            with publish(model_path) as tmp_path:
+                model.dump(tmp_path)
+
+        fit_times_path = experiment_dir / "fit_times.json"
+        history_path = experiment_dir / HISTORY_FILE
+        if warm_start and fit_times_path.exists():
+            times = json.loads(fit_times_path.read_text())["estimators"] + times
+
+        fit_times = {"estimators": times, "stages": dict(spans)}
+        write_text_atomic(fit_times_path, json.dumps(fit_times, indent=4))
+        previous_path = history_file(experiment_dir)
+        if warm_start and previous_path == history_path:
+            append_history(history_path, history)
+        else:
+            if warm_start and previous_path is not None:
+                history = merge_histories(read_history(previous_path), history)
+            write_history(history_path, history)
+            (experiment_dir / LEGACY_HISTORY_FILE).unlink(missing_ok=True)
+        ExperimentIndex(experiment_dir.parent).refresh(experiment_dir.name)
+    return True
+
+
+def compact_experiment(experiment_dir: Path, quantize: bool = True) -> dict[str, int]:
+    """
+    Compact the experiment's saved model, see `compact` of the models.
+
+    The model is cut at the best iteration of the saved convergence history, which is cut there too along with
+    the fit times, so the history keeps describing the saved trees and warm starts continue from them. The model
+    file is replaced atomically under the experiment's lock, and the experiment's record in the index refreshed.
+
+    Args:
+        experiment_dir (Path): Directory of a trained experiment.
+        quantize (bool, optional): Whether to store thresholds and leaf values as float32. Defaults to True.
+
+    Returns:
+        dict[str, int]: Number of trees and size of the node arrays before and after compaction.
+
+    Raises:
+        ValueError: If the experiment has no saved convergence history to find the best iteration in.
+    """
+    model_path = experiment_dir / "model.ens"
+    fit_times_path = experiment_dir / "fit_times.json"
+
+    with experiment_lock(experiment_dir):
+        config = ExperimentConfig(**json.loads((experiment_dir / "config.json").read_text()))
+        history_path = history_file(experiment_dir)
+        if history_path is None:
+            raise ValueError(f"{experiment_dir.name} has no convergence history to find the best iteration in")
+        model = get_model_type(config.ml_model).load(model_path)
+        history = read_history(history_path)
+        before = {"fitted_estimators_before": model.fitted_estimators, "nbytes_before": model.compile().nbytes}
+        model.compact(history, quantize=quantize)
+
+        with publish(model_path) as tmp_path:
+            model.dump(tmp_path)
+
+        n_trees = model.fitted_estimators
+        history = {key: values[:n_trees] if values is not None else None for key, values in history.items()}
+        write_history(experiment_dir / HISTORY_FILE, history)
+        (experiment_dir / LEGACY_HISTORY_FILE).unlink(missing_ok=True)
+        if fit_times_path.exists():
+            fit_times = json.loads(fit_times_path.read_text())
+            fit_times["estimators"] = fit_times["estimators"][:n_trees]
+            write_text_atomic(fit_times_path, json.dumps(fit_times, indent=4))
+        ExperimentIndex(experiment_dir.parent).refresh(experiment_dir.name)
+
+    return {**before, "fitted_estimators": n_trees, "nbytes": model.compile().nbytes}
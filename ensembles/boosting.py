@@ -1,15 +1,34 @@
-import json
 from time import perf_counter
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
-import joblib
 import numpy as np
 import numpy.typing as npt
 from sklearn.tree import DecisionTreeRegressor
+from sklearn.tree._tree import Tree
 from sklearn.exceptions import NotFittedError
 
-from .utils import ConvergenceHistory, whether_to_stop, rmse
+from .compiled import CompiledEnsemble, as_tree_input, predict_tree
+from .histogram import TREE_PARAMS, BinMapper, HistogramTree
+from .serialization import append_model_file, load_legacy_trees, read_model_file, write_model_file
+from .utils import ConvergenceHistory, EarlyStopping, Scorer, best_iteration
+
+
+def _widen_tree(estimator: DecisionTreeRegressor, columns: npt.NDArray[np.int64], n_features: int) -> None:
+    """
+    Make a tree fitted on `X[:, columns]` split on the columns of the full `X` instead.
+
+    The node arrays are rebuilt through the tree's pickling state with the feature indices mapped back, so the
+    tree predicts, compiles and saves like any tree fitted on all `n_features` columns.
+    """
+    state = estimator.tree_.__getstate__()
+    nodes = state["nodes"].copy()
+    split = nodes["feature"] >= 0
+    nodes["feature"][split] = columns[nodes["feature"][split]]
+    tree = Tree(n_features, np.array([1], dtype=np.intp), 1)
+    tree.__setstate__({**state, "nodes": nodes})
+    estimator.tree_ = tree
+    estimator.n_features_in_ = n_features
 
 
 class GradientBoostingMSE:
@@ -20,6 +39,11 @@ class GradientBoostingMSE:
         n_estimators: int,
         tree_params: dict[str, Any] | None = None,
         learning_rate=0.1,
+        histogram: bool = False,
+        max_bins: int = 255,
+        subsample: float | None = None,
+        colsample_bytree: float | None = None,
+        random_state: int = 42,
     ) -> None:
         """
         Initializes the GradientBoostingMSE model.
@@ -30,19 +54,63 @@ class GradientBoostingMSE:
 
         Args:
             n_estimators (int): Number of trees to boost each other.
-            tree_params (dict[str, Any] | None, optional): Parameters for the decision trees. Defaults to None.
+            tree_params (dict[str, Any] | None, optional): Parameters for the decision trees. In histogram mode only `ensembles.histogram.TREE_PARAMS` are supported, and `min_samples_leaf` counts bootstrap-weighted samples, see `HistogramTree`. Defaults to None.
             learning_rate (float, optional): Scaling factor for the "gradient" step (the weight applied to each tree prediction). Defaults to 0.1.
+            histogram (bool, optional): Whether to quantize features into bins once and grow `HistogramTree`s from gradient histograms instead of exact-split sklearn trees. Defaults to False.
+            max_bins (int, optional): Maximum number of bins per feature in histogram mode. Defaults to 255.
+            subsample (float | None, optional): Fraction of objects every tree is fitted on, drawn without replacement (stochastic gradient boosting). Defaults to None (a bootstrap sample of the size of the training set).
+            colsample_bytree (float | None, optional): Fraction of features drawn without replacement for every tree, on top of the per-split `max_features` of `tree_params`. Defaults to None (all features).
+            random_state (int, optional): Seed from which per-tree seeds of the sample, the columns and the tree itself are derived. Defaults to 42.
+
+        Raises:
+            ValueError: If `histogram` is set and `tree_params` has parameters `HistogramTree` does not support.
         """
         self.n_estimators = n_estimators
         self.learning_rate = learning_rate
+        self.histogram = histogram
+        self.max_bins = max_bins
+        self.subsample = subsample
+        self.colsample_bytree = colsample_bytree
+        self.random_state = random_state
         if tree_params is None:
             tree_params = {}
+        unsupported = set(tree_params) - set(TREE_PARAMS)
+        if histogram and unsupported:
+            raise ValueError(
+                f"Histogram trees do not support {sorted(unsupported)}, only {list(TREE_PARAMS)}")
+        self.tree_params = tree_params
         self.forest = [
-            DecisionTreeRegressor(**tree_params) for _ in range(n_estimators)
+            self._make_tree() for _ in range(n_estimators)
         ]
         self.fitted_estimators = 0
+        self._compiled: CompiledEnsemble | None = None
+        # Leading trees known only as flat arrays, loaded from a model file.
+        self._base: CompiledEnsemble | None = None
+        self._saved_estimators = 0
         self.const_prediction = 0
 
+    def _make_tree(self) -> DecisionTreeRegressor | HistogramTree:
+        tree_type = HistogramTree if self.histogram else DecisionTreeRegressor
+        return tree_type(**self.tree_params)
+
+    def _draw_sample(self, weight: npt.NDArray[np.float64], rng: np.random.Generator) -> npt.NDArray[np.float64]:
+        # Objects of a tree are drawn as weights into `weight`, so trees are
+        # fitted on the full matrix instead of a fancy-indexed copy of it.
+        n_objects = weight.shape[0]
+        if self.subsample is None:
+            weight[:] = np.bincount(rng.integers(0, n_objects, n_objects), minlength=n_objects)
+        else:
+            weight.fill(0.0)
+            size = max(1, int(self.subsample * n_objects))
+            weight[rng.choice(n_objects, size, replace=False)] = 1.0
+        return weight
+
+    def _draw_columns(self, n_features: int, rng: np.random.Generator) -> npt.NDArray[np.int64] | None:
+        if self.colsample_bytree is None:
+            return None
+        size = max(1, int(self.colsample_bytree * n_features))
+        return np.sort(rng.choice(n_features, size, replace=False))
+
     def fit(
         self,
         X: npt.NDArray[np.float64],
@@ -51,6 +119,9 @@ class GradientBoostingMSE:
         y_val: npt.NDArray[np.float64] | None = None,
         trace: bool | None = None,
         patience: int | None = None,
+        callback: Callable[[ConvergenceHistory, list[float]], bool | None] | None = None,
+        warm_start: bool = False,
+        early_stopping: EarlyStopping | None = None,
     ) -> ConvergenceHistory | None:
         """
         Trains an ensemble of trees on the provided data.
@@ -61,41 +132,99 @@ class GradientBoostingMSE:
             X_val (npt.NDArray[np.float64] | None, optional): Validation set of objects, array of shape (n_val_objects, n_features). Defaults to None.
             y_val (npt.NDArray[np.float64] | None, optional): Validation set of labels, array of shape (n_val_objects,). Defaults to None.
             trace (bool | None, optional): Whether to calculate RMSE while training. True by default if validation data is provided. Defaults to None.
-            patience (int | None, optional): Number of training steps without decreasing the train loss (or validation if provided), after which to stop training. Defaults to None.
+            patience (int | None, optional): Number of training steps without decreasing the train loss (or validation if provided), after which to stop training. Shortcut for `early_stopping=EarlyStopping(patience)`. Defaults to None.
+            callback (Callable[[ConvergenceHistory, list[float]], bool | None] | None, optional): Called with the history and per-tree times after every fitted tree. Training stops if it returns True. Defaults to None.
+            warm_start (bool, optional): Whether to keep the fitted trees and `const_prediction` and add trees up to `n_estimators`, boosting the residuals of the current model. The history and times then cover the new trees only. Per-tree seeds derive from `random_state`, so the result is the same as fitting all the trees at once. Defaults to False.
+            early_stopping (EarlyStopping | None, optional): Tracker of the validation metrics (train metrics without validation data) that stops training when they stop improving. Its best iteration is kept after `fit`. Defaults to None.
 
         Returns:
             ConvergenceHistory | None: Instance of `ConvergenceHistory` if `trace=True` or if validation data is provided.
         """
-        np.random.seed(42)
         if y_val is not None:
             trace = True
         elif trace is None:
             trace = False
-        self.const_prediction = y.mean()
+
+        if early_stopping is None and patience is not None:
+            early_stopping = EarlyStopping(patience)
+        track = trace or early_stopping is not None
 
         times = list()
         history = ConvergenceHistory(train=[], val=[])
-        pred = np.ones((X.shape[0])) * self.const_prediction
 
+        weight = np.empty(y.shape[0])
+        seeds = np.random.RandomState(self.random_state).randint(
+            np.iinfo(np.int32).max, size=self.n_estimators)
+        first = self.fitted_estimators if warm_start else 0
+        if first:
+            pred = self.predict(X)
+            if y_val is not None:
+                val_pred = self.predict(X_val)
+        else:
+            self.fitted_estimators = 0
+            self._base = None
+            self._saved_estimators = 0
+            self.const_prediction = y.mean()
+            pred = np.ones((X.shape[0])) * self.const_prediction
+            if y_val is not None:
+                val_pred = np.ones((X_val.shape[0])) * self.const_prediction
+        self._compiled = None
+        self.forest.extend(self._make_tree() for _ in range(len(self.forest), self.n_estimators))
+
+        metrics = ("rmse",)
+        if early_stopping is not None:
+            metrics += tuple(name for name in early_stopping.metrics if name != "rmse")
+        train_scorer = Scorer(y, metrics if y_val is None else ("rmse",))
         if y_val is not None:
-            val_pred = np.ones((X_val.shape[0])) * self.const_prediction
-        for epoch, estimator in enumerate(self.forest):
-            idx = np.random.choice(
-                np.arange(y.shape[0]), y.shape[0], replace=True)
-            grad = y - pred
+            val_scorer = Scorer(y_val, metrics)
+            X_val_tree = as_tree_input(X_val)
+
+        grad = np.empty_like(pred)
+        if self.histogram:
+            bin_mapper = BinMapper(self.max_bins).fit(X)
+            binned = bin_mapper.transform(X)
+        else:
+            X_tree = as_tree_input(X)
+        for estimator, seed in zip(self.forest[first:self.n_estimators], seeds[first:]):
+            rng = np.random.default_rng(seed)
+            self._draw_sample(weight, rng)
+            columns = self._draw_columns(X.shape[1], rng)
+            if estimator.random_state is None:
+                estimator.random_state = seed
+            np.subtract(y, pred, out=grad)
 
             start = perf_counter()
-            estimator.fit(X[idx], grad[idx])
+            if self.histogram:
+                # Histogram trees report the leaf of every training object,
+                # so their training predictions are a lookup, not a traversal.
+                leaves = estimator.fit_binned(binned, grad, weight, bin_mapper, features=columns)
+                tree_pred = estimator.tree_.value[leaves, 0, 0]
+            elif columns is None:
+                estimator.fit(X_tree, grad, sample_weight=weight)
+                tree_pred = predict_tree(estimator, X_tree)
+            else:
+                # Only the drawn columns are copied, and the tree is mapped
+                # back onto all of them.
+                estimator.fit(X_tree[:, columns], grad, sample_weight=weight)
+                _widen_tree(estimator, columns, X_tree.shape[1])
+                tree_pred = predict_tree(estimator, X_tree)
             self.fitted_estimators += 1
-            pred += self.learning_rate * estimator.predict(X)
+            pred += self.learning_rate * tree_pred
             times.append(perf_counter() - start)
-            history['train'].append(rmse(y, pred))
+            if track:
+                scores = train_scorer(pred)
+                history['train'].append(scores['rmse'])
 
+            # Validation scores, when there are any, replace the train ones
+            # for early stopping.
             if y_val is not None:
-                val_pred += self.learning_rate * estimator.predict(X_val)
-                history['val'].append(rmse(y_val, val_pred))
+                val_pred += self.learning_rate * predict_tree(estimator, X_val_tree)
+                scores = val_scorer(val_pred)
+                history['val'].append(scores['rmse'])
 
-            if patience is not None and whether_to_stop(history, patience):
+            if early_stopping is not None and early_stopping.update(scores):
+                break
+            if callback is not None and callback(history, times):
                 break
 
         if trace:
@@ -103,7 +232,7 @@ class GradientBoostingMSE:
         else:
             return None
 
-    def predict(self, X: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    def predict(self, X: npt.NDArray[np.float64], n_trees: int | None = None) -> npt.NDArray[np.float64]:
         """
         Makes predictions with the ensemble of trees.
 
@@ -111,65 +240,162 @@ class GradientBoostingMSE:
 
         Args:
             X (npt.NDArray[np.float64]): Objects' features matrix, array of shape (n_objects, n_features).
+            n_trees (int | None, optional): Number of leading trees to add up, from 1 to `fitted_estimators`. Defaults to None (all fitted trees).
 
         Returns:
             npt.NDArray[np.float64]: Predicted values, array of shape (n_objects,).
+
+        Raises:
+            ValueError: If `n_trees` is out of range.
         """
         if self.fitted_estimators == 0:
             raise NotFittedError
+        if n_trees is None:
+            n_trees = self.fitted_estimators
+        if not 1 <= n_trees <= self.fitted_estimators:
+            raise ValueError(f"n_trees must be between 1 and {self.fitted_estimators}, got {n_trees}")
+        if self._compiled is None and self._base is not None:
+            self._compiled = self.compile()
+        if self._compiled is not None:
+            return self._compiled.predict(X, n_trees=n_trees)
 
         predictions = np.ones((X.shape[0])) * self.const_prediction
-        for i in range(self.fitted_estimators):
+        for i in range(n_trees):
             predictions += self.learning_rate * self.forest[i].predict(X)
 
         return predictions
 
-    def dump(self, dirpath: str) -> None:
+    def staged_predict(self, X: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
         """
-        Saves the model to the specified directory.
+        Makes predictions of every prefix of the ensemble.
+
+        Column `k` is the prediction after `k + 1` boosting steps, exactly what `predict(X, n_trees=k + 1)` gives. The trees are walked once for all the stages.
 
         Args:
-            dirpath (str): Path to the directory where the model will be saved.
+            X (npt.NDArray[np.float64]): Objects' features matrix, array of shape (n_objects, n_features).
+
+        Returns:
+            npt.NDArray[np.float64]: Predicted values, array of shape (n_objects, fitted_estimators).
+        """
+        return self.compile().staged_predict(X)
+
+    def compile(self) -> CompiledEnsemble:
         """
-        path = Path(dirpath)
-        path.mkdir(parents=True)
+        Packs the fitted trees into a flat-array predictor.
 
+        The predictor walks all trees at once over a batch of objects and gives exactly the same result as `predict`.
+
+        Returns:
+            CompiledEnsemble: Predictor with the same `predict` signature.
+        """
+        if self.fitted_estimators == 0:
+            raise NotFittedError
+        if self._compiled is not None:
+            return self._compiled
+
+        parts = [] if self._base is None else [self._base]
+        n_base = 0 if self._base is None else self._base.n_trees
+        if self.fitted_estimators > n_base:
+            parts.append(CompiledEnsemble.from_trees(
+                self.forest[n_base:self.fitted_estimators],
+                aggregation="sum",
+                bias=self.const_prediction,
+                scale=self.learning_rate,
+            ))
+        return parts[0] if len(parts) == 1 else CompiledEnsemble.concatenate(parts)
+
+    def compact(self, history: ConvergenceHistory | None = None, quantize: bool = True) -> None:
+        """
+        Compacts the fitted ensemble for serving.
+
+        Boosting overfits past some number of steps, so the trees after the lowest validation error in `history` are dropped, and so are the unfitted ones. The remaining trees are frozen into flat arrays with identical subtrees merged, see `CompiledEnsemble.compact`. The next `dump` rewrites the whole file.
+
+        Args:
+            history (ConvergenceHistory | None, optional): History returned by `fit`. Defaults to None (keep all fitted trees).
+            quantize (bool, optional): Whether to store thresholds and leaf values as float32. Defaults to True.
+        """
+        if self.fitted_estimators == 0:
+            raise NotFittedError
+        n_trees = self.fitted_estimators
+        if history is not None:
+            n_trees = min(best_iteration(history) or n_trees, n_trees)
+
+        compiled = self.compile().compact(n_trees, quantize=quantize)
+        self.fitted_estimators = n_trees
+        del self.forest[n_trees:]
+        self._base = self._compiled = compiled
+        self._saved_estimators = 0
+
+    def dump(self, path: str, append: bool = False) -> None:
+        """
+        Saves the model into a single binary file.
+
+        The file holds the flattened node arrays of the fitted trees only, see `ensembles.serialization`.
+
+        Args:
+            path (str): Path of the file where the model will be saved.
+            append (bool, optional): Whether to only append the trees fitted since the model was loaded from or
+                last saved to `path`, which must then hold that model. Defaults to False.
+        """
         params = {
             "n_estimators": self.n_estimators,
+            "tree_params": self.tree_params,
             "learning_rate": self.learning_rate,
+            "histogram": self.histogram,
+            "max_bins": self.max_bins,
+            "subsample": self.subsample,
+            "colsample_bytree": self.colsample_bytree,
+            "random_state": self.random_state,
             "const_prediction": self.const_prediction,
             "fitted_estimators": self.fitted_estimators
         }
-        with (path / "params.json").open("w") as file:
-            json.dump(params, file, indent=4)
-
-        trees_path = path / "trees"
-        trees_path.mkdir()
-        for i, tree in enumerate(self.forest):
-            joblib.dump(tree, trees_path / f"tree_{i:04d}.joblib")
+        if append and self._saved_estimators:
+            new_trees = CompiledEnsemble.from_trees(
+                self.forest[self._saved_estimators:self.fitted_estimators],
+                aggregation="sum",
+                scale=self.learning_rate,
+            )
+            append_model_file(path, type(self).__name__, params, new_trees)
+        else:
+            write_model_file(path, type(self).__name__, params, self.compile())
+        self._saved_estimators = self.fitted_estimators
 
     @classmethod
-    def load(cls, dirpath: str) -> "GradientBoostingMSE":
+    def load(cls, path: str, mmap: bool = False) -> "GradientBoostingMSE":
         """
-        Loads the model from the specified directory.
+        Loads the model from the specified file.
+
+        Models saved in the former directory layout (`params.json` plus one joblib file per tree) are loaded too.
 
         Args:
-            dirpath (str): Path to the directory where the model is saved.
+            path (str): Path to the model file or to the legacy model directory.
+            mmap (bool, optional): Whether to memory-map the node arrays instead of reading them. Defaults to False.
 
         Returns:
             GradientBoostingMSE: An instance of the GradientBoostingMSE model.
         """
-        with (Path(dirpath) / "params.json").open() as file:
-            params = json.load(file)
-        instance = cls(params["n_estimators"],
-                       learning_rate=params["learning_rate"])
-
-        trees_path = Path(dirpath) / "trees"
+        if Path(path).is_dir():
+            params, trees = load_legacy_trees(path)
+            compiled = None
+        else:
+            model, params, compiled = read_model_file(path, mmap=mmap)
+            if model != cls.__name__:
+                raise ValueError(f"{path} holds a {model} model")
+            trees = []
 
-        instance.forest = [
-            joblib.load(trees_path / f"tree_{i:04d}.joblib")
-            for i in range(params["n_estimators"])
-        ]
+        instance = cls(params["n_estimators"],
+                       tree_params=params.get("tree_params"),
+                       learning_rate=params["learning_rate"],
+                       histogram=params.get("histogram", False),
+                       max_bins=params.get("max_bins", 255),
+                       subsample=params.get("subsample"),
+                       colsample_bytree=params.get("colsample_bytree"),
+                       random_state=params.get("random_state", 42))
+        instance.forest[:len(trees)] = trees
+        instance._compiled = compiled
+        instance._base = compiled
+        if compiled is not None:
+            instance._saved_estimators = params["fitted_estimators"]
         instance.const_prediction = params["const_prediction"]
         instance.fitted_estimators = params["fitted_estimators"]
 
@@ -0,0 +1,373 @@
+from typing import TYPE_CHECKING, Iterator, Literal, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+if TYPE_CHECKING:
+    from sklearn.tree import DecisionTreeRegressor
+
+
+Aggregation = Literal["mean", "sum"]
+NODE_ARRAYS = ("feature", "threshold", "children", "missing_go_to_left", "value", "roots")
+
+
+def as_tree_input(X: npt.NDArray[np.float64]) -> npt.NDArray[np.float32]:
+    """
+    Convert features once into the C-contiguous float32 array that scikit-learn trees work with.
+
+    Fitting and predicting on the converted array skips the per-call conversion and copy.
+    """
+    return np.ascontiguousarray(X, dtype=np.float32)
+
+
+def predict_tree(tree: "DecisionTreeRegressor", X: npt.NDArray[np.float32]) -> npt.NDArray[np.float64]:
+    """
+    Predict with a single fitted tree without input validation.
+
+    Args:
+        tree (DecisionTreeRegressor): Fitted scikit-learn tree or `HistogramTree`.
+        X (npt.NDArray[np.float32]): Features prepared by `as_tree_input`, array of shape (n_objects, n_features).
+
+    Returns:
+        npt.NDArray[np.float64]: Predicted values, array of shape (n_objects,), same as `tree.predict(X)`.
+    """
+    # Only scikit-learn trees have a `tree_` that predicts, histogram trees
+    # predict with their own compiled arrays.
+    if hasattr(tree.tree_, "predict"):
+        return tree.tree_.predict(X)[:, 0]
+    return tree.predict(X)
+
+
+class CompiledEnsemble:
+    def __init__(
+        self,
+        feature: npt.NDArray[np.int64],
+        threshold: npt.NDArray[np.float64],
+        children: npt.NDArray[np.int64],
+        missing_go_to_left: npt.NDArray[np.uint8],
+        value: npt.NDArray[np.float64],
+        roots: npt.NDArray[np.int64],
+        max_depth: int,
+        n_features: int,
+        aggregation: Aggregation,
+        bias: float = 0.0,
+        scale: float = 1.0,
+    ) -> None:
+        """
+        Flat-array predictor for an ensemble of fitted regression trees.
+
+        Nodes of all trees are packed into the same contiguous arrays, tree `i` starting at node `roots[i]`.
+        Children indices are global, and leaves point to themselves, so every tree of a batch can be walked
+        `max_depth` steps at once without tracking which samples already reached a leaf.
+
+        Args:
+            feature (npt.NDArray[np.int64]): Split feature of every node, array of shape (n_nodes,).
+            threshold (npt.NDArray[np.float64]): Split threshold of every node, array of shape (n_nodes,).
+            children (npt.NDArray[np.int64]): Global indices of the left and the right child, array of shape
+                (n_nodes, 2).
+            missing_go_to_left (npt.NDArray[np.uint8]): Whether NaN values go to the left child, array of shape (n_nodes,).
+            value (npt.NDArray[np.float64]): Prediction stored in every node, array of shape (n_nodes,).
+            roots (npt.NDArray[np.int64]): Index of the root node of every tree, array of shape (n_trees,).
+            max_depth (int): Depth of the deepest tree.
+            n_features (int): Number of features the trees were fitted on.
+            aggregation (Aggregation): `"mean"` averages tree predictions (random forest), `"sum"` adds them up
+                sequentially (gradient boosting).
+            bias (float, optional): Constant added to the sum of tree predictions. Defaults to 0.0.
+            scale (float, optional): Weight of every tree prediction in the sum. Defaults to 1.0.
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_go_to_left = missing_go_to_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+        self.aggregation = aggregation
+        self.bias = bias
+        self.scale = scale
+
+    @classmethod
+    def from_trees(
+        cls,
+        trees: Sequence["DecisionTreeRegressor"],
+        aggregation: Aggregation,
+        bias: float = 0.0,
+        scale: float = 1.0,
+    ) -> "CompiledEnsemble":
+        """
+        Pack the `tree_` arrays of fitted trees into one flat predictor.
+
+        Args:
+            trees (Sequence[DecisionTreeRegressor]): Fitted trees in ensemble order.
+            aggregation (Aggregation): How tree predictions are combined, see `CompiledEnsemble`.
+            bias (float, optional): Constant added to the sum of tree predictions. Defaults to 0.0.
+            scale (float, optional): Weight of every tree prediction in the sum. Defaults to 1.0.
+
+        Returns:
+            CompiledEnsemble: Predictor equivalent to the given trees.
+        """
+        node_counts = np.array([tree.tree_.node_count for tree in trees], dtype=np.int64)
+        roots = np.zeros(len(trees), dtype=np.int64)
+        np.cumsum(node_counts[:-1], out=roots[1:])
+
+        n_nodes = int(node_counts.sum())
+        feature = np.empty(n_nodes, dtype=np.int64)
+        threshold = np.empty(n_nodes, dtype=np.float64)
+        children = np.empty((n_nodes, 2), dtype=np.int64)
+        missing_go_to_left = np.zeros(n_nodes, dtype=np.uint8)
+        value = np.empty(n_nodes, dtype=np.float64)
+
+        for tree, root, count in zip(trees, roots, node_counts):
+            nodes = slice(root, root + count)
+            tree_ = tree.tree_
+            own = np.arange(root, root + count)
+            is_leaf = tree_.children_left == -1
+
+            feature[nodes] = np.where(is_leaf, 0, tree_.feature)
+            threshold[nodes] = np.where(is_leaf, np.inf, tree_.threshold)
+            children[nodes, 0] = np.where(is_leaf, own, tree_.children_left + root)
+            children[nodes, 1] = np.where(is_leaf, own, tree_.children_right + root)
+            if hasattr(tree_, "missing_go_to_left"):
+                missing_go_to_left[nodes] = tree_.missing_go_to_left
+            value[nodes] = tree_.value[:, 0, 0]
+
+        return cls(
+            feature=feature,
+            threshold=threshold,
+            children=children,
+            missing_go_to_left=missing_go_to_left,
+            value=value,
+            roots=roots,
+            max_depth=max((tree.tree_.max_depth for tree in trees), default=0),
+            n_features=trees[0].n_features_in_ if len(trees) else 0,
+            aggregation=aggregation,
+            bias=bias,
+            scale=scale,
+        )
+
+    @classmethod
+    def concatenate(cls, parts: Sequence["CompiledEnsemble"]) -> "CompiledEnsemble":
+        """
+        Join predictors into one holding the trees of all of them in order.
+
+        Aggregation, bias, scale and the number of features are taken from the first predictor.
+
+        Args:
+            parts (Sequence[CompiledEnsemble]): Predictors of consecutive parts of the same ensemble.
+
+        Returns:
+            CompiledEnsemble: Predictor of the whole ensemble.
+        """
+        offsets = np.cumsum([0] + [len(part.value) for part in parts[:-1]])
+        return cls(
+            feature=np.concatenate([part.feature for part in parts]),
+            threshold=np.concatenate([part.threshold for part in parts]),
+            children=np.concatenate([part.children + offset for part, offset in zip(parts, offsets)]),
+            missing_go_to_left=np.concatenate([part.missing_go_to_left for part in parts]),
+            value=np.concatenate([part.value for part in parts]),
+            roots=np.concatenate([part.roots + offset for part, offset in zip(parts, offsets)]),
+            max_depth=max(part.max_depth for part in parts),
+            n_features=parts[0].n_features,
+            aggregation=parts[0].aggregation,
+            bias=parts[0].bias,
+            scale=parts[0].scale,
+        )
+
+    def compact(self, n_trees: int | None = None, quantize: bool = False) -> "CompiledEnsemble":
+        """
+        Build a smaller predictor of the leading trees.
+
+        Nodes not reachable from the kept trees are dropped, and identical subtrees, within a tree or across trees,
+        are stored once. Subtrees are matched bottom-up, level by level of node height, so the children of a node
+        are already merged when its own key is compared. Node indices shrink to int32 when they fit.
+
+        With `quantize`, thresholds and leaf values are stored as float32. Features are compared in float32 anyway,
+        and thresholds are rounded down, so every object takes the same path; leaf values lose precision beyond
+        about 7 significant digits.
+
+        Args:
+            n_trees (int | None, optional): Number of leading trees to keep. Defaults to None (all of them).
+            quantize (bool, optional): Whether to store thresholds and leaf values as float32. Defaults to False.
+
+        Returns:
+            CompiledEnsemble: Predictor giving the same predictions as the first `n_trees` trees, up to the
+                rounding of leaf values if `quantize` is set.
+        """
+        roots = self.roots[:n_trees]
+        n_nodes = len(self.value)
+        children = self.children
+        is_leaf = children[:, 0] == np.arange(n_nodes)
+
+        reachable = np.zeros(n_nodes, dtype=bool)
+        frontier = np.unique(roots)
+        while frontier.size:
+            reachable[frontier] = True
+            frontier = np.unique(children[frontier])
+            frontier = frontier[~reachable[frontier]]
+
+        height = np.zeros(n_nodes, dtype=np.int64)
+        for _ in range(self.max_depth):
+            height = np.where(is_leaf, 0, 1 + np.maximum(height[children[:, 0]], height[children[:, 1]]))
+
+        threshold = self.threshold
+        value = self.value
+        if quantize:
+            threshold = threshold.astype(np.float32)
+            rounded_up = threshold > self.threshold
+            threshold[rounded_up] = np.nextafter(threshold[rounded_up], np.float32(-np.inf))
+            value = value.astype(np.float32)
+        threshold_bits = threshold.view(np.int64 if threshold.itemsize == 8 else np.int32).astype(np.int64)
+        value_bits = value.view(np.int64 if value.itemsize == 8 else np.int32).astype(np.int64)
+
+        new_index = np.full(n_nodes, -1, dtype=np.int64)
+        kept = []
+        n_kept = 0
+        nodes = np.flatnonzero(reachable)
+        for level in range(int(height[nodes].max()) + 1):
+            level_nodes = nodes[height[nodes] == level]
+            if level == 0:
+                keys = value_bits[level_nodes, None]
+            else:
+                keys = np.column_stack([
+                    self.feature[level_nodes],
+                    threshold_bits[level_nodes],
+                    self.missing_go_to_left[level_nodes],
+                    new_index[children[level_nodes, 0]],
+                    new_index[children[level_nodes, 1]],
+                ])
+            _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+            new_index[level_nodes] = n_kept + inverse.ravel()
+            kept.append(level_nodes[first])
+            n_kept += len(first)
+        kept = np.concatenate(kept)
+
+        # `apply` indexes the flattened children with 2 * node + 1.
+        index_dtype = np.int32 if 2 * n_kept + 1 <= np.iinfo(np.int32).max else np.int64
+        return type(self)(
+            feature=self.feature[kept].astype(index_dtype),
+            threshold=threshold[kept],
+            children=new_index[children[kept]].astype(index_dtype),
+            missing_go_to_left=self.missing_go_to_left[kept],
+            value=value[kept],
+            roots=new_index[roots].astype(index_dtype),
+            max_depth=int(height[roots].max()),
+            n_features=self.n_features,
+            aggregation=self.aggregation,
+            bias=self.bias,
+            scale=self.scale,
+        )
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in NODE_ARRAYS)
+
+    def apply(self, X: npt.NDArray[np.float32], n_trees: int | None = None) -> npt.NDArray[np.int64]:
+        """
+        Find the leaf every object falls into in every tree.
+
+        As in scikit-learn, features are compared in float32, so `X` is expected to be float32 already.
+
+        Args:
+            X (npt.NDArray[np.float32]): Objects' features matrix, array of shape (n_objects, n_features).
+            n_trees (int | None, optional): Number of leading trees to walk. Defaults to None (all of them).
+
+        Returns:
+            npt.NDArray[np.int64]: Global leaf indices, array of shape (n_objects, n_trees).
+        """
+        flat = X.ravel()
+        children = self.children.ravel()
+        offsets = (np.arange(X.shape[0]) * X.shape[1])[:, None]
+        has_nan = bool(np.isnan(flat).any())
+
+        node = np.repeat(self.roots[None, :n_trees], X.shape[0], axis=0)
+        for _ in range(self.max_depth):
+            x = flat[offsets + self.feature[node]]
+            go_right = ~(x <= self.threshold[node])
+            if has_nan:
+                go_right &= ~(np.isnan(x) & self.missing_go_to_left[node].astype(bool))
+            node = children[2 * node + go_right]
+
+        return node
+
+    def predict(
+        self, X: npt.NDArray[np.float64], chunk_size: int | None = None, n_trees: int | None = None
+    ) -> npt.NDArray[np.float64]:
+        """
+        Make prediction with all trees of the ensemble, or with its leading trees.
+
+        Gives exactly the same result as `predict` of the model the predictor was compiled from.
+
+        Args:
+            X (npt.NDArray[np.float64]): Objects' features matrix, array of shape (n_objects, n_features).
+            chunk_size (int | None, optional): Number of objects walked through the trees at once. By default
+                chosen so that a chunk holds about 65 thousand (object, tree) pairs. Defaults to None.
+            n_trees (int | None, optional): Number of leading trees to predict with. Defaults to None (all of them).
+
+        Returns:
+            npt.NDArray[np.float64]: Predicted values, array of shape (n_objects,).
+        """
+        predictions = np.empty(X.shape[0])
+        for rows, values in self._leaf_values(X, chunk_size, n_trees):
+            predictions[rows] = self._aggregate(values)
+        return predictions
+
+    def staged_predict(
+        self, X: npt.NDArray[np.float64], chunk_size: int | None = None
+    ) -> npt.NDArray[np.float64]:
+        """
+        Make predictions of every prefix of the ensemble in a single traversal.
+
+        Column `k` holds the prediction of the first `k + 1` trees, accumulated the way `fit` accumulates them.
+        Boosting columns equal `predict(X, n_trees=k + 1)` exactly, forest columns up to rounding.
+
+        Args:
+            X (npt.NDArray[np.float64]): Objects' features matrix, array of shape (n_objects, n_features).
+            chunk_size (int | None, optional): See `predict`. Defaults to None.
+
+        Returns:
+            npt.NDArray[np.float64]: Predicted values, array of shape (n_objects, n_trees).
+        """
+        predictions = np.empty((X.shape[0], self.n_trees))
+        for rows, values in self._leaf_values(X, chunk_size):
+            if self.aggregation == "mean":
+                predictions[rows] = np.cumsum(values, axis=1) / np.arange(1, values.shape[1] + 1)
+            else:
+                # The bias goes first, so the running sums are the same
+                # additions `_aggregate` makes.
+                bias = np.full((values.shape[0], 1), float(self.bias))
+                predictions[rows] = np.cumsum(np.hstack([bias, self.scale * values]), axis=1)[:, 1:]
+        return predictions
+
+    def _leaf_values(
+        self, X: npt.NDArray[np.float64], chunk_size: int | None, n_trees: int | None = None
+    ) -> Iterator[tuple[slice, npt.NDArray[np.float64]]]:
+        X = as_tree_input(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(
+                f"X has shape {X.shape}, but the ensemble expects {self.n_features} features"
+            )
+        if n_trees is not None and not 1 <= n_trees <= self.n_trees:
+            raise ValueError(f"n_trees must be between 1 and {self.n_trees}, got {n_trees}")
+        if chunk_size is None:
+            chunk_size = max(1, 2**16 // max(1, n_trees or self.n_trees))
+
+        for start in range(0, X.shape[0], chunk_size):
+            rows = slice(start, start + chunk_size)
+            yield rows, self.value[self.apply(X[rows], n_trees)].astype(np.float64, copy=False)
+
+    def _aggregate(self, values: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        if self.aggregation == "mean":
+            return np.mean(values, axis=1)
+
+        # Boosting adds trees one by one, and float addition is not associative,
+        # so a pairwise `sum` would not reproduce the model's output bit for bit.
+        result = np.ones(values.shape[0]) * self.bias
+        scaled = self.scale * values
+        for i in range(values.shape[1]):
+            result += scaled[:, i]
+        return result
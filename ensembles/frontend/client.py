@@ -1,22 +1,70 @@
-from typing import Any
+import time
+from collections import OrderedDict
+from typing import Any, Callable
 
+import numpy as np
 import numpy.typing as npt
 import requests
 
-from ensembles.backend.schemas import ExperimentConfig, ConvergenceHistoryResponse
+from ensembles.backend.schemas import (
+    ExperimentConfig,
+    ExperimentListResponse,
+    ExperimentRecord,
+    ConvergenceHistoryResponse,
+    CompactionResponse,
+    SweepConfig,
+    SweepResponse,
+    TrainingJobResponse
+)
 
 
 class Client:
-    def __init__(self, base_url: str) -> None:
+    def __init__(self, base_url: str, cache_size: int = 128) -> None:
         """
         Initializes the Client with a base URL for the API.
 
+        Responses of the read endpoints are kept with their `ETag` and revalidated with `If-None-Match` on every
+        request, so a resource that did not change costs a 304 Not Modified without a body.
+
         Args:
             base_url (str): The base URL of the API.
+            cache_size (int, optional): Number of responses to keep. Defaults to 128.
         """
 
         self.base_url = base_url
         self.session = requests.Session()
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple, tuple[str, Any]] = OrderedDict()
+
+    def _get_json(self, path: str, params: dict[str, Any] | None = None) -> Any:
+        """
+        GETs a read endpoint, revalidating the cached response to it if there is one.
+
+        Args:
+            path (str): Path of the endpoint.
+            params (dict[str, Any] | None, optional): Query parameters. Defaults to None.
+
+        Returns:
+            Any: The decoded JSON body, the cached one if the server answered 304.
+        """
+
+        key = (path, tuple(sorted((params or {}).items())))
+        cached = self._cache.get(key)
+        headers = {"If-None-Match": cached[0]} if cached is not None else {}
+        response = self.session.get(f"{self.base_url}{path}", params=params, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            self._cache.move_to_end(key)
+            return cached[1]
+        response.raise_for_status()
+
+        body = response.json()
+        etag = response.headers.get("ETag")
+        if etag is not None and self.cache_size > 0:
+            self._cache[key] = (etag, body)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return body
 
     def get_names(self) -> list[str]:
         """
@@ -26,9 +74,48 @@ class Client:
             list[str]: A list of experiment names.
         """
 
-        response = self.session.get(f"{self.base_url}/existing_experiments/")
-        response.raise_for_status()
-        return response.json()["experiment_names"]
+        return self._get_json("/existing_experiments/")["experiment_names"]
+
+    def list_experiments(
+        self,
+        offset: int = 0,
+        limit: int | None = None,
+        ml_model: str | None = None,
+        status: str | None = None,
+        prefix: str | None = None,
+        order_by: str = "name",
+    ) -> ExperimentListResponse:
+        """
+        Retrieves a page of the experiments matching the filters with their configs and best scores.
+
+        Args:
+            offset (int, optional): Number of matching experiments to skip. Defaults to 0.
+            limit (int | None, optional): Maximum number of experiments to return. Defaults to None (all).
+            ml_model (str | None, optional): Only experiments of this model. Defaults to None.
+            status (str | None, optional): Only "registered" or only "trained" experiments. Defaults to None.
+            prefix (str | None, optional): Only experiments whose name starts with it. Defaults to None.
+            order_by (str, optional): "name", "created_at" or "best_score". Defaults to "name".
+
+        Returns:
+            ExperimentListResponse: Number of matching experiments and the page of them.
+        """
+
+        params = {"offset": offset, "limit": limit, "ml_model": ml_model, "status": status, "prefix": prefix,
+                  "order_by": order_by}
+        return ExperimentListResponse(**self._get_json("/experiments/", params))
+
+    def get_experiment(self, experiment_name) -> ExperimentRecord:
+        """
+        Retrieves the config, status and best score of an experiment.
+
+        Args:
+            experiment_name (Any): The name of the experiment.
+
+        Returns:
+            ExperimentRecord: The experiment, `updated_at` changes whenever its trained model does.
+        """
+
+        return ExperimentRecord(**self._get_json(f"/experiments/{experiment_name}"))
 
     def register_experiment(self, experiment_config, train_file) -> None:
         """
@@ -57,12 +144,8 @@ class Client:
             ExperimentConfig: The configuration of the experiment.
         """
 
-        response = self.session.get(
-            f"{self.base_url}/load_experiment_config/",
-            params={'experiment_name': experiment_name}
-        )
-        response.raise_for_status()
-        return ExperimentConfig(**response.json())
+        return ExperimentConfig(
+            **self._get_json("/load_experiment_config/", {'experiment_name': experiment_name}))
 
     def is_training_needed(self, experiment_name) -> bool:
         """
@@ -75,61 +158,239 @@ class Client:
             bool: indicator was the model ever trained.
         """
 
-        response = self.session.get(
-            f"{self.base_url}/needs_training/",
-            params={'experiment_name': experiment_name}
-        )
-        response.raise_for_status()
-        return response.json()['flag']
+        return self._get_json("/needs_training/", {'experiment_name': experiment_name})['response']
 
-    def train_model(self, experiment_name) -> None:
+    def submit_training(
+        self, experiment_name, warm_start: bool = False, n_estimators: int | None = None
+    ) -> TrainingJobResponse:
         """
-        Trains the model for the specified experiment.
+        Starts training of the model for the specified experiment in the background.
 
         Args:
             experiment_name (Any): The name of the experiment.
+            warm_start (bool, optional): Whether to add trees to the trained model instead of training it from
+                scratch. Defaults to False.
+            n_estimators (int | None, optional): New number of trees of the experiment. Defaults to None
+                (unchanged).
+
+        Returns:
+            TrainingJobResponse: Initial status of the training job.
         """
 
+        params = {'experiment_name': experiment_name, 'warm_start': warm_start}
+        if n_estimators is not None:
+            params['n_estimators'] = n_estimators
         response = self.session.put(
             f"{self.base_url}/train_model/",
-            params={'experiment_name': experiment_name}
+            params=params
         )
         response.raise_for_status()
+        return TrainingJobResponse(**response.json())
 
-    def get_convergence_history(self, experiment_name) -> ConvergenceHistoryResponse:
+    def get_job(self, job_id) -> TrainingJobResponse:
         """
-        Retrieves the convergence history of the specified experiment.
+        Retrieves the status of a training job.
+
+        Args:
+            job_id (str): The identifier of the job.
+
+        Returns:
+            TrainingJobResponse: Current status of the job.
+        """
+
+        return TrainingJobResponse(**self._get_json(f"/jobs/{job_id}"))
+
+    def cancel_job(self, job_id) -> TrainingJobResponse:
+        """
+        Cancels a training job.
+
+        Args:
+            job_id (str): The identifier of the job.
+
+        Returns:
+            TrainingJobResponse: Status of the job after the cancellation request.
+        """
+
+        response = self.session.delete(f"{self.base_url}/jobs/{job_id}")
+        response.raise_for_status()
+        return TrainingJobResponse(**response.json())
+
+    def train_model(
+        self,
+        experiment_name,
+        poll_interval: float = 1.0,
+        on_progress: Callable[[TrainingJobResponse], None] | None = None,
+        warm_start: bool = False,
+        n_estimators: int | None = None,
+    ) -> TrainingJobResponse:
+        """
+        Trains the model for the specified experiment, polling the training job until it finishes.
 
         Args:
             experiment_name (Any): The name of the experiment.
+            poll_interval (float, optional): Seconds between status requests. Defaults to 1.0.
+            on_progress (Callable[[TrainingJobResponse], None] | None, optional): Called with every polled status.
+                Defaults to None.
+            warm_start (bool, optional): See `submit_training`. Defaults to False.
+            n_estimators (int | None, optional): See `submit_training`. Defaults to None.
 
         Returns:
-            ConvergenceHistory: The convergence history of the experiment.
+            TrainingJobResponse: Final status of the job.
         """
 
-        response = self.session.get(
-            f"{self.base_url}/get_convergence_history/",
-            params={'experiment_name': experiment_name}
+        job = self.submit_training(experiment_name, warm_start, n_estimators)
+        while job.status in ("queued", "running"):
+            time.sleep(poll_interval)
+            job = self.get_job(job.job_id)
+            if on_progress is not None:
+                on_progress(job)
+        return job
+
+    def compact_model(self, experiment_name, quantize: bool = True) -> CompactionResponse:
+        """
+        Cuts the trained model of the specified experiment at its best validation iteration and compacts it.
+
+        Args:
+            experiment_name (Any): The name of the experiment.
+            quantize (bool, optional): Whether to store thresholds and leaf values as float32. Defaults to True.
+
+        Returns:
+            CompactionResponse: Number of trees and model size before and after compaction.
+        """
+
+        response = self.session.post(
+            f"{self.base_url}/compact_model/",
+            params={'experiment_name': experiment_name, 'quantize': quantize}
         )
         response.raise_for_status()
-        return ConvergenceHistoryResponse(**response.json())
+        return CompactionResponse(**response.json())
+
+    def submit_sweep(self, sweep_config: SweepConfig, train_file) -> SweepResponse:
+        """
+        Starts a hyperparameter sweep over the given training data in the background.
+
+        Args:
+            sweep_config (SweepConfig): The model and the values of its hyperparameters to try.
+            train_file (Any): The training data file.
+
+        Returns:
+            SweepResponse: Initial status of the sweep.
+        """
+
+        response = self.session.post(
+            f"{self.base_url}/sweeps/",
+            data={"sweep_config": sweep_config.model_dump_json()},
+            files={"train_file": train_file}
+        )
+        response.raise_for_status()
+        return SweepResponse(**response.json())
+
+    def get_sweep(self, sweep_id) -> SweepResponse:
+        """
+        Retrieves the status and the leaderboard of a sweep.
+
+        Args:
+            sweep_id (str): The identifier of the sweep.
+
+        Returns:
+            SweepResponse: Current status of the sweep with its trials, the best first.
+        """
+
+        return SweepResponse(**self._get_json(f"/sweeps/{sweep_id}"))
+
+    def cancel_sweep(self, sweep_id) -> SweepResponse:
+        """
+        Cancels a sweep, keeping the trials fitted so far.
+
+        Args:
+            sweep_id (str): The identifier of the sweep.
+
+        Returns:
+            SweepResponse: Status of the sweep after the cancellation request.
+        """
+
+        response = self.session.delete(f"{self.base_url}/sweeps/{sweep_id}")
+        response.raise_for_status()
+        return SweepResponse(**response.json())
 
-    def predict(self, experiment_name, test_file) -> npt.NDArray[Any]:
+    def run_sweep(
+        self,
+        sweep_config: SweepConfig,
+        train_file,
+        poll_interval: float = 1.0,
+        on_progress: Callable[[SweepResponse], None] | None = None,
+    ) -> SweepResponse:
+        """
+        Runs a hyperparameter sweep, polling it until it finishes.
+
+        Args:
+            sweep_config (SweepConfig): See `submit_sweep`.
+            train_file (Any): See `submit_sweep`.
+            poll_interval (float, optional): Seconds between status requests. Defaults to 1.0.
+            on_progress (Callable[[SweepResponse], None] | None, optional): Called with every polled status.
+                Defaults to None.
+
+        Returns:
+            SweepResponse: Final status and leaderboard of the sweep.
+        """
+
+        sweep = self.submit_sweep(sweep_config, train_file)
+        while sweep.status in ("queued", "running"):
+            time.sleep(poll_interval)
+            sweep = self.get_sweep(sweep.sweep_id)
+            if on_progress is not None:
+                on_progress(sweep)
+        return sweep
+
+    def get_convergence_history(
+        self, experiment_name, start: int = 0, stop: int | None = None, max_points: int | None = None
+    ) -> ConvergenceHistoryResponse:
+        """
+        Retrieves the convergence history of the specified experiment.
+
+        Args:
+            experiment_name (Any): The name of the experiment.
+            start (int, optional): First iteration to retrieve, counting from 0. Defaults to 0.
+            stop (int | None, optional): Iteration to stop before. Defaults to None (the last one).
+            max_points (int | None, optional): Number of points to downsample longer histories to, keeping the
+                extremes of the curves and the best held-out loss. Defaults to None (all points).
+
+        Returns:
+            ConvergenceHistoryResponse: The convergence history of the experiment with the iteration of every point.
+        """
+
+        params = {'experiment_name': experiment_name, 'start': start, 'stop': stop, 'max_points': max_points}
+        return ConvergenceHistoryResponse(**self._get_json("/get_convergence_history/", params))
+
+    def predict(self, experiment_name, test_file, n_trees: int | None = None) -> npt.NDArray[np.float64]:
         """
         Makes predictions using the trained model of the specified experiment.
 
+        Predictions are requested as raw float64 bytes and wrapped into an array without copying or parsing. The
+        body is checked against the number of rows the server reports, so a response cut short is not mistaken
+        for fewer predictions.
+
         Args:
             experiment_name (Any): The name of the experiment.
             test_file (Any): The test data file.
+            n_trees (int | None, optional): Number of leading trees to predict with. Defaults to None (all of them).
 
         Returns:
-            npt.NDArray[Any]: The predictions made by the model.
+            npt.NDArray[np.float64]: The predictions made by the model, read-only array of shape (n_objects,).
+
+        Raises:
+            ValueError: If the body holds another number of predictions than the server reported.
         """
 
         response = self.session.get(
             f"{self.base_url}/predict/",
-            params={"experiment_name": experiment_name},
-            files={"test_file": test_file}
+            params={"experiment_name": experiment_name, "n_trees": n_trees},
+            files={"test_file": test_file},
+            headers={"Accept": "application/octet-stream"}
         )
         response.raise_for_status()
-        return response.json()["predicted_values"]
+        n_rows = response.headers.get("X-Row-Count")
+        if n_rows is not None and len(response.content) != 8 * int(n_rows):
+            raise ValueError(
+                f"Expected {n_rows} predictions, but the response has {len(response.content)} bytes")
+        return np.frombuffer(response.content, dtype="<f8")
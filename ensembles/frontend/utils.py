@@ -5,15 +5,23 @@ from ensembles.backend.schemas import ConvergenceHistoryResponse
 
 
 def plot_learning_curves(convergence_history: ConvergenceHistoryResponse):
-    df = pd.DataFrame(convergence_history.model_dump())
+    curves = {
+        name: losses
+        for name, losses in convergence_history.model_dump(include={"train", "val", "oob"}).items()
+        if losses
+    }
+    iterations = convergence_history.iterations or range(1, len(convergence_history.train) + 1)
+    df = pd.DataFrame(curves, index=pd.Index(iterations, name="index"))
     df_melted = df.reset_index().melt(
         id_vars=["index"],
-        value_vars=["train", "val"],
+        value_vars=list(curves),
         var_name="Dataset",
         value_name="RMSE",
     )
     train_loss = min(convergence_history.train)
-    val_loss = min(convergence_history.val)
+    # Forests trained on all the data are validated out-of-bag.
+    val_name = "validation" if convergence_history.val else "out-of-bag"
+    val_loss = min(convergence_history.val or convergence_history.oob)
 
     return px.line(
         df_melted,
@@ -21,5 +29,5 @@ def plot_learning_curves(convergence_history: ConvergenceHistoryResponse):
         y="RMSE",
         color="Dataset",
         labels={"index": "Iterations", "RMSE": "RMSE"},
-        title=f"RMSE: train [{train_loss:.4f}] | validation [{val_loss:.4f}]",
+        title=f"RMSE: train [{train_loss:.4f}] | {val_name} [{val_loss:.4f}]",
     )
@@ -0,0 +1,286 @@
+import numpy as np
+import numpy.typing as npt
+
+from .compiled import CompiledEnsemble
+
+
+class BinMapper:
+    def __init__(self, max_bins: int = 255, subsample: int | None = 200_000, random_state: int = 0) -> None:
+        """
+        Quantizes features into at most `max_bins` ordered bins stored as uint8.
+
+        Bin `b` of a feature holds the values `edges[b - 1] < x <= edges[b]`, the last bin is unbounded and also
+        holds NaN. Edges are float32 values taken from the data, so `x <= edges[b]` in float32, the comparison
+        trees do at prediction, is exactly `bin(x) <= b`.
+
+        Args:
+            max_bins (int, optional): Maximum number of bins per feature, at most 256. Defaults to 255.
+            subsample (int | None, optional): Number of rows used to compute the quantiles. Defaults to 200_000.
+            random_state (int, optional): Seed of the quantile subsample. Defaults to 0.
+        """
+        if not 2 <= max_bins <= 256:
+            raise ValueError("max_bins must be between 2 and 256")
+        self.max_bins = max_bins
+        self.subsample = subsample
+        self.random_state = random_state
+
+    def fit(self, X: npt.NDArray[np.float64]) -> "BinMapper":
+        """
+        Compute bin edges of every feature from its quantiles.
+
+        Args:
+            X (npt.NDArray[np.float64]): Objects features matrix, array of shape (n_objects, n_features).
+
+        Returns:
+            BinMapper: The fitted mapper.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if self.subsample is not None and X.shape[0] > self.subsample:
+            rng = np.random.default_rng(self.random_state)
+            X = X[rng.choice(X.shape[0], self.subsample, replace=False)]
+
+        quantiles = np.linspace(0, 1, self.max_bins + 1)[1:-1]
+        self.bin_edges_ = []
+        for column in X.T:
+            column = column[~np.isnan(column)]
+            distinct = np.unique(column)
+            if len(distinct) <= self.max_bins:
+                edges = distinct[:-1]
+            else:
+                edges = np.unique(np.quantile(column, quantiles, method="inverted_cdf"))
+                edges = edges[edges < distinct[-1]]
+            self.bin_edges_.append(edges.astype(np.float32))
+
+        self.n_bins_ = max(len(edges) for edges in self.bin_edges_) + 1
+        return self
+
+    def transform(self, X: npt.NDArray[np.float64]) -> npt.NDArray[np.uint8]:
+        """
+        Replace feature values with their bin indices.
+
+        Args:
+            X (npt.NDArray[np.float64]): Objects features matrix, array of shape (n_objects, n_features).
+
+        Returns:
+            npt.NDArray[np.uint8]: Binned matrix, array of shape (n_objects, n_features).
+        """
+        X = np.asarray(X, dtype=np.float32)
+        binned = np.empty(X.shape, dtype=np.uint8)
+        for i, edges in enumerate(self.bin_edges_):
+            binned[:, i] = np.searchsorted(edges, X[:, i], side="left")
+        return binned
+
+
+class _TreeStructure:
+    """Node arrays laid out like scikit-learn's `tree_`, so that `CompiledEnsemble.from_trees` accepts the tree."""
+
+    def __init__(
+        self,
+        feature: list[int],
+        threshold: list[float],
+        children_left: list[int],
+        children_right: list[int],
+        value: list[float],
+        n_node_samples: list[float],
+        max_depth: int,
+    ) -> None:
+        self.feature = np.array(feature, dtype=np.int64)
+        self.threshold = np.array(threshold, dtype=np.float64)
+        self.children_left = np.array(children_left, dtype=np.int64)
+        self.children_right = np.array(children_right, dtype=np.int64)
+        self.value = np.array(value, dtype=np.float64).reshape(-1, 1, 1)
+        self.weighted_n_node_samples = np.array(n_node_samples, dtype=np.float64)
+        self.missing_go_to_left = np.zeros(len(feature), dtype=np.uint8)
+        self.node_count = len(feature)
+        self.max_depth = max_depth
+
+
+# Parameters of `HistogramTree`, the subset of scikit-learn tree parameters it supports.
+TREE_PARAMS = ("max_depth", "min_samples_leaf", "max_features", "random_state")
+
+
+class HistogramTree:
+    def __init__(
+        self,
+        max_depth: int | None = None,
+        min_samples_leaf: int = 1,
+        max_features: str | int | float | None = None,
+        random_state: int | None = None,
+    ) -> None:
+        """
+        Regression tree grown on binned features from gradient histograms.
+
+        Split search costs one pass over the node's rows per level instead of sorting every feature. Only the
+        smaller child's histogram is accumulated, the larger one is the parent's minus the smaller one's. Only the
+        `TREE_PARAMS` of scikit-learn trees are supported.
+
+        Args:
+            max_depth (int | None, optional): Maximum depth of the tree. Defaults to None (unlimited).
+            min_samples_leaf (int, optional): Minimum number of samples in a leaf, counted as the sum of the
+                objects' weights (bootstrap counts) rather than the number of distinct objects. Splits only fall on
+                bin boundaries, so leaves can differ from those of a scikit-learn tree with the same value.
+                Defaults to 1.
+            max_features (str | int | float | None, optional): Number of features considered at every split, with
+                the same meaning as in scikit-learn trees. Defaults to None (all features).
+            random_state (int | None, optional): Seed of feature sampling. Defaults to None.
+        """
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.max_features = max_features
+        self.random_state = random_state
+
+    def fit_binned(
+        self,
+        binned: npt.NDArray[np.uint8],
+        y: npt.NDArray[np.float64],
+        sample_weight: npt.NDArray[np.float64],
+        bin_mapper: BinMapper,
+        features: npt.NDArray[np.int64] | None = None,
+    ) -> npt.NDArray[np.int64]:
+        """
+        Grow the tree minimizing the weighted squared error.
+
+        Zero-weight objects take no part in split search but are routed down the tree along with the others, so the
+        leaf of every object comes out of the growth and the training set never has to be predicted again.
+
+        Args:
+            binned (npt.NDArray[np.uint8]): Binned features, array of shape (n_objects, n_features).
+            y (npt.NDArray[np.float64]): Regression labels, array of shape (n_objects,).
+            sample_weight (npt.NDArray[np.float64]): Objects' weights, e.g. bootstrap counts, array of shape
+                (n_objects,). Objects with zero weight do not affect the splits.
+            bin_mapper (BinMapper): Mapper that produced `binned`, used to turn bins back into thresholds.
+            features (npt.NDArray[np.int64] | None, optional): Columns the tree may split on, histograms are only
+                accumulated for them. Defaults to None (all columns).
+
+        Returns:
+            npt.NDArray[np.int64]: Leaf node of every object, array of shape (n_objects,). `tree_.value` of these
+                nodes equals `predict` on the objects.
+        """
+        self.n_features_in_ = binned.shape[1]
+        self._features = features
+        n_features = self.n_features_in_ if features is None else len(features)
+        self._rng = np.random.default_rng(self.random_state)
+        self._n_split_features = self._resolve_max_features(n_features)
+        self._binned = binned
+        self._n_bins = bin_mapper.n_bins_
+        self._offsets = np.arange(n_features) * self._n_bins
+        self._weight = sample_weight.astype(np.float64)
+        self._weighted_y = self._weight * y
+        max_depth = np.inf if self.max_depth is None else self.max_depth
+
+        nodes = {
+            "feature": [], "threshold": [], "children_left": [], "children_right": [],
+            "value": [], "n_node_samples": [],
+        }
+
+        def add_node(hist_y: npt.NDArray[np.float64], hist_w: npt.NDArray[np.float64]) -> int:
+            total_w = hist_w[0].sum()
+            nodes["feature"].append(-2)
+            nodes["threshold"].append(-2.0)
+            nodes["children_left"].append(-1)
+            nodes["children_right"].append(-1)
+            nodes["value"].append(hist_y[0].sum() / total_w if total_w > 0 else 0.0)
+            nodes["n_node_samples"].append(total_w)
+            return len(nodes["feature"]) - 1
+
+        leaves = np.empty(binned.shape[0], dtype=np.int64)
+        in_bag = self._weight > 0
+        rows, out_of_bag = np.flatnonzero(in_bag), np.flatnonzero(~in_bag)
+        hist_y, hist_w = self._histograms(rows)
+        stack = [(add_node(hist_y, hist_w), rows, out_of_bag, hist_y, hist_w, 0)]
+        depth_reached = 0
+
+        while stack:
+            node, rows, out_of_bag, hist_y, hist_w, depth = stack.pop()
+            depth_reached = max(depth_reached, depth)
+            split = self._best_split(hist_y, hist_w) if depth < max_depth else None
+            if split is None:
+                leaves[rows] = node
+                leaves[out_of_bag] = node
+                continue
+
+            feature, bin_ = split
+            goes_left = binned[rows, feature] <= bin_
+            children_rows = rows[goes_left], rows[~goes_left]
+            oob_goes_left = binned[out_of_bag, feature] <= bin_
+            children_oob = out_of_bag[oob_goes_left], out_of_bag[~oob_goes_left]
+            small = int(len(children_rows[1]) < len(children_rows[0]))
+            small_hist = self._histograms(children_rows[small])
+            large_hist = hist_y - small_hist[0], hist_w - small_hist[1]
+            children_hists = (small_hist, large_hist) if small == 0 else (large_hist, small_hist)
+
+            children = [add_node(*hist) for hist in children_hists]
+            nodes["feature"][node] = feature
+            nodes["threshold"][node] = float(bin_mapper.bin_edges_[feature][bin_])
+            nodes["children_left"][node], nodes["children_right"][node] = children
+            for child, child_rows, child_oob, hist in zip(
+                children, children_rows, children_oob, children_hists
+            ):
+                stack.append((child, child_rows, child_oob, *hist, depth + 1))
+
+        self.tree_ = _TreeStructure(**nodes, max_depth=depth_reached)
+        self._compiled = CompiledEnsemble.from_trees([self], aggregation="mean")
+        del self._binned, self._weight, self._weighted_y, self._rng, self._features
+        return leaves
+
+    def predict(self, X: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        """
+        Predict regression values of the objects.
+
+        Args:
+            X (npt.NDArray[np.float64]): Objects' features matrix, array of shape (n_objects, n_features).
+
+        Returns:
+            npt.NDArray[np.float64]: Predicted values, array of shape (n_objects,).
+        """
+        return self._compiled.predict(X)
+
+    def _resolve_max_features(self, n_features: int) -> int:
+        if self.max_features is None:
+            return n_features
+        if self.max_features == "sqrt":
+            return max(1, int(np.sqrt(n_features)))
+        if self.max_features == "log2":
+            return max(1, int(np.log2(n_features)))
+        if isinstance(self.max_features, float):
+            return max(1, int(self.max_features * n_features))
+        return min(n_features, int(self.max_features))
+
+    def _histograms(
+        self, rows: npt.NDArray[np.int64]
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        n_features = len(self._offsets)
+        size = n_features * self._n_bins
+        if self._features is None:
+            binned = self._binned[rows]
+        else:
+            binned = self._binned[np.ix_(rows, self._features)]
+        flat = (binned + self._offsets).ravel()
+        hist_y = np.bincount(flat, weights=np.repeat(self._weighted_y[rows], n_features), minlength=size)
+        hist_w = np.bincount(flat, weights=np.repeat(self._weight[rows], n_features), minlength=size)
+        return hist_y.reshape(n_features, -1), hist_w.reshape(n_features, -1)
+
+    def _best_split(
+        self, hist_y: npt.NDArray[np.float64], hist_w: npt.NDArray[np.float64]
+    ) -> tuple[int, int] | None:
+        total_y, total_w = hist_y[0].sum(), hist_w[0].sum()
+        left_y = np.cumsum(hist_y, axis=1)[:, :-1]
+        left_w = np.cumsum(hist_w, axis=1)[:, :-1]
+        right_y, right_w = total_y - left_y, total_w - left_w
+
+        # Minimizing the squared error is maximizing sum(y)^2 / sum(w) over children.
+        valid = (left_w >= self.min_samples_leaf) & (right_w >= self.min_samples_leaf)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = np.where(valid, left_y**2 / left_w + right_y**2 / right_w, -np.inf)
+
+        n_features = hist_y.shape[0]
+        if self._n_split_features < n_features:
+            skipped = self._rng.choice(n_features, n_features - self._n_split_features, replace=False)
+            score[skipped] = -np.inf
+
+        feature, bin_ = np.unravel_index(np.argmax(score), score.shape)
+        if score[feature, bin_] <= total_y**2 / total_w * (1 + 1e-12):
+            return None
+        if self._features is not None:
+            feature = self._features[feature]
+        return int(feature), int(bin_)
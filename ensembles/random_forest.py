@@ -1,20 +1,55 @@
-import json
 from time import perf_counter
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
-import joblib
+from joblib import Parallel, delayed, effective_n_jobs
 import numpy as np
 import numpy.typing as npt
 from sklearn.tree import DecisionTreeRegressor
 from sklearn.exceptions import NotFittedError
 
-from .utils import ConvergenceHistory, whether_to_stop, rmse
+from .compiled import CompiledEnsemble, as_tree_input, predict_tree
+from .serialization import append_model_file, load_legacy_trees, read_model_file, write_model_file
+from .utils import METRICS, ConvergenceHistory, EarlyStopping, Scorer, best_iteration
+
+
+def _fit_tree(
+    estimator: DecisionTreeRegressor,
+    X: npt.NDArray[np.float32],
+    y: npt.NDArray[np.float64],
+    seed: int,
+) -> tuple[float, npt.NDArray[np.int64]]:
+    """
+    Fit a single tree on its own bootstrap sample.
+
+    The bootstrap indices are drawn from a generator seeded with `seed`, so the result does not depend on the order in which the worker pool schedules the trees.
+
+    Args:
+        estimator (DecisionTreeRegressor): Tree to fit in place.
+        X (npt.NDArray[np.float32]): Objects features matrix prepared by `as_tree_input`, array of shape (n_objects, n_features).
+        y (npt.NDArray[np.float64]): Regression labels, array of shape (n_objects,).
+        seed (int): Seed of the bootstrap sample and of the tree's own feature sampling.
+
+    Returns:
+        tuple[float, npt.NDArray[np.int64]]: Fitting time in seconds and the number of times every object was drawn into the sample.
+    """
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, y.shape[0], y.shape[0])
+    if estimator.random_state is None:
+        estimator.set_params(random_state=seed)
+
+    start = perf_counter()
+    estimator.fit(X[idx], y[idx])
+    return perf_counter() - start, np.bincount(idx, minlength=y.shape[0])
 
 
 class RandomForestMSE:
     def __init__(
-        self, n_estimators: int, tree_params: dict[str, Any] | None = None
+        self,
+        n_estimators: int,
+        tree_params: dict[str, Any] | None = None,
+        n_jobs: int | None = None,
+        random_state: int = 42,
     ) -> None:
         """
         Handmade random forest regressor.
@@ -24,14 +59,23 @@ class RandomForestMSE:
         Args:
             n_estimators (int): Number of trees in the forest.
             tree_params (dict[str, Any] | None, optional): Parameters for sklearn trees. Defaults to None.
+            n_jobs (int | None, optional): Number of threads fitting trees in parallel, `-1` means all cores. Follows joblib conventions. Defaults to None (single thread).
+            random_state (int, optional): Seed from which per-tree bootstrap seeds are derived. Defaults to 42.
         """
         self.n_estimators = n_estimators
+        self.n_jobs = n_jobs
+        self.random_state = random_state
         if tree_params is None:
             tree_params = {}
+        self.tree_params = tree_params
         self.forest = [
             DecisionTreeRegressor(**tree_params) for _ in range(n_estimators)
         ]
         self.fitted_estimators = 0
+        self._compiled: CompiledEnsemble | None = None
+        # Leading trees known only as flat arrays, loaded from a model file.
+        self._base: CompiledEnsemble | None = None
+        self._saved_estimators = 0
 
     def fit(
         self,
@@ -41,6 +85,10 @@ class RandomForestMSE:
         y_val: npt.NDArray[np.float64] | None = None,
         trace: bool | None = None,
         patience: int | None = None,
+        callback: Callable[[ConvergenceHistory, list[float]], bool | None] | None = None,
+        oob: bool = False,
+        warm_start: bool = False,
+        early_stopping: EarlyStopping | None = None,
     ) -> ConvergenceHistory | None:
         """
         Train an ensemble of trees on the provided data.
@@ -51,50 +99,155 @@ class RandomForestMSE:
             X_val (npt.NDArray[np.float64] | None, optional): Validation set of objects, array of shape (n_val_objects, n_features). Defaults to None.
             y_val (npt.NDArray[np.float64] | None, optional): Validation set of labels, array of shape (n_val_objects,). Defaults to None.
             trace (bool | None, optional): Whether to calculate rmse while training. True by default if validation data is provided. Defaults to None.
-            patience (int | None, optional): Number of training steps without decreasing the train loss (or validation if provided), after which to stop training. Defaults to None.
+            patience (int | None, optional): Number of training steps without decreasing the train loss (or validation if provided), after which to stop training. Shortcut for `early_stopping=EarlyStopping(patience)`. Defaults to None.
+            callback (Callable[[ConvergenceHistory, list[float]], bool | None] | None, optional): Called with the history and per-tree times after every fitted tree. Training stops if it returns True. Defaults to None.
+            oob (bool, optional): Whether to estimate the error of every object by the trees whose bootstrap sample left it out, recorded as the `oob` curve of the history. Enables `trace`. Per-tree in-bag masks are kept as bitsets in `in_bag_`. Defaults to False.
+            warm_start (bool, optional): Whether to keep the fitted trees and add trees up to `n_estimators`. The history and times then cover the new trees only, with errors of the whole grown forest. Bootstrap samples derive from `random_state`, so the result is the same as fitting all the trees at once. Defaults to False.
+            early_stopping (EarlyStopping | None, optional): Tracker that stops training once the monitored metrics stop improving. Validation metrics are monitored if validation data is provided, out-of-bag ones if `oob` is set, train ones otherwise. Defaults to None.
 
         Returns:
             ConvergenceHistory | None: Instance of `ConvergenceHistory` if `trace=True` or if validation data is provided.
         """
-        np.random.seed(42)
-
-        if y_val is not None:
+        if y_val is not None or oob:
             trace = True
         elif trace is None:
             trace = False
 
+        if early_stopping is None and patience is not None:
+            early_stopping = EarlyStopping(patience)
+        # Training predictions are only needed for the history, and the history
+        # only when it is returned or drives early stopping.
+        track = trace or early_stopping is not None or oob
+        metrics = ("rmse",)
+        if early_stopping is not None:
+            metrics += tuple(name for name in early_stopping.metrics if name != "rmse")
+        monitor_train = y_val is None and not oob
+        train_scorer = Scorer(y, metrics if monitor_train else ("rmse",))
+
         times = list()
         history = ConvergenceHistory(train=[], val=[])
         pred = np.zeros((X.shape[0]))
+        X_tree = as_tree_input(X)
+        seeds = np.random.RandomState(self.random_state).randint(
+            np.iinfo(np.int32).max, size=self.n_estimators)
+
+        first = self.fitted_estimators if warm_start else 0
+        if not first:
+            self.fitted_estimators = 0
+            self._base = None
+            self._saved_estimators = 0
+
+        if oob:
+            history['oob'] = []
+            self.in_bag_ = []
+            oob_pred = np.zeros((X.shape[0]))
+            oob_count = np.zeros((X.shape[0]))
+            if first:
+                self._resume_oob(X_tree, seeds[:first], oob_pred, oob_count)
 
         if y_val is not None:
             val_pred = np.zeros((X_val.shape[0]))
-        for epoch, estimator in enumerate(self.forest):
-            idx = np.random.choice(
-                np.arange(y.shape[0]), y.shape[0], replace=True)
-
-            start = perf_counter()
-            estimator.fit(X[idx], y[idx])
-            self.fitted_estimators += 1
-
-            pred += estimator.predict(X)
-            times.append(perf_counter() - start)
-            history['train'].append(rmse(y, pred / self.fitted_estimators))
-
+            val_scorer = Scorer(y_val, metrics)
+            X_val_tree = as_tree_input(X_val)
+
+        if first:
+            # Predictions are means, so the sums of the existing trees are
+            # recovered by scaling them back.
+            if track:
+                pred = self.predict(X_tree) * first
             if y_val is not None:
-                val_pred += estimator.predict(X_val)
-                history['val'].append(
-                    rmse(y_val, val_pred / self.fitted_estimators))
-
-            if patience is not None and whether_to_stop(history, patience):
-                break
+                val_pred = self.predict(X_val_tree) * first
+        self._compiled = None
+        self.forest.extend(
+            DecisionTreeRegressor(**self.tree_params) for _ in range(len(self.forest), self.n_estimators))
+        # Trees are fitted in batches of `n_jobs` and then consumed strictly in
+        # order, so the history and early stopping are the same for any `n_jobs`.
+        batch_size = effective_n_jobs(self.n_jobs)
+        if not track and callback is None:
+            batch_size = self.n_estimators
+        with Parallel(n_jobs=self.n_jobs, prefer="threads") as parallel:
+            for batch_start in range(first, self.n_estimators, batch_size):
+                batch = range(batch_start, min(
+                    batch_start + batch_size, self.n_estimators))
+                results = parallel(
+                    delayed(_fit_tree)(self.forest[i], X_tree, y, seeds[i])
+                    for i in batch
+                )
+
+                stop = False
+                for i, (fit_time, in_bag) in zip(batch, results):
+                    estimator = self.forest[i]
+                    self.fitted_estimators += 1
+
+                    start = perf_counter()
+                    if track:
+                        tree_pred = predict_tree(estimator, X_tree)
+                        pred += tree_pred
+                    times.append(fit_time + perf_counter() - start)
+                    if track:
+                        scores = train_scorer(pred, 1 / self.fitted_estimators)
+                        history['train'].append(scores['rmse'])
+
+                    if oob:
+                        out_of_bag = in_bag == 0
+                        self.in_bag_.append(np.packbits(~out_of_bag))
+                        oob_pred[out_of_bag] += tree_pred[out_of_bag]
+                        oob_count += out_of_bag
+                        seen = oob_count > 0
+                        y_seen, oob_mean = y[seen], oob_pred[seen] / oob_count[seen]
+                        if y_val is None:
+                            scores = {name: METRICS[name](y_seen, oob_mean) for name in metrics}
+                            history['oob'].append(scores['rmse'])
+                        else:
+                            history['oob'].append(METRICS['rmse'](y_seen, oob_mean))
+
+                    if y_val is not None:
+                        val_pred += predict_tree(estimator, X_val_tree)
+                        scores = val_scorer(val_pred, 1 / self.fitted_estimators)
+                        history['val'].append(scores['rmse'])
+
+                    if early_stopping is not None and early_stopping.update(scores):
+                        stop = True
+                        break
+                    if callback is not None and callback(history, times):
+                        stop = True
+                        break
+                if stop:
+                    break
 
         if trace:
             return history, times
         else:
             return None
 
-    def predict(self, X: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    def _resume_oob(
+        self,
+        X: npt.NDArray[np.float32],
+        seeds: npt.NDArray[np.int64],
+        oob_pred: npt.NDArray[np.float64],
+        oob_count: npt.NDArray[np.float64],
+    ) -> None:
+        """
+        Accumulate out-of-bag predictions of the fitted trees, whose bootstrap samples are drawn again from their seeds.
+        """
+        for seed in seeds:
+            idx = np.random.default_rng(seed).integers(0, X.shape[0], X.shape[0])
+            self.in_bag_.append(np.packbits(np.bincount(idx, minlength=X.shape[0]) > 0))
+        in_bag = np.array(self.in_bag_)
+
+        compiled = self.compile()
+        # A multiple of 8 rows, so every chunk starts on a byte of the masks.
+        chunk_size = max(8, 2**16 // max(1, compiled.n_trees) // 8 * 8)
+        for start in range(0, X.shape[0], chunk_size):
+            stop = min(start + chunk_size, X.shape[0])
+            values = compiled.value[compiled.apply(X[start:stop])]
+            out_of_bag = np.unpackbits(
+                in_bag[:, start // 8:-(-stop // 8)], axis=1, count=stop - start
+            ).T == 0
+            oob_pred[start:stop] += np.where(out_of_bag, values, 0).sum(axis=1)
+            oob_count[start:stop] += out_of_bag.sum(axis=1)
+
+    def predict(self, X: npt.NDArray[np.float64], n_trees: int | None = None) -> npt.NDArray[np.float64]:
         """
         Make prediction with ensemble of trees.
 
@@ -102,62 +255,148 @@ class RandomForestMSE:
 
         Args:
             X (npt.NDArray[np.float64]): Objects' features matrix, array of shape (n_objects, n_features).
+            n_trees (int | None, optional): Number of leading trees to average, from 1 to `fitted_estimators`. Defaults to None (all fitted trees).
 
         Returns:
             npt.NDArray[np.float64]: Predicted values, array of shape (n_objects,).
+
+        Raises:
+            ValueError: If `n_trees` is out of range.
         """
         if self.fitted_estimators == 0:
             raise NotFittedError
-
-        predictions = np.empty((X.shape[0], self.fitted_estimators))
-        for i in range(self.fitted_estimators):
+        if n_trees is None:
+            n_trees = self.fitted_estimators
+        if not 1 <= n_trees <= self.fitted_estimators:
+            raise ValueError(f"n_trees must be between 1 and {self.fitted_estimators}, got {n_trees}")
+        if self._compiled is None and self._base is not None:
+            self._compiled = self.compile()
+        if self._compiled is not None:
+            return self._compiled.predict(X, n_trees=n_trees)
+
+        predictions = np.empty((X.shape[0], n_trees))
+        for i in range(n_trees):
             predictions[:, i] = self.forest[i].predict(X)
 
         return np.mean(predictions, axis=1)
 
-    def dump(self, dirpath: str) -> None:
+    def staged_predict(self, X: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
         """
-        Save the trained model to the specified directory.
+        Make predictions of every prefix of the ensemble.
+
+        Column `k` averages the first `k + 1` trees, which makes it easy to compare forest sizes: the trees are walked once for all of them.
 
         Args:
-            dirpath (str): Path to the directory where the model will be saved.
+            X (npt.NDArray[np.float64]): Objects' features matrix, array of shape (n_objects, n_features).
+
+        Returns:
+            npt.NDArray[np.float64]: Predicted values, array of shape (n_objects, fitted_estimators).
         """
-        path = Path(dirpath)
-        path.mkdir(parents=True)
+        return self.compile().staged_predict(X)
 
+    def compile(self) -> CompiledEnsemble:
+        """
+        Pack the fitted trees into a flat-array predictor.
+
+        The predictor walks all trees at once over a batch of objects and gives exactly the same result as `predict`.
+
+        Returns:
+            CompiledEnsemble: Predictor with the same `predict` signature.
+        """
+        if self.fitted_estimators == 0:
+            raise NotFittedError
+        if self._compiled is not None:
+            return self._compiled
+
+        parts = [] if self._base is None else [self._base]
+        n_base = 0 if self._base is None else self._base.n_trees
+        if self.fitted_estimators > n_base:
+            parts.append(CompiledEnsemble.from_trees(
+                self.forest[n_base:self.fitted_estimators], aggregation="mean"
+            ))
+        return parts[0] if len(parts) == 1 else CompiledEnsemble.concatenate(parts)
+
+    def compact(self, history: ConvergenceHistory | None = None, quantize: bool = True) -> None:
+        """
+        Shrink the fitted forest for serving.
+
+        Trees past the iteration with the lowest validation or out-of-bag error in `history` are dropped together with the unfitted ones, and the rest is frozen into compacted flat arrays, see `CompiledEnsemble.compact`. The next `dump` rewrites the whole file.
+
+        Args:
+            history (ConvergenceHistory | None, optional): History returned by `fit`. Defaults to None (keep all fitted trees).
+            quantize (bool, optional): Whether to store thresholds and leaf values as float32. Defaults to True.
+        """
+        if self.fitted_estimators == 0:
+            raise NotFittedError
+        n_trees = self.fitted_estimators
+        if history is not None:
+            n_trees = min(best_iteration(history) or n_trees, n_trees)
+
+        compiled = self.compile().compact(n_trees, quantize=quantize)
+        self.fitted_estimators = n_trees
+        del self.forest[n_trees:]
+        if hasattr(self, "in_bag_"):
+            del self.in_bag_[n_trees:]
+        self._base = self._compiled = compiled
+        self._saved_estimators = 0
+
+    def dump(self, path: str, append: bool = False) -> None:
+        """
+        Save the trained model into a single binary file.
+
+        The file holds the flattened node arrays of the fitted trees only, see `ensembles.serialization`.
+
+        Args:
+            path (str): Path of the file where the model will be saved.
+            append (bool, optional): Whether to only append the trees fitted since the model was loaded from or last saved to `path`, which must then hold that model. Defaults to False.
+        """
         params = {
             "n_estimators": self.n_estimators,
+            "tree_params": self.tree_params,
+            "random_state": self.random_state,
             "fitted_estimators": self.fitted_estimators
         }
-        with (path / "params.json").open("w") as file:
-            json.dump(params, file, indent=4)
-
-        trees_path = path / "trees"
-        trees_path.mkdir()
-        for i, tree in enumerate(self.forest):
-            joblib.dump(tree, trees_path / f"tree_{i:04d}.joblib")
+        if append and self._saved_estimators:
+            new_trees = CompiledEnsemble.from_trees(
+                self.forest[self._saved_estimators:self.fitted_estimators], aggregation="mean"
+            )
+            append_model_file(path, type(self).__name__, params, new_trees)
+        else:
+            write_model_file(path, type(self).__name__, params, self.compile())
+        self._saved_estimators = self.fitted_estimators
 
     @classmethod
-    def load(cls, dirpath: str) -> "RandomForestMSE":
+    def load(cls, path: str, mmap: bool = False) -> "RandomForestMSE":
         """
-        Load a trained model from the specified directory.
+        Load a trained model from the specified file.
+
+        Models saved in the former directory layout (`params.json` plus one joblib file per tree) are loaded too.
 
         Args:
-            dirpath (str): Path to the directory where the model is saved.
+            path (str): Path to the model file or to the legacy model directory.
+            mmap (bool, optional): Whether to memory-map the node arrays instead of reading them. Defaults to False.
 
         Returns:
             RandomForestMSE: An instance of the loaded model.
         """
-        with (Path(dirpath) / "params.json").open() as file:
-            params = json.load(file)
-        instance = cls(params["n_estimators"])
-
-        trees_path = Path(dirpath) / "trees"
-
-        instance.forest = [
-            joblib.load(trees_path / f"tree_{i:04d}.joblib")
-            for i in range(params["n_estimators"])
-        ]
+        if Path(path).is_dir():
+            params, trees = load_legacy_trees(path)
+            instance = cls(params["n_estimators"])
+            instance.forest[:len(trees)] = trees
+            instance.fitted_estimators = params["fitted_estimators"]
+            return instance
+
+        model, params, compiled = read_model_file(path, mmap=mmap)
+        if model != cls.__name__:
+            raise ValueError(f"{path} holds a {model} model")
+        instance = cls(
+            params["n_estimators"],
+            tree_params=params.get("tree_params"),
+            random_state=params.get("random_state", 42),
+        )
         instance.fitted_estimators = params["fitted_estimators"]
+        instance._compiled = compiled
+        instance._base = compiled
+        instance._saved_estimators = params["fitted_estimators"]
 
         return instance
@@ -0,0 +1,238 @@
+import json
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import numpy as np
+
+from .compiled import NODE_ARRAYS, CompiledEnsemble
+
+
+MAGIC = b"ENSMODEL"
+# Version 2 allows further segments to be appended after the first one.
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<8sII")
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _write_segment(
+    file: BinaryIO, start: int, model: str, params: dict[str, Any], compiled: CompiledEnsemble
+) -> int:
+    arrays = {name: np.ascontiguousarray(getattr(compiled, name)) for name in NODE_ARRAYS}
+    header = {
+        "model": model,
+        "params": params,
+        "predictor": {
+            "max_depth": compiled.max_depth,
+            "n_features": compiled.n_features,
+            "aggregation": compiled.aggregation,
+            "bias": compiled.bias,
+            "scale": compiled.scale,
+        },
+        "arrays": {},
+        "end": 0,
+    }
+
+    # Offsets depend on the header length and vice versa, so the header is
+    # padded to a fixed width before the offsets are filled in.
+    header_size = _align(len(json.dumps(header)) + 256 * len(arrays) + 32)
+    offset = _align(start + _PREAMBLE.size + header_size)
+    for name, array in arrays.items():
+        header["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _align(offset + array.nbytes)
+    header["end"] = offset
+    encoded = json.dumps(header).encode().ljust(header_size)
+
+    file.seek(start)
+    file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_size))
+    file.write(encoded)
+    for name, array in arrays.items():
+        file.seek(header["arrays"][name]["offset"])
+        file.write(array.tobytes())
+    file.truncate(offset)
+    return offset
+
+
+def write_model_file(
+    path: str | Path, model: str, params: dict[str, Any], compiled: CompiledEnsemble
+) -> None:
+    """
+    Write a model into a single binary file.
+
+    The file starts with `MAGIC`, the format version and the length of a JSON header. The header holds the model
+    parameters and the dtype, shape and offset of every node array. The arrays follow the header, each aligned
+    to `ALIGNMENT` bytes, so they can be memory-mapped in place. Such a segment may be followed by more segments
+    written by `append_model_file`.
+
+    Args:
+        path (str | Path): Path of the file to write.
+        model (str): Name of the model class, checked on load.
+        params (dict[str, Any]): JSON-serializable model parameters.
+        compiled (CompiledEnsemble): Flat node arrays of the fitted trees.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as file:
+        _write_segment(file, 0, model, params, compiled)
+
+
+def append_model_file(
+    path: str | Path, model: str, params: dict[str, Any], compiled: CompiledEnsemble
+) -> None:
+    """
+    Append trees to a model file as a new segment, without rewriting the trees already stored.
+
+    On load, the trees of all segments are concatenated in order and the parameters of the last segment win.
+    Readers ignore the new segment until it is completely written. The segment starts right after the last complete
+    one, so the leftovers of an interrupted append are overwritten instead of hiding every later segment.
+
+    Args:
+        path (str | Path): Path of an existing model file.
+        model (str): Name of the model class, must match the file.
+        params (dict[str, Any]): JSON-serializable parameters of the whole model.
+        compiled (CompiledEnsemble): Flat node arrays of the appended trees only.
+
+    Raises:
+        ValueError: If the file holds another model or has format version 1, which has a single segment.
+    """
+    headers = _read_headers(path)
+    if headers[0]["model"] != model:
+        raise ValueError(f"{path} holds a {headers[0]['model']} model")
+    if "end" not in headers[-1]:
+        raise ValueError(f"{path} has format version 1, rewrite it with write_model_file before appending")
+
+    with Path(path).open("r+b") as file:
+        _write_segment(file, headers[-1]["end"], model, params, compiled)
+
+
+def _read_headers(path: str | Path) -> list[dict[str, Any]]:
+    headers = []
+    with Path(path).open("rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        position = 0
+        while position < size:
+            file.seek(position)
+            if headers and position + _PREAMBLE.size > size:
+                break
+            magic, version, header_size = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an ensemble model file")
+            if version not in (1, FORMAT_VERSION):
+                raise ValueError(f"Unsupported model file version {version}")
+            try:
+                header = json.loads(file.read(header_size))
+            except ValueError:
+                header = None
+            # A segment being appended by another process is skipped until
+            # its last array is written.
+            if headers and (header is None or header["end"] > size):
+                break
+            headers.append(header)
+            if version == 1:
+                break
+            position = header["end"]
+    return headers
+
+
+def read_model_file(
+    path: str | Path, mmap: bool = False
+) -> tuple[str, dict[str, Any], CompiledEnsemble]:
+    """
+    Read a model written by `write_model_file` and possibly extended by `append_model_file`.
+
+    The node arrays of a single-segment file are views of the file buffer. Trees of several segments are
+    concatenated into new arrays, so rewriting the model with `write_model_file` brings zero-copy loading back.
+
+    Args:
+        path (str | Path): Path of the model file.
+        mmap (bool, optional): Whether to memory-map the node arrays read-only instead of reading them into memory.
+            Defaults to False.
+
+    Returns:
+        tuple[str, dict[str, Any], CompiledEnsemble]: Name of the model class, its parameters and the predictor.
+
+    Raises:
+        ValueError: If the file is not a model file or has an unsupported version.
+    """
+    headers = _read_headers(path)
+
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        buffer = np.fromfile(path, dtype=np.uint8)
+
+    segments = []
+    for header in headers:
+        arrays = {
+            name: np.ndarray(
+                shape=tuple(spec["shape"]),
+                dtype=np.dtype(spec["dtype"]),
+                buffer=buffer,
+                offset=spec["offset"],
+            )
+            for name, spec in header["arrays"].items()
+        }
+        segments.append(CompiledEnsemble(**arrays, **header["predictor"]))
+
+    compiled = segments[0] if len(segments) == 1 else CompiledEnsemble.concatenate(segments)
+    return headers[0]["model"], headers[-1]["params"], compiled
+
+
+def load_legacy_trees(dirpath: str | Path) -> tuple[dict[str, Any], list[Any]]:
+    """
+    Read the `params.json` and fitted `trees/tree_XXXX.joblib` files of the directory layout.
+
+    Only the first `fitted_estimators` trees are unpickled.
+
+    Args:
+        dirpath (str | Path): Path to the model directory.
+
+    Returns:
+        tuple[dict[str, Any], list[Any]]: Model parameters and fitted trees.
+    """
+    import joblib
+
+    path = Path(dirpath)
+    with (path / "params.json").open() as file:
+        params = json.load(file)
+
+    trees = [
+        joblib.load(path / "trees" / f"tree_{i:04d}.joblib")
+        for i in range(params["fitted_estimators"])
+    ]
+    return params, trees
+
+
+def convert_legacy_model(dirpath: str | Path, filepath: str | Path) -> None:
+    """
+    Convert a model saved in the directory layout into the single-file format.
+
+    Args:
+        dirpath (str | Path): Path to the model directory with `params.json` and `trees/`.
+        filepath (str | Path): Path of the model file to write.
+    """
+    from .boosting import GradientBoostingMSE
+    from .random_forest import RandomForestMSE
+
+    with (Path(dirpath) / "params.json").open() as file:
+        params = json.load(file)
+    # Only boosting stores a learning rate in its parameters.
+    model_type = GradientBoostingMSE if "learning_rate" in params else RandomForestMSE
+    model_type.load(dirpath).dump(filepath)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m ensembles.serialization MODEL_DIR MODEL_FILE")
+    convert_legacy_model(sys.argv[1], sys.argv[2])
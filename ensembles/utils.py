@@ -1,4 +1,4 @@
-from typing import TypedDict
+from typing import Literal, Sequence, TypedDict
 
 import numpy as np
 import numpy.typing as npt
@@ -14,10 +14,14 @@ class ConvergenceHistory(TypedDict):
         A list of training losses over epochs.
     val : list[float] | None, optional
         A list of validation losses over epochs. Defaults to None.
+    oob : list[float] | None, optional
+        A list of out-of-bag losses over epochs, recorded by random forests fitted with
+        `oob=True`. Defaults to None.
     """
 
     train: list[float]
     val: list[float] | None = None
+    oob: list[float] | None = None
 
 
 def rmsle(y: npt.NDArray[np.float64], z: npt.NDArray[np.float64]) -> np.float64:
@@ -64,37 +68,202 @@ def rmse(y: npt.NDArray[np.float64], z: npt.NDArray[np.float64]) -> np.float64:
     return float(res)
 
 
-def whether_to_stop(convergence_history: ConvergenceHistory, patience: int) -> bool:
+def mae(y: npt.NDArray[np.float64], z: npt.NDArray[np.float64]) -> float:
     """
-    Determine whether to stop training based on the convergence history.
-
-    This function checks if the training or validation loss has not improved for a
-    specified number of epochs (patience). If the validation loss history is provided,
-    it is used for the decision; otherwise, the training loss history is used.
+    Calculate the Mean Absolute Error (MAE) between two arrays.
 
     Args
     ----
-    convergence_history : ConvergenceHistory
-        A dictionary containing the training loss history and optionally the validation
-        loss history.
-    patience : int
-        The number of epochs to wait after the last time the loss improved before
-        stopping the training.
+    y : npt.NDArray[np.float64]
+        The true values.
+    z : npt.NDArray[np.float64]
+        The predicted values.
 
     Returns
     -------
-    bool
-        True if training should be stopped, False otherwise.
+    float
+        The MAE value.
+    """
+    return float(np.mean(np.abs(y - z)))
+
+
+METRICS = {"rmse": rmse, "rmsle": rmsle, "mae": mae}
+
+
+class Scorer:
+    """
+    Metrics of predictions against a fixed target, computed without temporary arrays.
+
+    Training scores the running predictions after every tree, so the buffer for
+    the residuals (and the log of the target for RMSLE) is allocated once.
+
+    Parameters
+    ----------
+    y : npt.NDArray[np.float64]
+        The true values.
+    metrics : Sequence[str], optional
+        Names of metrics from `METRICS`. Defaults to ("rmse",).
+    """
+
+    def __init__(self, y: npt.NDArray[np.float64], metrics: Sequence[str] = ("rmse",)) -> None:
+        unknown = set(metrics) - METRICS.keys()
+        if unknown:
+            raise ValueError(f"Unknown metrics {sorted(unknown)}, expected some of {list(METRICS)}")
+        self.y = np.asarray(y, dtype=np.float64)
+        self.metrics = tuple(metrics)
+        self._buffer = np.empty_like(self.y)
+        self._log_y = np.log1p(self.y) if "rmsle" in self.metrics else None
+
+    def __call__(self, z: npt.NDArray[np.float64], scale: float = 1.0) -> dict[str, float]:
+        """
+        Score the predictions `scale * z`.
+
+        Args
+        ----
+        z : npt.NDArray[np.float64]
+            The predicted values, or their sums if `scale` averages them.
+        scale : float, optional
+            Factor applied to `z`. Defaults to 1.0.
+
+        Returns
+        -------
+        dict[str, float]
+            Value of every metric by name.
+        """
+        buffer = self._buffer
+        n = buffer.shape[0]
+        scores = {}
+        if "rmsle" in self.metrics:
+            np.multiply(z, scale, out=buffer)
+            np.log1p(buffer, out=buffer)
+            buffer -= self._log_y
+            scores["rmsle"] = float(np.sqrt(np.dot(buffer, buffer) / n))
+        if "rmse" in self.metrics or "mae" in self.metrics:
+            np.multiply(z, scale, out=buffer)
+            buffer -= self.y
+            if "rmse" in self.metrics:
+                scores["rmse"] = float(np.sqrt(np.dot(buffer, buffer) / n))
+            if "mae" in self.metrics:
+                scores["mae"] = float(np.abs(buffer, out=buffer).sum() / n)
+        return {name: scores[name] for name in self.metrics}
+
+
+class EarlyStopping:
+    """
+    Streaming early stopping on one or several metrics.
+
+    Every `update` is O(1) per metric: only the best score, its iteration and the
+    number of iterations since it are kept. As in LightGBM, training stops as soon
+    as any of the metrics has gone `patience` iterations without improving.
+
+    Parameters
+    ----------
+    patience : int
+        Number of iterations without improvement after which to stop.
+    min_delta : float, optional
+        Minimum change of a score that counts as an improvement. Defaults to 0.0.
+    mode : {"min", "max"}, optional
+        Whether lower or higher scores are better. Defaults to "min".
+    metrics : Sequence[str], optional
+        Names of the monitored metrics from `METRICS`. Defaults to ("rmse",).
+
+    Attributes
+    ----------
+    best_scores : dict[str, float]
+        Best score of every metric so far.
+    best_iterations : dict[str, int]
+        Number of iterations at which every best score was reached, 0 before any update.
 
     Raises
     ------
-    KeyError
-        If neither 'train' nor 'val' key is present in the convergence_history.
+    ValueError
+        If `patience` is not positive, `mode` is neither "min" nor "max" or a metric is not in `METRICS`.
     """
 
-    if convergence_history['val'] is not None:
-        return np.allclose(np.diff(convergence_history['val'])[-patience + 1:], 0)
-    elif convergence_history['train'] is not None:
-        return np.allclose(np.diff(convergence_history['train'])[-patience + 1:], 0)
-    else:
-        raise KeyError
+    def __init__(
+        self,
+        patience: int,
+        min_delta: float = 0.0,
+        mode: Literal["min", "max"] = "min",
+        metrics: Sequence[str] = ("rmse",),
+    ) -> None:
+        if patience < 1:
+            raise ValueError(f"patience must be positive, got {patience}")
+        if mode not in ("min", "max"):
+            raise ValueError(f"mode must be 'min' or 'max', got {mode!r}")
+        if not metrics:
+            raise ValueError("At least one metric must be monitored")
+        unknown = set(metrics) - METRICS.keys()
+        if unknown:
+            raise ValueError(f"Unknown metrics {sorted(unknown)}, expected some of {list(METRICS)}")
+        self.patience = patience
+        self.min_delta = abs(min_delta)
+        self.mode = mode
+        self.metrics = tuple(metrics)
+        self.iteration = 0
+        worst = np.inf if mode == "min" else -np.inf
+        self.best_scores = {name: worst for name in self.metrics}
+        self.best_iterations = {name: 0 for name in self.metrics}
+        self._waits = {name: 0 for name in self.metrics}
+
+    @property
+    def best_iteration(self) -> int:
+        """
+        Best iteration of the first metric.
+        """
+        return self.best_iterations[self.metrics[0]]
+
+    def update(self, scores: dict[str, float]) -> bool:
+        """
+        Record the scores of the next iteration.
+
+        Args
+        ----
+        scores : dict[str, float]
+            Score of every monitored metric, other entries are ignored.
+
+        Returns
+        -------
+        bool
+            True if training should stop.
+        """
+        self.iteration += 1
+        stop = False
+        for name in self.metrics:
+            score = scores[name]
+            if self.mode == "min":
+                improved = score < self.best_scores[name] - self.min_delta
+            else:
+                improved = score > self.best_scores[name] + self.min_delta
+            if improved:
+                self.best_scores[name] = score
+                self.best_iterations[name] = self.iteration
+                self._waits[name] = 0
+            else:
+                self._waits[name] += 1
+                stop = stop or self._waits[name] >= self.patience
+        return stop
+
+
+def best_iteration(convergence_history: ConvergenceHistory) -> int | None:
+    """
+    Find the ensemble size with the lowest held-out error.
+
+    The validation curve is used if it was recorded, the out-of-bag curve otherwise.
+    The training curve never stops improving, so it is not used.
+
+    Args
+    ----
+    convergence_history : ConvergenceHistory
+        History returned by `fit`.
+
+    Returns
+    -------
+    int | None
+        Number of trees at the minimum of the curve, or None if there is no held-out curve.
+    """
+    for key in ('val', 'oob'):
+        curve = convergence_history.get(key)
+        if curve:
+            return int(np.argmin(curve)) + 1
+    return None
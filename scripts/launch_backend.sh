@@ -1,3 +1,10 @@
 #!/bin/bash
 
-gunicorn ensembles.backend.app:app --workers 1 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
+# Workers share experiments, models and jobs through runs/ and jobs/, so any
+# number of them can serve the same state. With PRELOAD_MODELS=1 the app and
+# every trained model are loaded once in the master before the workers fork.
+preload=()
+if [ -n "${PRELOAD_MODELS:-}" ]; then
+    preload=(--preload)
+fi
+gunicorn ensembles.backend.app:app "${preload[@]}" --workers "${BACKEND_WORKERS:-$(nproc)}" --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
@@ -0,0 +1,174 @@
+import importlib
+import io
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from ensembles import GradientBoostingMSE
+from ensembles.backend import ExperimentConfig
+from ensembles.backend.history import HISTORY_FILE, write_history
+from ensembles.backend.index import ExperimentIndex
+
+
+backend = importlib.import_module("ensembles.backend.app")
+
+
+def register(runs_dir, name):
+    experiment_dir = runs_dir / name
+    experiment_dir.mkdir(parents=True)
+    config = ExperimentConfig(
+        name=name, ml_model="Gradient Boosting", n_estimators=10, max_depth=3, max_features="all", target_column="t")
+    (experiment_dir / "config.json").write_text(config.model_dump_json())
+    return experiment_dir
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch, regression_data):
+    X, y, X_val, y_val = regression_data
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(backend, "experiment_index", ExperimentIndex(tmp_path / "runs"))
+
+    model = GradientBoostingMSE(10, tree_params={"max_depth": 3})
+    history, _ = model.fit(X, y, X_val, y_val)
+    experiment_dir = register(tmp_path / "runs", "gb")
+    model.dump(experiment_dir / "model.ens")
+    write_history(experiment_dir / HISTORY_FILE, history)
+    register(tmp_path / "runs", "untrained")
+
+    with TestClient(backend.app) as client:
+        yield client, model, history
+
+
+def to_csv(X):
+    buffer = io.StringIO()
+    np.savetxt(buffer, X, delimiter=",", header=",".join(f"x{i}" for i in range(X.shape[1])), comments="")
+    return buffer.getvalue().encode()
+
+
+def predict(client, name, X, accept="application/json"):
+    return client.request(
+        "GET", "/predict/", params={"experiment_name": name}, files={"test_file": ("test.csv", to_csv(X))},
+        headers={"Accept": accept})
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_predict(api, regression_data, monkeypatch, streamed):
+    client, model, _ = api
+    X_val = regression_data[2]
+    if streamed:
+        monkeypatch.setattr(backend, "MICRO_BATCH_MAX_BYTES", 0)
+
+    response = predict(client, "gb", X_val)
+    assert response.status_code == 200
+    np.testing.assert_allclose(response.json()["predicted_values"], model.predict(X_val), rtol=1e-12)
+
+    response = predict(client, "gb", X_val, "application/octet-stream")
+    assert response.status_code == 200
+    assert int(response.headers["X-Row-Count"]) == len(X_val)
+    np.testing.assert_allclose(np.frombuffer(response.content), model.predict(X_val), rtol=1e-12)
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+@pytest.mark.parametrize("n_columns", [4, 6])
+def test_predict_rejects_other_features(api, regression_data, monkeypatch, streamed, n_columns):
+    client, _, _ = api
+    if streamed:
+        monkeypatch.setattr(backend, "MICRO_BATCH_MAX_BYTES", 0)
+    X = np.resize(regression_data[2], (200, n_columns))
+    for accept in ("application/json", "application/octet-stream"):
+        assert predict(client, "gb", X, accept).status_code == 400
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_predict_counts_rows_like_the_parser(api, regression_data, monkeypatch, streamed):
+    client, model, _ = api
+    if streamed:
+        monkeypatch.setattr(backend, "MICRO_BATCH_MAX_BYTES", 0)
+    X_val = regression_data[2]
+    # A quoted line break in the header and blank lines between rows.
+    csv = b'"x\n0"' + to_csv(X_val).replace(b"\n", b"\n\n")[2:]
+    response = client.request(
+        "GET", "/predict/", params={"experiment_name": "gb"}, files={"test_file": ("test.csv", csv)},
+        headers={"Accept": "application/octet-stream"})
+    assert response.status_code == 200
+    assert int(response.headers["X-Row-Count"]) == len(X_val)
+    np.testing.assert_allclose(np.frombuffer(response.content), model.predict(X_val), rtol=1e-12)
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+@pytest.mark.parametrize("csv", [b"x0,x1,x2,x3,x4\n1,2,a,4,5\n", b"x0,x1,x2,x3,x4\n1,2,3,4,5\n1,2,3,4,5,6,7\n", b""])
+def test_predict_rejects_bad_csv(api, monkeypatch, streamed, csv):
+    client, _, _ = api
+    if streamed:
+        monkeypatch.setattr(backend, "MICRO_BATCH_MAX_BYTES", 0)
+    response = client.request(
+        "GET", "/predict/", params={"experiment_name": "gb"}, files={"test_file": ("test.csv", csv)})
+    assert response.status_code == 400
+
+
+def test_unknown_and_untrained_experiments(api, regression_data):
+    client, _, _ = api
+    X_val = regression_data[2]
+    assert predict(client, "missing", X_val).status_code == 404
+    assert predict(client, "untrained", X_val).status_code == 409
+    assert client.put("/train_model/", params={"experiment_name": "missing"}).status_code == 404
+    assert client.get("/get_convergence_history/", params={"experiment_name": "untrained"}).status_code == 404
+
+
+def test_compact_model(api, regression_data):
+    client, model, history = api
+    for name in ("missing", "../runs/gb", ".."):
+        assert client.post("/compact_model/", params={"experiment_name": name}).status_code == 404
+    assert client.post("/compact_model/", params={"experiment_name": "untrained"}).status_code == 409
+
+    response = client.post("/compact_model/", params={"experiment_name": "gb", "quantize": False})
+    assert response.status_code == 200
+    best = int(np.argmin(history["val"])) + 1
+    assert response.json()["fitted_estimators"] == best
+    X_val = regression_data[2]
+    np.testing.assert_allclose(
+        predict(client, "gb", X_val).json()["predicted_values"], model.predict(X_val, n_trees=best), rtol=1e-12)
+
+
+def test_convergence_history(api):
+    client, _, history = api
+    response = client.get("/get_convergence_history/", params={"experiment_name": "gb"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["train"] == history["train"] and body["val"] == history["val"]
+    assert body["iterations"] == list(range(1, 11)) and body["n_iterations"] == 10
+
+    body = client.get(
+        "/get_convergence_history/", params={"experiment_name": "gb", "start": 3, "stop": 6}).json()
+    assert body["iterations"] == [4, 5, 6]
+    assert body["val"] == history["val"][3:6]
+
+    body = client.get("/get_convergence_history/", params={"experiment_name": "gb", "max_points": 9}).json()
+    assert len(body["iterations"]) <= 9
+    assert int(np.argmin(history["val"])) + 1 in body["iterations"]
+
+    etag = response.headers["ETag"]
+    response = client.get(
+        "/get_convergence_history/", params={"experiment_name": "gb"}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize("csv", [b"x0,x1,t\n1,2,3\n4,5,6,7\n", b"x0,x1,t\n1,a,3\n", b"x0,x1,y\n1,2,3\n", b""])
+def test_register_rejects_bad_csv(api, tmp_path, csv):
+    client, _, _ = api
+    config = ExperimentConfig(
+        name="bad", ml_model="Random Forest", n_estimators=2, max_depth=3, max_features="all", target_column="t")
+    response = client.post(
+        "/register_experiment/", data={"experiment_config": config.model_dump_json()},
+        files={"train_file": ("train.csv", csv)})
+    assert response.status_code == 400
+    assert not (tmp_path / "runs" / "bad").exists()
+
+
+def test_experiment_records_are_revalidated(api):
+    client, _, _ = api
+    response = client.get("/experiments/gb")
+    assert response.json()["status"] == "trained"
+    assert client.get("/experiments/gb", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+    assert client.get("/needs_training/", params={"experiment_name": "untrained"}).json() == {"response": True}
@@ -0,0 +1,61 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from ensembles.backend.caching import conditional_response
+from ensembles.frontend.client import Client
+
+
+@pytest.fixture
+def resource():
+    app = FastAPI()
+    state = {"body": b'{"experiment_names":["a"]}', "reads": 0}
+
+    @app.get("/existing_experiments/")
+    async def existing_experiments(request: Request):
+        def body() -> bytes:
+            state["reads"] += 1
+            return state["body"]
+
+        return conditional_response(request, body, etag=f'"{len(state["body"])}"', last_modified=1e9)
+
+    return TestClient(app), state
+
+
+def test_not_modified(resource):
+    client, state = resource
+    response = client.get("/existing_experiments/")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-cache"
+    etag = response.headers["ETag"]
+
+    for headers in ({"If-None-Match": etag}, {"If-None-Match": f'"x", W/{etag}'}, {"If-None-Match": "*"},
+                    {"If-Modified-Since": response.headers["Last-Modified"]}):
+        response = client.get("/existing_experiments/", headers=headers)
+        assert response.status_code == 304
+        assert response.content == b""
+    # The body is not even made for a 304.
+    assert state["reads"] == 1
+
+    assert client.get("/existing_experiments/", headers={"If-None-Match": '"x"'}).status_code == 200
+    assert client.get(
+        "/existing_experiments/", headers={"If-Modified-Since": "Sat, 01 Jan 2000 00:00:00 GMT"}).status_code == 200
+
+
+def test_client_revalidates_its_cache(resource):
+    test_client, state = resource
+    statuses = []
+
+    class Session:
+        def get(self, url, **kwargs):
+            response = test_client.get(url, **kwargs)
+            statuses.append(response.status_code)
+            return response
+
+    client = Client("http://testserver")
+    client.session = Session()
+    assert client.get_names() == ["a"]
+    assert client.get_names() == ["a"]
+    state["body"] = b'{"experiment_names":["a","bb"]}'
+    assert client.get_names() == ["a", "bb"]
+    assert statuses == [200, 304, 200]
@@ -0,0 +1,19 @@
+import json
+
+import numpy as np
+
+from ensembles.backend.formats import JSON, NPY, OCTET_STREAM, encode_predictions
+
+
+def test_json_skips_empty_chunks_and_nulls_non_finite_values():
+    chunks = [np.empty(0), np.array([1.5, np.nan]), np.empty(0), np.array([np.inf, -2.0])]
+    body = b"".join(encode_predictions(chunks, JSON))
+    assert json.loads(body) == {"predicted_values": [1.5, None, None, -2.0]}
+    assert json.loads(b"".join(encode_predictions([np.empty(0)], JSON))) == {"predicted_values": []}
+
+
+def test_binary_formats_keep_non_finite_values():
+    chunks = [np.array([1.5, np.nan]), np.array([np.inf])]
+    raw = np.frombuffer(b"".join(encode_predictions(chunks, OCTET_STREAM)))
+    np.testing.assert_array_equal(raw, [1.5, np.nan, np.inf])
+    assert b"".join(encode_predictions(chunks, NPY)).startswith(b"\x93NUMPY")
@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import pytest
+
+from ensembles.backend.history import (
+    MIN_POINTS,
+    append_history,
+    downsample,
+    history_file,
+    read_curves,
+    read_history,
+    write_history,
+)
+
+
+@pytest.fixture
+def history():
+    rng = np.random.default_rng(0)
+    train = np.exp(-np.arange(300) / 60)
+    return {"train": train.tolist(), "val": (train + 0.1 + rng.normal(scale=0.01, size=300)).tolist(), "oob": None}
+
+
+def test_write_and_read_ranges(tmp_path, history):
+    path = tmp_path / "convergence_history.bin"
+    write_history(path, history)
+    assert history_file(tmp_path) == path
+    assert read_history(path) == {**history, "oob": None}
+
+    curves, n_iterations = read_curves(path, 10, 20)
+    assert n_iterations == 300
+    assert curves["val"].tolist() == history["val"][10:20]
+    assert read_curves(path, 290, 1000)[0]["train"].tolist() == history["train"][290:]
+
+
+def test_append(tmp_path, history):
+    path = tmp_path / "convergence_history.bin"
+    write_history(path, {key: values[:100] if values else values for key, values in history.items()})
+    append_history(path, {key: values[100:] if values else values for key, values in history.items()})
+    assert read_history(path) == history
+
+    with pytest.raises(ValueError):
+        append_history(path, {"train": [1.0], "val": [], "oob": [1.0]})
+
+
+def test_oob_history(tmp_path):
+    path = tmp_path / "convergence_history.bin"
+    write_history(path, {"train": [2.0, 1.0], "val": [], "oob": [3.0, 2.5]})
+    assert read_history(path) == {"train": [2.0, 1.0], "val": [], "oob": [3.0, 2.5]}
+
+
+def test_legacy_json(tmp_path, history):
+    path = tmp_path / "convergence_history.json"
+    path.write_text(json.dumps(history, indent=4))
+    assert history_file(tmp_path) == path
+    curves, n_iterations = read_curves(path, 5, 8)
+    assert n_iterations == 300
+    assert curves["train"].tolist() == history["train"][5:8]
+
+
+@pytest.mark.parametrize(
+    "length,max_points,min_points", [(30, 10, 8), (300, MIN_POINTS, 5), (300, 50, 40), (20000, 1000, 900)])
+def test_downsample_fills_budget_and_keeps_best(length, max_points, min_points):
+    rng = np.random.default_rng(length)
+    train = np.exp(-np.arange(length) / (length / 5))
+    val = train + 0.1 + rng.normal(scale=0.01, size=length)
+    curves = {"train": train, "val": val}
+
+    points = downsample(curves, max_points)
+    assert len(points) <= max_points
+    assert len(points) >= min_points
+    assert np.all(np.diff(points) > 0)
+    for index in (0, length - 1, np.argmin(val), np.argmax(val), np.argmin(train)):
+        assert index in points
+
+
+def test_downsample_keeps_short_curves():
+    curves = {"train": np.arange(5.0)}
+    assert downsample(curves, MIN_POINTS).tolist() == [0, 1, 2, 3, 4]
@@ -0,0 +1,29 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from ensembles.backend.instrumentation import REQUEST_DURATION, InstrumentationMiddleware
+
+
+def test_requests_are_labelled_by_route(tmp_path):
+    app = FastAPI()
+    app.add_middleware(InstrumentationMiddleware, profiles_dir=tmp_path)
+
+    @app.get("/labelled/{item_id}")
+    async def item(item_id: str) -> dict[str, str]:
+        return {"item_id": item_id}
+
+    client = TestClient(app)
+    for path in ("/labelled/1", "/labelled/2", "/unknown-1", "/unknown-2"):
+        client.get(path)
+    routes = {key[1] for key in REQUEST_DURATION._series}
+    assert {"/labelled/{item_id}", "<unmatched>"} <= routes
+    assert not routes & {"/labelled/1", "/labelled/2", "/unknown-1", "/unknown-2"}
+
+    response = client.get("/labelled/../../etc", headers={"X-Profile": "1"})
+    name = response.headers["X-Profile-File"]
+    assert "-unmatched-" in name
+    assert (tmp_path / name).exists()
+    response = client.get("/labelled/3", headers={"X-Profile": "1"})
+    assert "-labelled_item_id-" in response.headers["X-Profile-File"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        [name, response.headers["X-Profile-File"]])
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ensembles import GradientBoostingMSE
+from ensembles.backend import ExperimentConfig
+from ensembles.backend.history import history_file, read_history
+from ensembles.backend.training import compact_experiment, train_experiment
+from ensembles.serialization import _read_headers
+
+
+@pytest.fixture
+def experiment(tmp_path, regression_data):
+    X, y, _, _ = regression_data
+    experiment_dir = tmp_path / "runs" / "gb"
+    experiment_dir.mkdir(parents=True)
+    data = pd.DataFrame(X, columns=[f"x{i}" for i in range(X.shape[1])]).assign(t=y)
+    data.to_csv(experiment_dir / "train_file.csv", index=False)
+
+    config = ExperimentConfig(
+        name="gb", ml_model="Gradient Boosting", n_estimators=5, max_depth=3, max_features="all", target_column="t")
+    (experiment_dir / "config.json").write_text(config.model_dump_json())
+    return experiment_dir, config
+
+
+def test_warm_start_rewrites_a_single_segment(experiment):
+    experiment_dir, config = experiment
+    assert train_experiment(experiment_dir)
+    (experiment_dir / "config.json").write_text(config.model_copy(update={"n_estimators": 9}).model_dump_json())
+    assert train_experiment(experiment_dir, warm_start=True)
+
+    model_path = experiment_dir / "model.ens"
+    assert len(_read_headers(model_path)) == 1
+    model = GradientBoostingMSE.load(model_path, mmap=True)
+    assert model.fitted_estimators == 9
+    assert isinstance(model.compile().value.base, np.memmap)
+    assert len(read_history(history_file(experiment_dir))["val"]) == 9
+
+
+def test_compaction_needs_a_history(experiment):
+    experiment_dir, _ = experiment
+    assert train_experiment(experiment_dir)
+    history_file(experiment_dir).unlink()
+    with pytest.raises(ValueError):
+        compact_experiment(experiment_dir)
@@ -0,0 +1,10 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="session")
+def regression_data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(600, 5))
+    y = 2 * X[:, 0] - X[:, 1] ** 2 + rng.normal(scale=0.3, size=600)
+    return X[:400], y[:400], X[400:], y[400:]
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from ensembles import GradientBoostingMSE
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{}, {"histogram": True}, {"subsample": 0.7, "colsample_bytree": 0.6}, {"tree_params": {"max_features": 2}}],
+    ids=["exact", "histogram", "stochastic", "max_features"],
+)
+def test_warm_start_matches_full_fit(regression_data, params):
+    X, y, X_val, y_val = regression_data
+    tree_params = {"max_depth": 3, **params.pop("tree_params", {})}
+    full = GradientBoostingMSE(10, tree_params=dict(tree_params), **params)
+    full_history, _ = full.fit(X, y, X_val, y_val)
+
+    model = GradientBoostingMSE(4, tree_params=dict(tree_params), **params)
+    history, _ = model.fit(X, y, X_val, y_val)
+    model.n_estimators = 10
+    rest, _ = model.fit(X, y, X_val, y_val, warm_start=True)
+    np.testing.assert_allclose(history["val"] + rest["val"], full_history["val"], rtol=1e-12)
+    np.testing.assert_allclose(model.predict(X_val), full.predict(X_val), rtol=1e-12)
+
+
+def test_random_state_changes_the_model(regression_data):
+    X, y, X_val, _ = regression_data
+    predictions = []
+    for random_state in (0, 0, 1):
+        model = GradientBoostingMSE(5, tree_params={"max_depth": 3}, subsample=0.7, random_state=random_state)
+        model.fit(X, y)
+        predictions.append(model.predict(X_val))
+    np.testing.assert_array_equal(predictions[0], predictions[1])
+    assert not np.array_equal(predictions[0], predictions[2])
+
+
+def test_histogram_rejects_unsupported_tree_params():
+    with pytest.raises(ValueError, match="min_samples_split"):
+        GradientBoostingMSE(5, tree_params={"max_depth": 3, "min_samples_split": 4}, histogram=True)
+    GradientBoostingMSE(5, tree_params={"max_depth": 3, "min_samples_split": 4})
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from ensembles import GradientBoostingMSE, RandomForestMSE
+
+
+MODELS = [
+    lambda: RandomForestMSE(12, tree_params={"max_depth": 6}),
+    lambda: GradientBoostingMSE(12, tree_params={"max_depth": 3}),
+    lambda: GradientBoostingMSE(12, tree_params={"max_depth": 3}, subsample=0.7, colsample_bytree=0.6),
+    lambda: GradientBoostingMSE(12, tree_params={"max_depth": 3}, histogram=True),
+]
+
+
+@pytest.fixture(params=MODELS, ids=["forest", "boosting", "stochastic", "histogram"])
+def fitted(request, regression_data):
+    X, y, _, _ = regression_data
+    model = request.param()
+    model.fit(X, y)
+    return model
+
+
+def test_compiled_predictions_match_trees_exactly(fitted, regression_data):
+    _, _, X_val, _ = regression_data
+    # Freshly fitted models predict tree by tree.
+    assert fitted._compiled is None
+    np.testing.assert_array_equal(fitted.compile().predict(X_val), fitted.predict(X_val))
+
+
+def test_n_trees_and_staged_predict(fitted, regression_data):
+    _, _, X_val, _ = regression_data
+    staged = fitted.staged_predict(X_val)
+    assert staged.shape == (len(X_val), fitted.fitted_estimators)
+    for n_trees in (1, 5, fitted.fitted_estimators):
+        np.testing.assert_allclose(staged[:, n_trees - 1], fitted.predict(X_val, n_trees=n_trees), rtol=1e-12)
+    np.testing.assert_array_equal(fitted.predict(X_val, n_trees=fitted.fitted_estimators), fitted.predict(X_val))
+
+    with pytest.raises(ValueError):
+        fitted.predict(X_val, n_trees=fitted.fitted_estimators + 1)
+
+
+def test_unquantized_compaction_keeps_predictions(fitted, regression_data):
+    _, _, X_val, _ = regression_data
+    expected = fitted.predict(X_val)
+    nbytes = fitted.compile().nbytes
+    fitted.compact(quantize=False)
+    np.testing.assert_array_equal(fitted.predict(X_val), expected)
+    assert fitted.compile().nbytes <= nbytes
+
+
+def test_compaction_cuts_at_best_iteration(regression_data):
+    X, y, X_val, y_val = regression_data
+    model = GradientBoostingMSE(30, tree_params={"max_depth": 3})
+    history, _ = model.fit(X, y, X_val, y_val)
+    best = int(np.argmin(history["val"])) + 1
+    expected = model.predict(X_val, n_trees=best)
+    model.compact(history, quantize=False)
+    assert model.fitted_estimators == best
+    np.testing.assert_array_equal(model.predict(X_val), expected)
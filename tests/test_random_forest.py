@@ -0,0 +1,46 @@
+import numpy as np
+
+from ensembles import RandomForestMSE
+from ensembles.compiled import as_tree_input
+
+
+def test_n_jobs_does_not_change_the_model(regression_data):
+    X, y, X_val, y_val = regression_data
+    results = []
+    for n_jobs in (None, 2, 4):
+        model = RandomForestMSE(10, tree_params={"max_depth": 5, "max_features": 2}, n_jobs=n_jobs)
+        history, _ = model.fit(X, y, X_val, y_val)
+        results.append((history, model.predict(X_val)))
+    for history, predictions in results[1:]:
+        assert history == results[0][0]
+        np.testing.assert_array_equal(predictions, results[0][1])
+
+
+def test_oob_curve_matches_in_bag_masks(regression_data):
+    X, y, _, _ = regression_data
+    model = RandomForestMSE(15, tree_params={"max_depth": 5})
+    history, _ = model.fit(X, y, oob=True)
+    assert len(history["oob"]) == 15
+
+    X_tree = as_tree_input(X)
+    oob_sum, oob_count = np.zeros(len(y)), np.zeros(len(y))
+    for tree, in_bag in zip(model.forest, model.in_bag_):
+        out_of_bag = ~np.unpackbits(in_bag, count=len(y)).astype(bool)
+        oob_sum[out_of_bag] += tree.predict(X_tree)[out_of_bag]
+        oob_count += out_of_bag
+    seen = oob_count > 0
+    expected = np.sqrt(np.mean((y[seen] - oob_sum[seen] / oob_count[seen]) ** 2))
+    np.testing.assert_allclose(history["oob"][-1], expected, rtol=1e-12)
+
+
+def test_warm_start_matches_full_fit(regression_data):
+    X, y, X_val, y_val = regression_data
+    full = RandomForestMSE(10, tree_params={"max_depth": 5})
+    full_history, _ = full.fit(X, y, X_val, y_val)
+
+    model = RandomForestMSE(4, tree_params={"max_depth": 5})
+    history, _ = model.fit(X, y, X_val, y_val)
+    model.n_estimators = 10
+    rest, _ = model.fit(X, y, X_val, y_val, warm_start=True)
+    np.testing.assert_allclose(history["val"] + rest["val"], full_history["val"], rtol=1e-12)
+    np.testing.assert_allclose(model.predict(X_val), full.predict(X_val), rtol=1e-12)
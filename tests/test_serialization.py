@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pytest
+
+from ensembles import GradientBoostingMSE, RandomForestMSE
+from ensembles.serialization import _PREAMBLE, FORMAT_VERSION, MAGIC
+
+
+@pytest.mark.parametrize("model_type", [RandomForestMSE, GradientBoostingMSE])
+@pytest.mark.parametrize("mmap", [False, True])
+def test_round_trip(tmp_path, regression_data, model_type, mmap):
+    X, y, X_val, _ = regression_data
+    model = model_type(8, tree_params={"max_depth": 4})
+    model.fit(X, y)
+    path = tmp_path / "model.ens"
+    model.dump(path)
+
+    loaded = model_type.load(path, mmap=mmap)
+    assert loaded.fitted_estimators == model.fitted_estimators
+    np.testing.assert_array_equal(loaded.predict(X_val), model.predict(X_val))
+    if mmap:
+        assert isinstance(loaded.compile().value.base, np.memmap)
+
+
+def test_loading_another_model_fails(tmp_path, regression_data):
+    X, y, _, _ = regression_data
+    model = RandomForestMSE(2)
+    model.fit(X, y)
+    model.dump(tmp_path / "model.ens")
+    with pytest.raises(ValueError):
+        GradientBoostingMSE.load(tmp_path / "model.ens")
+
+
+@pytest.mark.parametrize("model_type", [RandomForestMSE, GradientBoostingMSE])
+def test_append_round_trip(tmp_path, regression_data, model_type):
+    X, y, X_val, _ = regression_data
+    path = tmp_path / "model.ens"
+    model = model_type(5, tree_params={"max_depth": 4})
+    model.fit(X, y)
+    model.dump(path)
+    size = path.stat().st_size
+
+    model = model_type.load(path)
+    model.n_estimators = 9
+    model.fit(X, y, warm_start=True)
+    model.dump(path, append=True)
+    assert path.stat().st_size > size
+
+    loaded = model_type.load(path, mmap=True)
+    assert loaded.fitted_estimators == loaded.compile().n_trees == 9
+    np.testing.assert_array_equal(loaded.predict(X_val), model.predict(X_val))
+
+
+def test_partial_segment_is_ignored(tmp_path, regression_data):
+    X, y, X_val, _ = regression_data
+    path = tmp_path / "model.ens"
+    model = RandomForestMSE(5, tree_params={"max_depth": 4})
+    model.fit(X, y)
+    model.dump(path)
+    expected = model.predict(X_val)
+    size = path.stat().st_size
+
+    model.n_estimators = 9
+    model.fit(X, y, warm_start=True)
+    model.dump(path, append=True)
+    # A reader racing the writer sees the new segment cut short.
+    for cut in (size + 16, (size + path.stat().st_size) // 2, path.stat().st_size - 1):
+        truncated = tmp_path / f"truncated-{cut}.ens"
+        with path.open("rb") as source, truncated.open("wb") as target:
+            target.write(source.read(cut))
+        loaded = RandomForestMSE.load(truncated)
+        assert loaded.compile().n_trees == 5
+        np.testing.assert_array_equal(loaded.predict(X_val), expected)
+        os.remove(truncated)
+
+
+def test_append_overwrites_an_interrupted_append(tmp_path, regression_data):
+    X, y, X_val, _ = regression_data
+    path = tmp_path / "model.ens"
+    model = RandomForestMSE(5, tree_params={"max_depth": 4})
+    model.fit(X, y)
+    model.dump(path)
+    size = path.stat().st_size
+    # An append that died halfway through its segment.
+    with path.open("ab") as file:
+        file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 4096) + b'{"model": "RandomForestMSE", "par')
+
+    model.n_estimators = 9
+    model.fit(X, y, warm_start=True)
+    model.dump(path, append=True)
+    loaded = RandomForestMSE.load(path)
+    assert loaded.compile().n_trees == 9
+    np.testing.assert_array_equal(loaded.predict(X_val), model.predict(X_val))
+    assert path.stat().st_size > size
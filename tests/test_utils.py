@@ -0,0 +1,42 @@
+import pytest
+
+from ensembles.utils import EarlyStopping, best_iteration
+
+
+def test_early_stopping_min_mode():
+    stopping = EarlyStopping(patience=2)
+    assert [stopping.update({"rmse": score}) for score in (3.0, 2.0, 2.5, 2.0)] == [False, False, False, True]
+    assert stopping.best_iteration == 2
+    assert stopping.best_scores == {"rmse": 2.0}
+
+
+def test_early_stopping_max_mode_and_min_delta():
+    stopping = EarlyStopping(patience=2, mode="max", min_delta=0.1)
+    assert not stopping.update({"rmse": 0.5})
+    # Gains below `min_delta` do not count.
+    assert not stopping.update({"rmse": 0.55})
+    assert stopping.update({"rmse": 0.58})
+    assert stopping.best_iteration == 1
+
+
+def test_early_stopping_stops_on_any_metric():
+    stopping = EarlyStopping(patience=1, metrics=("rmse", "mae"))
+    assert not stopping.update({"rmse": 1.0, "mae": 1.0})
+    assert stopping.update({"rmse": 0.5, "mae": 1.0})
+    assert stopping.best_iterations == {"rmse": 2, "mae": 1}
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"patience": 0}, {"patience": 1, "mode": "median"}, {"patience": 1, "metrics": ("msee",)},
+     {"patience": 1, "metrics": ()}],
+)
+def test_early_stopping_rejects_bad_arguments(kwargs):
+    with pytest.raises(ValueError):
+        EarlyStopping(**kwargs)
+
+
+def test_best_iteration():
+    assert best_iteration({"train": [3.0, 2.0, 1.0], "val": [2.0, 1.0, 1.5]}) == 2
+    assert best_iteration({"train": [3.0, 2.0], "val": [], "oob": [1.0, 2.0]}) == 1
+    assert best_iteration({"train": [3.0, 2.0], "val": []}) is None
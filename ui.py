@@ -12,6 +12,8 @@ BACKEND_HOST = os.environ["BACKEND_HOST"]
 BASE_URL = f'http://{BACKEND_HOST}:8000'
 MODEL_OPTIONS = ["Random Forest", "Gradient Boosting"]
 MAX_FEATURES_OPTIONS = ["all", "sqrt", "log2", "custom integer", "custom float"]
+VALIDATION_OPTIONS = ["holdout", "oob"]
+MAX_PLOT_POINTS = 2000
 
 
 @st.cache_data
@@ -19,13 +21,26 @@ def load_data(file):
     return pd.read_csv(file)
 
 
-client = Client(BASE_URL)
+@st.cache_resource
+def get_client():
+    # One client per session server, so its cache of responses outlives reruns.
+    return Client(BASE_URL)
+
+
+@st.cache_data(max_entries=32)
+def load_convergence_history(experiment_name, version, max_points=MAX_PLOT_POINTS):
+    # A trained history only changes with the experiment's version.
+    return client.get_convergence_history(experiment_name, max_points=max_points)
+
+
+client = get_client()
 
 st.title("Model Training and Prediction")
 
 # Sidebar for experiment selection
+experiment_names = client.get_names()
 experiment_option = st.sidebar.selectbox(
-    "Experiment", options=["start new"] + client.get_names()
+    "Experiment", options=["start new"] + experiment_names
 )
 
 if experiment_option == "start new":
@@ -33,7 +48,7 @@ if experiment_option == "start new":
         experiment_name = st.text_input(
             "Give a name to your experiment", value="happy_fox"
         )
-        if experiment_name in client.get_names():
+        if experiment_name in experiment_names:
             st.error(
                 f"Experiment with name {experiment_name} already exists. Choose a different name."
             )
@@ -50,6 +65,20 @@ if experiment_option == "start new":
             max_features = st.number_input(
                 "Enter custom value", min_value=1, format="%d"
             )
+        validation = "holdout"
+        if model_choice == "Random Forest":
+            validation = st.selectbox(
+                "Validation",
+                options=VALIDATION_OPTIONS,
+                help="oob trains on all the data and validates every tree on the objects left out of its bootstrap sample",
+            )
+
+        patience = st.number_input(
+            "Early stopping patience",
+            min_value=0,
+            value=0,
+            help="stop after this many trees without a lower validation error, 0 disables early stopping",
+        )
 
         st.header("Upload Training Data")
         train_file = st.file_uploader("Upload your training CSV file", type=["csv"])
@@ -71,6 +100,8 @@ if experiment_option == "start new":
                     max_depth=max_depth,
                     max_features=max_features,
                     target_column=target_column,
+                    validation=validation,
+                    patience=patience or None,
                 )
                 client.register_experiment(experiment_config, train_file)
                 st.sidebar.success(
@@ -78,7 +109,7 @@ if experiment_option == "start new":
                 )
             else:
                 st.warning("You didn't load training data yet")
-                if experiment_name in client.get_names():
+                if experiment_name in experiment_names:
                     st.warning("You need to change the experiment name above")
 
     st.stop()
@@ -104,26 +135,53 @@ with st.sidebar:
         "Max depth", min_value=1, value=experiment_config.max_depth, disabled=True
     )
     st.text_input("Max features", value=experiment_config.max_features, disabled=True)
+    st.text_input("Validation", value=experiment_config.validation, disabled=True)
+    st.number_input(
+        "Early stopping patience", min_value=0, value=experiment_config.patience or 0, disabled=True
+    )
 
 # Training
-response = client.session.get(
-    f"{BASE_URL}/needs_training", params={"experiment_name": experiment_config.name}
-)
-response.raise_for_status()
+def train(experiment_name, warm_start=False, n_estimators=None):
+    progress_bar = st.progress(0.0, text="Training model...")
+
+    def show_progress(job):
+        progress_bar.progress(
+            job.fitted_estimators / job.n_estimators,
+            text=f"Training model... {job.fitted_estimators}/{job.n_estimators} trees",
+        )
 
-if response.json()["response"]:
+    job = client.train_model(
+        experiment_name, on_progress=show_progress, warm_start=warm_start, n_estimators=n_estimators
+    )
+    progress_bar.empty()
+    if job.status != "completed":
+        st.error(f"Training {job.status}: {job.error or 'no model was saved'}")
+        st.stop()
+
+
+if client.is_training_needed(experiment_config.name):
     st.info(
         "The model wasn't trained for the selected experiment yet. Train it to see learning curves and infer on your data."
     )
     if st.button("Train Model"):
-        with st.spinner("Training model..."):
-            client.train_model(experiment_config.name)
+        train(experiment_config.name)
     else:
         st.stop()
+else:
+    with st.sidebar:
+        more_estimators = st.number_input("Add estimators", min_value=1, value=experiment_config.n_estimators)
+        if st.button("Continue training"):
+            train(
+                experiment_config.name,
+                warm_start=True,
+                n_estimators=experiment_config.n_estimators + more_estimators,
+            )
+            st.rerun()
 
 # visualize
 st.subheader("Learning Curves")
-convergence_history = client.get_convergence_history(experiment_config.name)
+experiment = client.get_experiment(experiment_config.name)
+convergence_history = load_convergence_history(experiment.name, experiment.updated_at)
 st.plotly_chart(plot_learning_curves(convergence_history))
 
 # Predict on test data